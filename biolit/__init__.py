@@ -6,6 +6,7 @@ ROOTDIR = Path(__file__).parent / ".."
 DATADIR = ROOTDIR / "data"
 RAWDIR = DATADIR / "raw"
 EXPORTDIR = DATADIR / "exports"
+BRONZEDIR = DATADIR / "bronze"
 
 DATA_GOUV_CONTOUR_COMMUNES_URL = (
     "https://www.data.gouv.fr/api/1/datasets/r/00c0c560-3ad1-4a62-9a29-c34c98c3701e"
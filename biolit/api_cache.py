@@ -0,0 +1,174 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+import requests
+import structlog
+from dotenv import load_dotenv
+
+from biolit import RAWDIR
+from biolit.run_registry import count_bytes
+
+LOGGER = structlog.get_logger()
+load_dotenv()
+
+API_CACHE_DIR = RAWDIR / "api_cache"
+# Rejoue les snapshots en cache sans aucun appel réseau
+API_REPLAY = os.getenv("BIOLIT_API_REPLAY", "false").lower() == "true"
+# Paramètres qui changent à chaque run (watermark de l'ingestion incrémentale)
+API_VOLATILE_PARAMS = set(
+    os.getenv("BIOLIT_API_VOLATILE_PARAMS", "modified_after").split(",")
+)
+# Snapshots gardés par fenêtre volatile (mêmes paramètres hors watermark)
+API_CACHE_KEEP_WINDOWS = int(os.getenv("BIOLIT_API_CACHE_KEEP_WINDOWS", "1"))
+
+_CHUNK_BYTES = 1 << 16
+# En-têtes de réponse conservés avec le snapshot
+_KEPT_HEADERS = ["ETag", "Last-Modified", "X-WP-Total", "X-WP-TotalPages"]
+
+
+def _hash(params: dict) -> str:
+    canonical = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def _family_key(params: Optional[dict]) -> Optional[str]:
+    """Préfixe commun aux fenêtres qui ne diffèrent que par un paramètre volatil."""
+    if not params or not API_VOLATILE_PARAMS & params.keys():
+        return None
+    return _hash({k: v for k, v in params.items() if k not in API_VOLATILE_PARAMS})
+
+
+def _window_key(params: Optional[dict]) -> str:
+    """Clé du snapshot : fenêtre de requête (paramètres), pas l'URL secrète."""
+    if not params:
+        return "full"
+    family = _family_key(params)
+    return f"{family}-{_hash(params)}" if family else _hash(params)
+
+
+def _paths(params: Optional[dict], cache_dir: Path) -> tuple[Path, Path]:
+    key = _window_key(params)
+    return cache_dir / f"{key}.json.gz", cache_dir / f"{key}.meta.json"
+
+
+def _evict_old_windows(params: Optional[dict], cache_dir: Path):
+    """
+    Une fenêtre incrémentale n'est jamais redemandée à l'identique (le
+    watermark avance) : seuls les API_CACHE_KEEP_WINDOWS derniers
+    snapshots de la même famille sont gardés sur disque.
+    """
+    family = _family_key(params)
+    if family is None:
+        return
+
+    _, current = _paths(params, cache_dir)
+    older = sorted(
+        (p for p in cache_dir.glob(f"{family}-*.meta.json") if p != current),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for meta_path in older[max(API_CACHE_KEEP_WINDOWS - 1, 0):]:
+        key = meta_path.name.removesuffix(".meta.json")
+        (cache_dir / f"{key}.json.gz").unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+
+
+def _read_snapshot(body_path: Path) -> Iterator[bytes]:
+    with gzip.open(body_path, "rb") as f:
+        while chunk := f.read(_CHUNK_BYTES):
+            yield chunk
+
+
+def _record_snapshot(
+    response: requests.Response,
+    params: Optional[dict],
+    body_path: Path,
+    meta_path: Path,
+) -> Iterator[bytes]:
+    """
+    Transmet le corps de la réponse chunk par chunk tout en l'écrivant
+    compressé sur disque. Le snapshot n'est publié qu'une fois complet.
+    """
+    tmp_path = body_path.with_suffix(".tmp")
+    with response, gzip.open(tmp_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=_CHUNK_BYTES):
+            f.write(chunk)
+            count_bytes(downloaded=len(chunk))
+            yield chunk
+
+    tmp_path.replace(body_path)
+    meta = {
+        "params": params,
+        "fetched_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "headers": {
+            h: response.headers[h] for h in _KEPT_HEADERS if h in response.headers
+        },
+    }
+    meta_path.write_text(json.dumps(meta, indent=2, default=str))
+    LOGGER.info("Snapshot API enregistré", path=str(body_path))
+    _evict_old_windows(params, body_path.parent)
+
+
+def open_api_request(
+    url: Optional[str],
+    params: Optional[dict] = None,
+    replay: Optional[bool] = None,
+    cache_dir: Optional[Path] = None,
+) -> tuple[Iterator[bytes], dict]:
+    """
+    Requête GET sur l'API Biolit avec cache disque des réponses brutes.
+
+    - replay : lit uniquement le snapshot local (aucun appel réseau)
+    - sinon  : revalide le snapshot avec ETag / If-Modified-Since,
+      et le réutilise si l'API répond 304 Not Modified
+
+    Retourne:
+        (itérateur sur les octets du corps, en-têtes de la réponse)
+    """
+    replay = API_REPLAY if replay is None else replay
+    cache_dir = cache_dir or API_CACHE_DIR
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    body_path, meta_path = _paths(params, cache_dir)
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else None
+    cached = meta is not None and body_path.exists()
+
+    if replay:
+        if not cached:
+            raise FileNotFoundError(
+                f"Aucun snapshot API pour cette fenêtre (mode replay) : {body_path}"
+            )
+        LOGGER.info("Replay du snapshot API", path=str(body_path))
+        return _read_snapshot(body_path), meta["headers"]
+
+    headers = {}
+    if cached:
+        if "ETag" in meta["headers"]:
+            headers["If-None-Match"] = meta["headers"]["ETag"]
+        if "Last-Modified" in meta["headers"]:
+            headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+
+    response = requests.get(url, params=params, headers=headers, stream=True)
+
+    if response.status_code == 304:
+        response.close()
+        LOGGER.info("API inchangée depuis le dernier snapshot", path=str(body_path))
+        return _read_snapshot(body_path), meta["headers"]
+
+    response.raise_for_status()
+    return _record_snapshot(response, params, body_path, meta_path), dict(response.headers)
+
+
+def get_api_json(
+    url: Optional[str],
+    params: Optional[dict] = None,
+    replay: Optional[bool] = None,
+    cache_dir: Optional[Path] = None,
+) -> tuple[list, dict]:
+    """Variante non streamée pour les petites réponses (pages)."""
+    chunks, headers = open_api_request(url, params, replay=replay, cache_dir=cache_dir)
+    return json.loads(b"".join(chunks)), headers
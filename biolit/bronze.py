@@ -0,0 +1,142 @@
+import datetime
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+import structlog
+from polars import col
+
+from biolit import BRONZEDIR
+
+LOGGER = structlog.get_logger()
+
+OBSERVATIONS_BRONZE = BRONZEDIR / "observations"
+PARTITION = "obs_month"
+# Au-delà de ce nombre de fichiers, une partition est compactée
+COMPACTION_MIN_FILES = 8
+
+
+def _partition_dir(root: Path, month: str) -> Path:
+    return root / f"{PARTITION}={month}"
+
+
+def append_observations_batch(df: pl.DataFrame, root: Optional[Path] = None) -> int:
+    """
+    Ajoute un lot d'observations ingérées au dataset Parquet bronze,
+    partitionné par mois d'observation (obs_month=YYYY-MM).
+
+    Retourne le nombre de fichiers écrits.
+    """
+    root = root or OBSERVATIONS_BRONZE
+    if df.is_empty():
+        return 0
+
+    df = df.with_columns(
+        col("date_observation").dt.strftime("%Y-%m").fill_null("unknown").alias(PARTITION),
+        pl.lit(datetime.datetime.now()).alias("ingested_at"),
+    )
+
+    batch_id = f"{datetime.datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    partitions = df.partition_by(PARTITION, as_dict=True)
+    for (month,), part in partitions.items():
+        target = _partition_dir(root, month)
+        target.mkdir(parents=True, exist_ok=True)
+        part.drop(PARTITION).write_parquet(target / f"part-{batch_id}.parquet")
+
+    LOGGER.info("bronze: lot ajouté", rows=len(df), partitions=len(partitions))
+    return len(partitions)
+
+
+def compact_observations(
+    root: Optional[Path] = None,
+    min_files: int = COMPACTION_MIN_FILES,
+) -> int:
+    """
+    Fusionne les petits fichiers de chaque partition en un seul.
+    Pour une même observation, seule la version ingérée en dernier est gardée.
+
+    Retourne le nombre de partitions compactées.
+    """
+    root = root or OBSERVATIONS_BRONZE
+    compacted = 0
+
+    for partition in sorted(root.glob(f"{PARTITION}=*")):
+        files = sorted(partition.glob("*.parquet"))
+        if len(files) < min_files:
+            continue
+
+        merged = (
+            pl.scan_parquet(files)
+            .sort("ingested_at", maintain_order=True)
+            .unique("id_observation", keep="last", maintain_order=True)
+            .collect()
+        )
+        tmp = partition / f"compact-{uuid.uuid4().hex[:8]}.parquet.tmp"
+        merged.write_parquet(tmp)
+        # Le fichier compacté est publié avant la suppression des sources :
+        # une interruption laisse au pire des doublons, dédoublonnés à la lecture
+        tmp.rename(tmp.with_suffix(""))
+        for f in files:
+            f.unlink()
+
+        LOGGER.info(
+            "bronze: partition compactée",
+            partition=partition.name,
+            files=len(files),
+            rows=len(merged),
+        )
+        compacted += 1
+
+    return compacted
+
+
+def scan_observations(
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    root: Optional[Path] = None,
+    latest_only: bool = True,
+    across_partitions: bool = False,
+) -> pl.LazyFrame:
+    """
+    LazyFrame sur le dataset bronze des observations.
+
+    Le filtre sur obs_month (format YYYY-MM, bornes incluses) est poussé
+    jusqu'au scan : seules les partitions concernées sont lues. Les
+    observations sans date (obs_month=unknown) sont exclues dès qu'une
+    borne est donnée.
+
+    latest_only garde, pour chaque observation, la version ingérée en
+    dernier parmi les partitions lues (fichiers non encore compactés).
+
+    Une observation dont la date a été corrigée existe dans l'ancienne et
+    la nouvelle partition. across_partitions retire aussi les versions
+    périmées qui ont quitté la plage demandée, mais lit id_observation /
+    ingested_at sur tout le dataset : l'élagage des partitions est perdu,
+    le coût devient celui d'un scan complet (deux colonnes).
+    """
+    root = root or OBSERVATIONS_BRONZE
+    lf = pl.scan_parquet(
+        root / "**" / "*.parquet",
+        hive_partitioning=True,
+        hive_schema={PARTITION: pl.Utf8},
+    )
+
+    latest = (
+        lf.group_by("id_observation").agg(col("ingested_at").max())
+        if latest_only and across_partitions
+        else None
+    )
+
+    if start_month is not None or end_month is not None:
+        lf = lf.filter(col(PARTITION) != "unknown")
+    if start_month is not None:
+        lf = lf.filter(col(PARTITION) >= start_month)
+    if end_month is not None:
+        lf = lf.filter(col(PARTITION) <= end_month)
+
+    if latest is not None:
+        lf = lf.join(latest, on=["id_observation", "ingested_at"], how="semi")
+    elif latest_only:
+        lf = lf.filter(col("ingested_at") == col("ingested_at").max().over("id_observation"))
+    return lf
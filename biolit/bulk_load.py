@@ -0,0 +1,271 @@
+import io
+import time
+import uuid
+from typing import Optional, Sequence
+
+import polars as pl
+import structlog
+
+from biolit.sql_metrics import execute_recorded, record_statement
+
+LOGGER = structlog.get_logger()
+
+# Nombre de lignes envoyées par COPY : borne la mémoire côté Python
+DEFAULT_CHUNK_SIZE = 50_000
+# Numéro de ligne dans la table de staging (ordre du DataFrame)
+_STAGING_ROW = "_staging_row"
+
+
+# -------------------------
+# Sérialisation CSV pour COPY
+# -------------------------
+def _chunk_to_csv(chunk: pl.DataFrame) -> io.BytesIO:
+    """
+    Sérialise un chunk Polars au format CSV attendu par COPY.
+    Les NULL sont écrits en \\N pour les distinguer des chaînes vides.
+    """
+    buffer = io.BytesIO()
+    chunk.write_csv(
+        buffer,
+        include_header=False,
+        null_value=r"\N",
+        datetime_format="%Y-%m-%d %H:%M:%S%.f",
+        time_format="%H:%M:%S%.f",
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def _conflict_clause(
+    conflict_columns: Optional[Sequence[str]],
+    update_columns: Optional[Sequence[str]],
+    update_where: Optional[str] = None,
+) -> str:
+    if not conflict_columns:
+        return ""
+
+    target = ", ".join(conflict_columns)
+    if not update_columns:
+        return f"ON CONFLICT ({target}) DO NOTHING"
+
+    assignments = ",\n        ".join(
+        f"{col} = EXCLUDED.{col}" for col in update_columns
+    )
+    clause = f"ON CONFLICT ({target}) DO UPDATE SET\n        {assignments}"
+    if update_where:
+        clause += f"\n        WHERE {update_where}"
+    return clause
+
+
+# -------------------------
+# COPY → staging → INSERT ... SELECT
+# -------------------------
+def _copy_and_insert(
+    df: pl.DataFrame,
+    table: str,
+    engine,
+    columns: Sequence[str],
+    staging: str,
+    insert_query: str,
+    chunk_size: int,
+):
+    """
+    Streame df par chunks avec COPY dans la table temporaire staging
+    (même structure que la table cible, plus _staging_row qui numérote
+    les lignes dans l'ordre du df), puis exécute insert_query dans la
+    même transaction.
+
+    Retourne:
+        (rowcount de l'insert, première ligne retournée ou None)
+    """
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            execute_recorded(cursor, f"""
+                CREATE TEMP TABLE {staging}
+                (LIKE {table} INCLUDING DEFAULTS)
+                ON COMMIT DROP
+            """)
+            execute_recorded(cursor, f"ALTER TABLE {staging} ADD COLUMN {_STAGING_ROW} BIGSERIAL")
+
+            copy_rows(cursor, staging, df, columns, chunk_size)
+            execute_recorded(cursor, insert_query)
+            result = (cursor.rowcount, cursor.fetchone() if cursor.description else None)
+        finally:
+            cursor.close()
+
+    return result
+
+
+def copy_rows(
+    cursor,
+    table: str,
+    df: pl.DataFrame,
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """
+    COPY de df dans table par chunks, sur un curseur psycopg2 brut.
+    Le COPY est compté dans les métriques SQL de l'étape.
+    """
+    col_list = ", ".join(columns or df.columns)
+    copy_query = f"COPY {table} ({col_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    t0 = time.perf_counter()
+    for chunk in df.iter_slices(n_rows=chunk_size):
+        cursor.copy_expert(copy_query, _chunk_to_csv(chunk))
+    # Curseur brut : invisible pour les événements SQLAlchemy
+    record_statement(copy_query, time.perf_counter() - t0, len(df))
+
+
+def staging_name(table: str) -> str:
+    """Nom de table temporaire, unique : deux chargements dans une même session ne se gênent pas."""
+    return f"_staging_{table}_{uuid.uuid4().hex[:8]}"
+
+
+def _distinct_on(key_columns: Sequence[str]) -> tuple[str, str]:
+    """
+    DISTINCT ON et ORDER BY associé : pour une même clé, la dernière
+    ligne du df l'emporte.
+    """
+    keys = ", ".join(key_columns)
+    return f"DISTINCT ON ({keys}) ", f"ORDER BY {keys}, {_STAGING_ROW} DESC"
+
+
+def _log_throughput(table: str, n_rows: int, t0: float, **counts):
+    elapsed = time.perf_counter() - t0
+    LOGGER.info(
+        "bulk_load terminé",
+        table=table,
+        rows_staged=n_rows,
+        duration_s=round(elapsed, 3),
+        rows_per_s=round(n_rows / elapsed) if elapsed > 0 else None,
+        **counts,
+    )
+
+
+def copy_into_table(
+    df: pl.DataFrame,
+    table: str,
+    engine,
+    columns: Optional[Sequence[str]] = None,
+    conflict_columns: Optional[Sequence[str]] = None,
+    update_columns: Optional[Sequence[str]] = None,
+    update_where: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    Charge un DataFrame Polars dans une table PostgreSQL en masse.
+
+    Les lignes sont streamées par chunks avec COPY dans une table temporaire,
+    puis un unique INSERT ... SELECT ... ON CONFLICT écrit dans la table cible.
+
+    Args:
+        df: données à insérer (les colonnes en trop sont ignorées)
+        table: table cible
+        engine: engine SQLAlchemy
+        columns: colonnes à charger (par défaut toutes celles du df)
+        conflict_columns: clé utilisée pour ON CONFLICT
+        update_columns: colonnes mises à jour en cas de conflit
+            (None → DO NOTHING)
+        update_where: condition de mise à jour (ex: table.col IS DISTINCT
+            FROM EXCLUDED.col), pour ne pas réécrire les lignes inchangées
+        chunk_size: nombre de lignes par COPY
+
+    Retourne:
+        Nombre de lignes écrites dans la table cible
+    """
+    if df.is_empty():
+        LOGGER.info("bulk_load: aucune ligne à insérer", table=table)
+        return 0
+
+    columns = list(columns or df.columns)
+    col_list = ", ".join(columns)
+
+    # Dédoublonnage dans le lot : un ON CONFLICT DO UPDATE ne peut pas
+    # toucher deux fois la même ligne dans un même INSERT
+    distinct_on, order_by = _distinct_on(conflict_columns) if conflict_columns else ("", "")
+    staging = staging_name(table)
+
+    insert_query = f"""
+        INSERT INTO {table} ({col_list})
+        SELECT {distinct_on}{col_list}
+        FROM {staging}
+        {order_by}
+        {_conflict_clause(conflict_columns, update_columns, update_where)}
+    """
+
+    t0 = time.perf_counter()
+    rows_written, _ = _copy_and_insert(
+        df.select(columns), table, engine, columns, staging, insert_query, chunk_size
+    )
+    _log_throughput(table, len(df), t0, rows_written=rows_written)
+    return rows_written
+
+
+def upsert_changed_rows(
+    df: pl.DataFrame,
+    table: str,
+    engine,
+    key_columns: Sequence[str],
+    columns: Optional[Sequence[str]] = None,
+    hash_column: str = "row_hash",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict:
+    """
+    Upsert avec détection de changement.
+
+    Un hash du contenu (md5 de la ligne, calculé par Postgres) est stocké
+    dans hash_column : seules les lignes nouvelles ou dont le hash a changé
+    sont écrites, les autres ne sont pas touchées.
+
+    Retourne:
+        {"inserted": ..., "updated": ..., "unchanged": ...}
+    """
+    if df.is_empty():
+        LOGGER.info("bulk_load: aucune ligne à insérer", table=table)
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    columns = list(columns or df.columns)
+    col_list = ", ".join(columns)
+    key_list = ", ".join(key_columns)
+    hashed = ", ".join(c for c in columns if c != hash_column)
+    assignments = ",\n                ".join(
+        f"{col} = EXCLUDED.{col}"
+        for col in columns + [hash_column]
+        if col not in key_columns
+    )
+
+    distinct_on, order_by = _distinct_on(key_columns)
+    staging = staging_name(table)
+
+    # xmax = 0 ⇔ la ligne vient d'être insérée (pas de version précédente)
+    insert_query = f"""
+        WITH upserted AS (
+            INSERT INTO {table} ({col_list}, {hash_column})
+            SELECT {distinct_on}
+                {col_list},
+                md5(ROW({hashed})::text)
+            FROM {staging}
+            {order_by}
+            ON CONFLICT ({key_list}) DO UPDATE SET
+                {assignments}
+            WHERE {table}.{hash_column} IS DISTINCT FROM EXCLUDED.{hash_column}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            count(*) FILTER (WHERE inserted),
+            count(*) FILTER (WHERE NOT inserted)
+        FROM upserted
+    """
+
+    t0 = time.perf_counter()
+    _, (inserted, updated) = _copy_and_insert(
+        df.select(columns), table, engine, columns, staging, insert_query, chunk_size
+    )
+    counts = {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": df.select(key_columns).n_unique() - inserted - updated,
+    }
+    _log_throughput(table, len(df), t0, **counts)
+    return counts
@@ -1,13 +1,24 @@
 import os
 import polars as pl
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import pandas as pd
 import structlog
-from typing import Dict
+import datetime
+from typing import Dict, Iterator, Optional, Sequence
 from dotenv import load_dotenv
+
+from biolit.bulk_load import copy_into_table, upsert_changed_rows
+from biolit.db_read import read_database_arrow
+from biolit.engine import get_shared_engine
+from biolit.export_api import OBSERVATION_SCHEMA, parse_observations
+from biolit.work_queue import ML_BATCH_SIZE
+
 LOGGER = structlog.get_logger()
 load_dotenv()
 
+# Nombre de lignes lues par aller-retour du curseur serveur
+DB_CHUNK_SIZE = int(os.getenv("DB_CHUNK_SIZE", "50000"))
+
 # -------------------------
 # Connexion DB
 # -------------------------
@@ -17,234 +28,252 @@ def get_engine():
 
     if not postgres_url:
         raise ValueError("Missing DATABASE_URL")
-    return create_engine(postgres_url)
+    return get_shared_engine(postgres_url)
 
 # -------------------------
-# Création de la table (si besoin)
+# Watermark d'ingestion
 # -------------------------
-def create_table():
-    engine = get_engine()
+# Les tables sont créées par les migrations (biolit/migrations.py)
 
+def get_ingestion_watermark(engine, source: str = "biolit_api") -> Optional[Dict]:
+    """
+    Retourne le watermark de la dernière ingestion réussie
+    (None si aucune ingestion n'a encore eu lieu).
+    """
     with engine.begin() as conn:
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS observations (
-                id_observation BIGINT PRIMARY KEY,
-                date_observation TIMESTAMP,
-                lien_observation TEXT,
-                observateur TEXT,
-                url_sortie TEXT,
-                espece_identifiee TEXT,
-                heure_debut TIME,
-                heure_fin TIME,
-                latitude DOUBLE PRECISION,
-                longitude DOUBLE PRECISION,
-                photos TEXT,
-                relais BIGINT,
-                id_espece BIGINT,
-                nom_scientifique TEXT,
-                nom_commun TEXT,
-                categorie_programme BIGINT,
-                programme TEXT,
-                validee TEXT
-            );
-        """))
-
-def create_enriched_table(engine):
+        row = conn.execute(text("""
+            SELECT last_id_observation, last_date_observation, last_run_at
+            FROM ingestion_watermark
+            WHERE source = :source
+        """), {"source": source}).mappings().first()
+
+    return dict(row) if row else None
+
+
+def update_ingestion_watermark(
+    engine,
+    df: pl.DataFrame,
+    run_started_at: datetime.datetime,
+    source: str = "biolit_api",
+):
+    """
+    Avance le watermark après une ingestion réussie.
+    Le watermark ne recule jamais, même si le lot est vide.
+    """
+    params = {
+        "source": source,
+        "last_id_observation": df["id_observation"].max() if not df.is_empty() else None,
+        "last_date_observation": df["date_observation"].max() if not df.is_empty() else None,
+        "last_run_at": run_started_at,
+    }
+
     with engine.begin() as conn:
         conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS observations_enriched (
-                id_observation BIGINT PRIMARY KEY,
-                nearest_commune TEXT,
-                code_insee TEXT,
-                distance_commune_m DOUBLE PRECISION,
-                code_postal TEXT,
-                reg_nom TEXT,
-                dep_nom TEXT,
-                distance_to_coast DOUBLE PRECISION,
-                is_coastal BOOLEAN
-            );
-        """))
+            INSERT INTO ingestion_watermark (
+                source, last_id_observation, last_date_observation, last_run_at
+            ) VALUES (
+                :source, :last_id_observation, :last_date_observation, :last_run_at
+            )
+            ON CONFLICT (source) DO UPDATE SET
+                last_id_observation = GREATEST(
+                    ingestion_watermark.last_id_observation,
+                    EXCLUDED.last_id_observation
+                ),
+                last_date_observation = GREATEST(
+                    ingestion_watermark.last_date_observation,
+                    EXCLUDED.last_date_observation
+                ),
+                last_run_at = EXCLUDED.last_run_at
+        """), params)
+
+    LOGGER.info("Watermark d'ingestion mis à jour", **params)
 
 
 # -------------------------
 # Préparation des données
 # -------------------------
 def prepare_dataframe_for_postgres(df: pl.DataFrame) -> pl.DataFrame:
-    return df.with_columns([
-
-        # -------------------------
-        # IDs
-        # -------------------------
-        pl.col("id_observation")
-        .cast(pl.Int64),
-
-        pl.col("id_espece")
-        .cast(pl.Float64, strict=False)
-        .fill_nan(None)
-        .cast(pl.Int64, strict=False),
-
-        pl.col("categorie_programme")
-        .cast(pl.Float64, strict=False)
-        .fill_nan(None)
-        .cast(pl.Int64, strict=False),
-
-        pl.col("relais")
-        .cast(pl.Utf8)
-        .replace("", None)
-        .cast(pl.Float64, strict=False)
-        .fill_nan(None)
-        .cast(pl.Int64, strict=False),
-
-        # -------------------------
-        # Coordonnées
-        # -------------------------
-        pl.col("latitude")
-        .cast(pl.Utf8)
-        .str.strip_chars()
-        .cast(pl.Float64, strict=False),
-
-        pl.col("longitude")
-        .cast(pl.Utf8)
-        .str.strip_chars()
-        .cast(pl.Float64, strict=False),
-
-        # -------------------------
-        # Dates
-        # -------------------------
-        pl.col("date_observation")
-        .str.strptime(pl.Datetime, strict=False),
-
-        pl.col("heure_debut")
-        .str.strptime(pl.Time, strict=False),
-
-        pl.col("heure_fin")
-        .str.strptime(pl.Time, strict=False),
-    ])
+    """
+    Type les observations selon OBSERVATION_SCHEMA.
+    Les lignes invalides sont écartées (voir parse_observations).
+    """
+    valid, _ = parse_observations(df)
+    return valid
 
 # -------------------------
 # Insert avec sécurité (UPSERT)
 # -------------------------
 
-def insert_dataframe(df: pl.DataFrame):
+OBSERVATION_COLUMNS = [
+    "id_observation",
+    "date_observation",
+    "lien_observation",
+    "observateur",
+    "url_sortie",
+    "espece_identifiee",
+    "heure_debut",
+    "heure_fin",
+    "latitude",
+    "longitude",
+    "photos",
+    "relais",
+    "id_espece",
+    "nom_scientifique",
+    "nom_commun",
+    "categorie_programme",
+    "programme",
+    "validee",
+]
+
+def insert_dataframe(df: pl.DataFrame) -> Dict:
+    """
+    Upsert des observations : seules les lignes nouvelles ou modifiées
+    côté API (hash du contenu différent) sont écrites.
+    """
     engine = get_engine()
 
-    rows = df.to_dicts()
+    counts = upsert_changed_rows(
+        df,
+        "observations",
+        engine,
+        key_columns=["id_observation"],
+        columns=OBSERVATION_COLUMNS,
+    )
+    LOGGER.info("observations chargées", **counts)
+    insert_observation_photos(df, engine)
+    return counts
 
+# -------------------------
+# Photos (une ligne par URL)
+# -------------------------
+def explode_observation_photos(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Éclate la colonne photos ("url1|url2|...") en une ligne par URL :
+    (id_observation, photo_index, url). photo_index est la position
+    d'origine dans la liste ; les entrées qui ne sont pas des URLs sont ignorées.
+    """
+    return (
+        df.select("id_observation", pl.col("photos").str.split("|").alias("url"))
+        .with_columns(pl.int_ranges(pl.col("url").list.len(), dtype=pl.Int32).alias("photo_index"))
+        .explode("url", "photo_index")
+        .with_columns(pl.col("url").str.strip_chars())
+        .filter(pl.col("url").str.starts_with("http"))
+        .select("id_observation", "photo_index", "url")
+    )
+
+def insert_observation_photos(df: pl.DataFrame, engine):
+    """
+    Synchronise observation_photos avec la colonne photos des observations.
+    Une URL modifiée repasse en pending (hash, dimensions remis à NULL) ;
+    les photos retirées côté API sont supprimées.
+    """
+    photos = explode_observation_photos(df).with_columns(
+        pl.lit("pending").alias("status"),
+        pl.lit(None, dtype=pl.Utf8).alias("content_hash"),
+        pl.lit(None, dtype=pl.Int32).alias("width"),
+        pl.lit(None, dtype=pl.Int32).alias("height"),
+    )
+
+    copy_into_table(
+        photos,
+        "observation_photos",
+        engine,
+        conflict_columns=["id_observation", "photo_index"],
+        update_columns=["url", "status", "content_hash", "width", "height"],
+        update_where="observation_photos.url IS DISTINCT FROM EXCLUDED.url",
+    )
+
+    n_photos = (
+        df.select("id_observation")
+        .join(
+            photos.group_by("id_observation").agg((pl.col("photo_index").max() + 1).alias("n_photos")),
+            on="id_observation",
+            how="left",
+        )
+        .with_columns(pl.col("n_photos").fill_null(0))
+    )
     with engine.begin() as conn:
-        for row in rows:
-            conn.execute(text("""
-                INSERT INTO observations (
-                    id_observation,
-                    date_observation,
-                    lien_observation,
-                    observateur,
-                    url_sortie,
-                    espece_identifiee,
-                    heure_debut,
-                    heure_fin,
-                    latitude,
-                    longitude,
-                    photos,
-                    relais,
-                    id_espece,
-                    nom_scientifique,
-                    nom_commun,
-                    categorie_programme,
-                    programme,
-                    validee
-                ) VALUES (
-                    :id_observation,
-                    :date_observation,
-                    :lien_observation,
-                    :observateur,
-                    :url_sortie,
-                    :espece_identifiee,
-                    :heure_debut,
-                    :heure_fin,
-                    :latitude,
-                    :longitude,
-                    :photos,
-                    :relais,
-                    :id_espece,
-                    :nom_scientifique,
-                    :nom_commun,
-                    :categorie_programme,
-                    :programme,
-                    :validee
-                )
-                ON CONFLICT (id_observation) DO NOTHING
-            """), row)
+        conn.execute(text("""
+            DELETE FROM observation_photos p
+            USING unnest(CAST(:ids AS BIGINT[]), CAST(:n_photos AS INTEGER[]))
+                AS n(id_observation, n_photos)
+            WHERE p.id_observation = n.id_observation
+            AND p.photo_index >= n.n_photos
+        """), {
+            "ids": n_photos["id_observation"].to_list(),
+            "n_photos": n_photos["n_photos"].to_list(),
+        })
+
+def update_photo_status(df: pl.DataFrame, engine):
+    """
+    Enregistre le résultat du téléchargement des photos.
+    Colonnes attendues : id_observation, photo_index, url, status,
+    content_hash, width, height.
+    """
+    if df.is_empty():
+        return
+
+    copy_into_table(
+        df.with_columns(pl.lit(datetime.datetime.now(datetime.timezone.utc)).alias("fetched_at")),
+        "observation_photos",
+        engine,
+        columns=[
+            "id_observation", "photo_index", "url", "status",
+            "content_hash", "width", "height", "fetched_at",
+        ],
+        conflict_columns=["id_observation", "photo_index"],
+        update_columns=["status", "content_hash", "width", "height", "fetched_at"],
+    )
+
+ENRICHED_COLUMNS = [
+    "nearest_commune",
+    "code_insee",
+    "distance_commune_m",
+    "code_postal",
+    "reg_nom",
+    "dep_nom",
+    "distance_to_coast",
+    "is_coastal",
+    "latitude",
+    "longitude",
+]
+
 
 def insert_enriched_dataframe(df: pd.DataFrame, engine):
+    """
+    Upsert : une observation déplacée (ou recalculée avec --recompute-all)
+    remplace son enrichissement précédent.
+    """
     pl_df = pl.from_pandas(df)
-    rows = pl_df.to_dicts()
 
-    with engine.begin() as conn:
-        for row in rows:
-            conn.execute(text("""
-                INSERT INTO observations_enriched (
-                    id_observation,
-                    nearest_commune,
-                    code_insee,
-                    distance_commune_m,
-                    code_postal,
-                    reg_nom,
-                    dep_nom,
-                    distance_to_coast,
-                    is_coastal
-                ) VALUES (
-                    :id_observation,
-                    :nearest_commune,
-                    :code_insee,
-                    :distance_commune_m,
-                    :code_postal,
-                    :reg_nom,
-                    :dep_nom,
-                    :distance_to_coast,
-                    :is_coastal
-                )
-                ON CONFLICT (id_observation) DO NOTHING
-            """), row)
+    copy_into_table(
+        pl_df,
+        "observations_enriched",
+        engine,
+        columns=["id_observation", *ENRICHED_COLUMNS],
+        conflict_columns=["id_observation"],
+        update_columns=[*ENRICHED_COLUMNS, "enriched_at"],
+    )
 
 def insert_no_crops_dataframe(df: pl.DataFrame, engine):
-    rows = df.to_dicts()
-
-    with engine.begin() as conn:
-        for row in rows:
-            conn.execute(text("""
-                INSERT INTO ml_no_crops (
-                    run_name,
-                    id_observation,
-                    path_s3
-                ) VALUES (
-                    :run_name,
-                    :id_observation,
-                    :path_s3
-                )
-                ON CONFLICT (id_observation) DO NOTHING
-            """), row)
+    copy_into_table(
+        df,
+        "ml_no_crops",
+        engine,
+        columns=["run_name", "id_observation", "path_s3"],
+        conflict_columns=["id_observation"],
+    )
+    _forget_missing_image_paths("ml_no_crops")
 
 def insert_crops_dataframe(df: pl.DataFrame, engine):
-    rows = df.to_dicts()
-
-    with engine.begin() as conn:
-        for row in rows:
-            conn.execute(text("""
-                INSERT INTO ml_crops (
-                    run_name,
-                    id_crops,
-                    regne,
-                    confiance,
-                    path_s3
-                ) VALUES (
-                    :run_name,
-                    :id_crops,
-                    :regne,
-                    :confiance,
-                    :path_s3
-                )
-                ON CONFLICT (id_crops) DO NOTHING
-            """), row)
+    copy_into_table(
+        df,
+        "ml_crops",
+        engine,
+        columns=["run_name", "id_crops", "regne", "confiance", "path_s3"],
+        conflict_columns=["id_crops"],
+    )
+    _forget_missing_image_paths("ml_crops")
 
 def load_observations_from_db(engine) -> pl.DataFrame:
     query = """
@@ -252,85 +281,197 @@ def load_observations_from_db(engine) -> pl.DataFrame:
         FROM observations
     """
 
-    return pl.read_database(query, engine)
+    return read_database_arrow(query, engine)
 
-def load_observations_from_db_for_ML(engine) -> pl.DataFrame:
-    query = """
+def iter_observations_from_db(
+    engine,
+    columns: Optional[Sequence[str]] = None,
+    where: Optional[str] = None,
+    params: Optional[Dict] = None,
+    chunk_size: int = DB_CHUNK_SIZE,
+) -> Iterator[pl.DataFrame]:
+    """
+    Parcourt la table observations par chunks Polars, via un curseur
+    nommé côté serveur : la mémoire reste bornée par chunk_size,
+    quelle que soit la taille de l'historique.
+
+    Args:
+        columns: colonnes à lire (par défaut toutes)
+        where: prédicat SQL optionnel, avec paramètres nommés (:param)
+        params: valeurs des paramètres du prédicat
+        chunk_size: nombre de lignes par chunk
+    """
+    col_list = ", ".join(columns) if columns else "*"
+    query = f"SELECT {col_list} FROM observations"
+    if where:
+        query += f" WHERE {where}"
+
+    # Types fixes : un chunk entièrement NULL garde le type de la colonne
+    schema_overrides = {
+        name: dtype
+        for name, dtype in OBSERVATION_SCHEMA.items()
+        if not columns or name in columns
+    }
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        n_rows = 0
+        for chunk in pl.read_database(
+            text(query),
+            conn,
+            iter_batches=True,
+            batch_size=chunk_size,
+            schema_overrides=schema_overrides,
+            execute_options={"parameters": params or {}},
+        ):
+            n_rows += len(chunk)
+            yield chunk
+
+    LOGGER.info("observations lues depuis la DB", count=n_rows)
+
+def load_observations_from_db_for_ML(engine, limit: Optional[int] = None) -> pl.DataFrame:
+    """
+    Candidats ML sans réservation (lecture seule).
+    Pour plusieurs workers en parallèle, utiliser biolit.work_queue.
+    """
+    query = f"""
         SELECT
-            id_observation,
-            photos,
-            latitude,
-            longitude,
-            relais,
-            nearest_commune,
-            reg_nom,
-            dep_nom,
-            validee
-        FROM observations
-        LEFT JOIN observations_enriched
+            o.id_observation,
+            p.url AS photos,
+            p.photo_index,
+            o.latitude,
+            o.longitude,
+            o.relais,
+            e.nearest_commune,
+            e.reg_nom,
+            e.dep_nom,
+            o.validee
+        FROM observations o
+        JOIN LATERAL (
+            -- Première photo exploitable de l'observation
+            SELECT p.url, p.photo_index
+            FROM observation_photos p
+            WHERE p.id_observation = o.id_observation
+            AND p.url LIKE 'https:%'
+            AND p.status <> 'failed'
+            ORDER BY p.photo_index
+            LIMIT 1
+        ) p ON TRUE
+        LEFT JOIN observations_enriched e
         USING (id_observation)
-        WHERE LOWER(validee) = 'false'
-        AND photos LIKE 'https:%'
-        AND id_observation NOT IN (
-            SELECT DISTINCT CAST(split_part(id_crops, '_', 1) AS BIGINT) FROM ml_crops
-            UNION
-            SELECT DISTINCT CAST(id_observation AS BIGINT) FROM ml_no_crops
+        WHERE o.validee IS FALSE
+        AND NOT EXISTS (
+            SELECT 1 FROM ml_crops c WHERE c.id_observation = o.id_observation
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM ml_no_crops n WHERE n.id_observation = o.id_observation
         )
-        LIMIT 20
+        LIMIT {int(limit or ML_BATCH_SIZE)}
     """
-    return pl.read_database(query, engine)
+    return read_database_arrow(query, engine)
 
 def load_observations_from_crops_for_Label_Studio(engine) -> pl.DataFrame:
     query = """
         SELECT *
         FROM ml_crops
     """
-    return pl.read_database(query, engine)
-
-def create_taxonomy_table(engine):
-    with engine.begin() as conn:
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS ml_taxonomy (
-                id_crops        TEXT PRIMARY KEY,
-                run_name        TEXT,
-                id_observation  TEXT,
-                regne           TEXT,
-                confiance       DOUBLE PRECISION,
-                path_s3         TEXT,
-                best_level      TEXT,
-                best_label      TEXT,
-                best_score      DOUBLE PRECISION,
-                phylum          TEXT,
-                classe          TEXT,
-                ordre           TEXT,
-                famille         TEXT,
-                species_name    TEXT
-            );
-        """))
+    return read_database_arrow(query, engine)
 
 def insert_taxonomy_predictions(df: pl.DataFrame, engine) -> None:
-    rows = df.to_dicts()
-    with engine.begin() as conn:
-        for row in rows:
-            conn.execute(text("""
-                INSERT INTO ml_taxonomy (
-                    id_crops, run_name, id_observation,
-                    regne, confiance, path_s3,
-                    best_level, best_label, best_score,
-                    phylum, classe, ordre, famille, species_name
-                ) VALUES (
-                    :id_crops, :run_name, :id_observation,
-                    :regne_yolo, :confiance_yolo, :path_s3,
-                    :best_level, :best_label, :best_score,
-                    :phylum, :classe, :ordre, :famille, :species_name
-                )
-                ON CONFLICT (id_crops) DO UPDATE SET
-                    run_name     = EXCLUDED.run_name,
-                    best_level   = EXCLUDED.best_level,
-                    best_label   = EXCLUDED.best_label,
-                    best_score   = EXCLUDED.best_score
-            """), row)
-    LOGGER.info("ml_taxonomy: %d lignes insérées", len(rows))
+    df = df.with_columns(
+        pl.col("regne_yolo").alias("regne"),
+        pl.col("confiance_yolo").alias("confiance"),
+    )
+    rows = copy_into_table(
+        df,
+        "ml_taxonomy",
+        engine,
+        columns=[
+            "id_crops", "run_name", "id_observation",
+            "regne", "confiance", "path_s3",
+            "best_level", "best_label", "best_score",
+            "phylum", "classe", "ordre", "famille", "species_name",
+        ],
+        conflict_columns=["id_crops"],
+        update_columns=["run_name", "best_level", "best_label", "best_score"],
+    )
+    _forget_missing_image_paths("ml_taxonomy")
+    LOGGER.info("ml_taxonomy: lignes insérées", rows_inserted=rows)
+
+
+# Tables portant (id_observation, path_s3) interrogeables par le resolver
+IMAGE_PATH_TABLES = {"ml_no_crops", "ml_crops", "ml_taxonomy"}
+
+# Cache du run : (table, id_observation) → (bucket, key), ou None si
+# l'observation n'a pas d'image dans la table
+_IMAGE_PATHS: Dict[tuple, Optional[tuple]] = {}
+
+
+def clear_image_path_cache():
+    _IMAGE_PATHS.clear()
+
+
+def _forget_missing_image_paths(table_name: str):
+    """Après un insert dans table_name, les ids sans image sont à redemander."""
+    for cache_key in [k for k, v in _IMAGE_PATHS.items() if k[0] == table_name and v is None]:
+        del _IMAGE_PATHS[cache_key]
+
+
+def resolve_observation_image_paths(
+    engine,
+    ids: Sequence[int],
+    table_name: str = "ml_no_crops",
+) -> pl.DataFrame:
+    """
+    Résout en une seule requête les paths S3 d'une liste d'observations.
+    Les ids déjà demandés pendant le run, avec ou sans image, ne sont pas
+    redemandés.
+
+    Retourne:
+        DataFrame (id_observation, bucket, key), sans les ids sans image
+    """
+    if table_name not in IMAGE_PATH_TABLES:
+        raise ValueError(f"Table sans path_s3 : {table_name}")
+
+    ids = {int(i) for i in ids if i is not None}
+    missing = sorted(i for i in ids if (table_name, i) not in _IMAGE_PATHS)
+
+    if missing:
+        df = read_database_arrow(
+            f"""
+                SELECT id_observation, path_s3 FROM {table_name}
+                WHERE id_observation = ANY(:ids)
+            """,
+            engine,
+            params={"ids": missing},
+        )
+        # s3://bucket/key → (bucket, key)
+        parts = df.select(
+            pl.col("id_observation").cast(pl.Int64),
+            pl.col("path_s3").str.strip_prefix("s3://").str.splitn("/", 2).alias("parts"),
+        ).unnest("parts")
+        for id_obs in missing:
+            _IMAGE_PATHS[(table_name, id_obs)] = None
+        for id_obs, bucket, key in parts.iter_rows():
+            _IMAGE_PATHS[(table_name, id_obs)] = (bucket, key)
+
+        LOGGER.info(
+            "Paths S3 résolus",
+            table=table_name,
+            requested=len(missing),
+            found=len(df),
+        )
+
+    rows = [
+        (i, *_IMAGE_PATHS[(table_name, i)])
+        for i in sorted(ids)
+        if _IMAGE_PATHS[(table_name, i)] is not None
+    ]
+    return pl.DataFrame(
+        rows,
+        schema={"id_observation": pl.Int64, "bucket": pl.Utf8, "key": pl.Utf8},
+        orient="row",
+    )
 
 
 def get_observation_image_path(engine,
@@ -342,72 +483,19 @@ def get_observation_image_path(engine,
     puis retourne :
     {
         "bucket": ...,
-        "object_key": ...
+        "rest": ...
     }
+    Pour plusieurs observations, utiliser resolve_observation_image_paths.
     """
-
-    query=f"""
-      SELECT path_s3 FROM {table_name}
-        WHERE  CAST(id_observation AS BIGINT)={id_obs};
-    """
-    df = pl.read_database(query=query, connection=engine)
+    df = resolve_observation_image_paths(engine, [id_obs], table_name)
 
     if df.is_empty():
         LOGGER.info(f"No IMAGE for this {id_obs}")
         return None
 
-    # récupération string réelle
-    s3_path = df["path_s3"][0]
-
-    # suppression prefix s3://
-    sans_prefix = s3_path[5:]
-
-    # split bucket / key
-    bucket_name, rest = sans_prefix.split("/", 1)
-
     return {
-            "bucket": bucket_name,
-            "rest": rest }
-
-def create_db_finale_table(engine):
-    with engine.begin() as conn:
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS db_finale (
-                id_crops TEXT PRIMARY KEY,
-                id_observation BIGINT,
-                nom_scientifique TEXT,
-                annotateur  TEXT,
-                source  TEXT,
-                validee  TEXT,
-                espece_identifiee TEXT
-            );
-        """))
-
-def create_taxonomy_queue_table(engine):
-
-    with engine.begin() as conn:
-
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS taxonomy_queue (
-                id_crops TEXT PRIMARY KEY,
-                id_observation BIGINT NOT NULL,
-                task_created_date TIMESTAMP,
-                crop_index INTEGER,
-                x FLOAT,
-                y FLOAT,
-                width FLOAT,
-                height FLOAT,
-                original_width INTEGER,
-                original_height INTEGER,
-                nom_scientifique TEXT,
-                annotateur TEXT,
-                annotated_at TIMESTAMP,
-                commentaire TEXT,
-                source TEXT,
-                validee TEXT,
-                espece_identifiee TEXT
-            );
-        """))
+            "bucket": df["bucket"][0],
+            "rest": df["key"][0] }
 
 def insert_db_finale_dataframe(df, engine):
         """
@@ -418,33 +506,21 @@ def insert_db_finale_dataframe(df, engine):
             LOGGER.info("Aucune donnée à insérer dans db_finale")
             return
 
-        rows = df.to_dicts()
-
-        query = text("""
-            INSERT INTO db_finale (
-                id_crops,
-                id_observation,
-                nom_scientifique,
-                annotateur,
-                source,
-                validee,
-                espece_identifiee
-            )
-            VALUES (
-                :id_crops,
-                :id_observation,
-                :nom_scientifique,
-                :annotateur,
-                :source,
-                :validee,
-                :espece_identifiee
-            )
-            ON CONFLICT (id_crops)
-            DO NOTHING
-        """)
-
-        with engine.begin() as conn:
-            conn.execute(query, rows)
+        copy_into_table(
+            df,
+            "db_finale",
+            engine,
+            columns=[
+                "id_crops",
+                "id_observation",
+                "nom_scientifique",
+                "annotateur",
+                "source",
+                "validee",
+                "espece_identifiee",
+            ],
+            conflict_columns=["id_crops"],
+        )
 
 
 def insert_taxonomy_queue_dataframe(df, engine):
@@ -457,57 +533,35 @@ def insert_taxonomy_queue_dataframe(df, engine):
             LOGGER.info("Aucune donnée à insérer dans taxonomy_queue")
             return
 
-        rows = df.to_dicts()
-
-        query = text("""
-            INSERT INTO taxonomy_queue (
-                id_crops,
-                id_observation,
-                task_created_date,
-                crop_index,
-                x,
-                y,
-                width,
-                height,
-                original_width,
-                original_height,
-                nom_scientifique,
-                annotateur,
-                annotated_at,
-                commentaire,
-                source,
-                validee,
-                espece_identifiee
-            )
-            VALUES (
-                :id_crops,
-                :id_observation,
-                :task_created_date,
-                :crop_index,
-                :x,
-                :y,
-                :width,
-                :height,
-                :original_width,
-                :original_height,
-                :nom_scientifique,
-                :annotateur,
-                :annotated_at,
-                :commentaire,
-                :source,
-                :validee,
-                :espece_identifiee
-            )
-            ON CONFLICT (id_crops)
-            DO NOTHING
-        """)
-
-        with engine.begin() as conn:
-            conn.execute(query, rows)
+        rows = copy_into_table(
+            df,
+            "taxonomy_queue",
+            engine,
+            columns=[
+                "id_crops",
+                "id_observation",
+                "task_created_date",
+                "crop_index",
+                "x",
+                "y",
+                "width",
+                "height",
+                "original_width",
+                "original_height",
+                "nom_scientifique",
+                "annotateur",
+                "annotated_at",
+                "commentaire",
+                "source",
+                "validee",
+                "espece_identifiee",
+            ],
+            conflict_columns=["id_crops"],
+        )
 
         LOGGER.info(
             "Insertion taxonomy_queue terminée",
-            rows_inserted=len(rows)
+            rows_inserted=rows
         )
 
 def prepare_db_finale_dataframe(df: pl.DataFrame ) -> pl.DataFrame:
@@ -0,0 +1,183 @@
+"""
+Lectures PostgreSQL → Polars sans passer par des tuples Python.
+
+Ordre des chemins essayés :
+    1. ADBC (adbc-driver-postgresql, si installé) : Arrow de bout en bout
+    2. COPY (query) TO STDOUT en CSV, parsé directement par Polars,
+       avec un schéma lu sur la même requête en LIMIT 0
+    3. pl.read_database (SQLAlchemy), si les deux premiers échouent
+       ou si la base n'est pas PostgreSQL (tests sqlite)
+
+Seules les erreurs de driver (connexion ADBC, fonctionnalité non
+supportée, curseur d'un autre driver que psycopg2, sans COPY) font passer
+au chemin suivant : une erreur SQL ou un bug remonte directement, sans
+relancer la requête.
+
+Réservé aux requêtes SELECT : la requête est exécutée deux fois (schéma
+puis données) et ne doit donc pas avoir d'effet de bord.
+"""
+
+import io
+import time
+from typing import Dict, Optional
+
+import polars as pl
+import psycopg2
+import structlog
+from sqlalchemy import text
+
+LOGGER = structlog.get_logger()
+
+try:
+    import adbc_driver_manager.dbapi as adbc_dbapi
+    import adbc_driver_postgresql.dbapi as adbc_postgresql
+    ADBC_AVAILABLE = True
+    _ADBC_ERRORS = (
+        adbc_dbapi.InterfaceError,
+        adbc_dbapi.OperationalError,
+        adbc_dbapi.NotSupportedError,
+    )
+except ImportError:
+    ADBC_AVAILABLE = False
+    _ADBC_ERRORS = ()
+
+_COPY_ERRORS = (psycopg2.InterfaceError, psycopg2.NotSupportedError)
+
+# OID PostgreSQL → type Polars (les types absents sont lus en texte)
+_PG_TYPES = {
+    16: pl.Boolean,
+    20: pl.Int64,
+    21: pl.Int64,
+    23: pl.Int64,
+    700: pl.Float64,
+    701: pl.Float64,
+    1700: pl.Float64,
+    1082: pl.Date,
+    1083: pl.Time,
+    1114: pl.Datetime("us"),
+    1184: pl.Datetime("us", "UTC"),
+}
+
+
+def _is_postgres(engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def _render_sql(query: str, params: Optional[Dict], engine, cursor) -> str:
+    """Requête avec paramètres liés côté client (échappés par psycopg2)."""
+    compiled = text(query).compile(dialect=engine.dialect)
+    bound = {**compiled.params, **(params or {})}
+    return cursor.mogrify(str(compiled), bound).decode()
+
+
+def _cast_from_csv(name: str, dtype: pl.DataType) -> pl.Expr:
+    col = pl.col(name)
+    if dtype == pl.Boolean:
+        return col.replace_strict({"t": True, "f": False}, default=None, return_dtype=pl.Boolean)
+    if dtype == pl.Date:
+        return col.str.to_date("%Y-%m-%d")
+    if dtype == pl.Time:
+        return col.str.to_time("%H:%M:%S%.f")
+    if isinstance(dtype, pl.Datetime):
+        return col.str.to_datetime(time_unit="us", time_zone=dtype.time_zone)
+    return col.cast(dtype)
+
+
+def _read_copy(query: str, params: Optional[Dict], engine) -> pl.DataFrame:
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            # Curseur d'un autre driver que psycopg2 : ni mogrify ni copy_expert
+            if not (hasattr(cursor, "mogrify") and hasattr(cursor, "copy_expert")):
+                raise psycopg2.NotSupportedError(
+                    f"COPY indisponible sur {type(cursor).__module__}.{type(cursor).__name__}"
+                )
+            sql = _render_sql(query, params, engine, cursor)
+
+            cursor.execute(f"SELECT * FROM ({sql}) AS _q LIMIT 0")
+            schema = {
+                desc.name: _PG_TYPES.get(desc.type_code, pl.Utf8)
+                for desc in cursor.description
+            }
+
+            buffer = io.BytesIO()
+            cursor.copy_expert(
+                f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER false, NULL '\\N')",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+    if not buffer.getbuffer().nbytes:
+        return pl.DataFrame(schema=schema)
+
+    buffer.seek(0)
+    # Tout est lu en texte puis converti en vectoriel : Polars ne parse pas
+    # nativement les booléens t/f ni les heures de PostgreSQL
+    raw = pl.read_csv(
+        buffer,
+        has_header=False,
+        new_columns=list(schema),
+        schema_overrides={name: pl.Utf8 for name in schema},
+        null_values=r"\N",
+        missing_utf8_is_empty_string=True,
+    )
+    return raw.select(_cast_from_csv(name, dtype) for name, dtype in schema.items())
+
+
+def _read_adbc(query: str, params: Optional[Dict], engine) -> pl.DataFrame:
+    uri = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    with adbc_postgresql.connect(uri) as conn, conn.cursor() as cursor:
+        # ADBC attend des paramètres positionnels : on lie côté client
+        with engine.connect() as sa_conn:
+            pg_cursor = sa_conn.connection.cursor()
+            try:
+                sql = _render_sql(query, params, engine, pg_cursor)
+            finally:
+                pg_cursor.close()
+        cursor.execute(sql)
+        return pl.from_arrow(cursor.fetch_arrow_table())
+
+
+def read_database_arrow(
+    query: str,
+    engine,
+    params: Optional[Dict] = None,
+) -> pl.DataFrame:
+    """
+    Exécute une requête SELECT et retourne un DataFrame Polars, en
+    privilégiant un chemin Arrow natif (voir docstring du module).
+
+    Args:
+        query: requête SELECT, avec paramètres nommés (:param)
+        engine: engine SQLAlchemy
+        params: valeurs des paramètres
+    """
+    t0 = time.perf_counter()
+    # Un ';' final est invalide dans COPY (...) et dans une sous-requête
+    query = query.strip().rstrip(";")
+
+    if _is_postgres(engine):
+        readers = [("copy", _read_copy, _COPY_ERRORS)]
+        if ADBC_AVAILABLE:
+            readers.insert(0, ("adbc", _read_adbc, _ADBC_ERRORS))
+
+        for name, reader, fallback_errors in readers:
+            try:
+                df = reader(query, params, engine)
+            except fallback_errors as e:
+                LOGGER.warning("Lecture Arrow impossible, chemin suivant", path=name, error=repr(e))
+                continue
+            LOGGER.debug(
+                "Lecture DB",
+                path=name,
+                rows=len(df),
+                duration_s=round(time.perf_counter() - t0, 3),
+            )
+            return df
+
+    return pl.read_database(
+        text(query),
+        engine,
+        execute_options={"parameters": params or {}},
+    )
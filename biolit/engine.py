@@ -0,0 +1,115 @@
+import atexit
+import os
+import threading
+from collections import defaultdict
+from typing import Optional
+
+import structlog
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+from biolit.sql_metrics import SQL_METRICS_ENABLED, instrument_engine
+
+LOGGER = structlog.get_logger()
+load_dotenv()
+
+# -------------------------
+# Configuration du pool
+# -------------------------
+POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("POSTGRES_POOL_MAX_OVERFLOW", "5"))
+# 0 = pas de timeout
+STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "0"))
+
+_ENGINES: dict[str, Engine] = {}
+_POOL_METRICS: dict[str, dict] = defaultdict(lambda: defaultdict(int))
+_LOCK = threading.Lock()
+
+
+def _register_pool_metrics(engine: Engine, url: str):
+    metrics = _POOL_METRICS[url]
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics["connections_opened"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics["checkouts"] += 1
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics["checkins"] += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics["invalidations"] += 1
+
+
+def get_shared_engine(url: Optional[str] = None) -> Engine:
+    """
+    Engine SQLAlchemy partagé par tout le process (un seul pool par URL).
+
+    Utilisé par biolit et ml : les appels répétés à get_engine()
+    réutilisent les connexions au lieu de recréer un pool à chaque fois.
+    """
+    url = url or os.getenv("POSTGRES_URL")
+    if not url:
+        raise ValueError("Missing POSTGRES_URL")
+
+    with _LOCK:
+        engine = _ENGINES.get(url)
+        if engine is None:
+            connect_args = {}
+            if STATEMENT_TIMEOUT_MS and url.startswith("postgresql"):
+                connect_args["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+
+            engine = create_engine(
+                url,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                connect_args=connect_args,
+            )
+            _register_pool_metrics(engine, url)
+            if SQL_METRICS_ENABLED:
+                instrument_engine(engine)
+            _ENGINES[url] = engine
+            LOGGER.info(
+                "Engine créé",
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                statement_timeout_ms=STATEMENT_TIMEOUT_MS,
+            )
+
+    return engine
+
+
+def get_pool_metrics() -> dict:
+    """Compteurs du pool par engine (checkouts, connexions ouvertes, ...)."""
+    with _LOCK:
+        return {
+            engine.url.render_as_string(hide_password=True): {
+                **_POOL_METRICS[url],
+                "checked_out": engine.pool.checkedout(),
+                "pool_status": engine.pool.status(),
+            }
+            for url, engine in _ENGINES.items()
+        }
+
+
+def dispose_engines():
+    """Ferme proprement tous les pools (appelé automatiquement à la sortie)."""
+    with _LOCK:
+        for url, engine in _ENGINES.items():
+            LOGGER.info(
+                "Engine fermé",
+                url=engine.url.render_as_string(hide_password=True),
+                **_POOL_METRICS[url],
+            )
+            engine.dispose()
+        _ENGINES.clear()
+
+
+atexit.register(dispose_engines)
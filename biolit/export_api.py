@@ -1,27 +1,104 @@
 import polars as pl
 import structlog
 import re
-import requests
 import os
+import codecs
+import datetime
+import functools
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
 from dotenv import load_dotenv
+
+from biolit.api_cache import get_api_json, open_api_request
+
 load_dotenv()
 
 LOGGER = structlog.get_logger()
 
+# Paramètres de la pagination incrémentale (API WordPress)
+API_PAGE_SIZE = int(os.getenv("BIOLIT_API_PAGE_SIZE", "100"))
+API_MAX_WORKERS = int(os.getenv("BIOLIT_API_MAX_WORKERS", "4"))
+API_SINCE_PARAM = os.getenv("BIOLIT_API_SINCE_PARAM", "modified_after")
+# Recouvrement entre deux runs pour ne rien rater autour du watermark
+API_LOOKBACK = datetime.timedelta(days=int(os.getenv("BIOLIT_API_LOOKBACK_DAYS", "2")))
+# Lecture en streaming : taille des lots Polars
+API_BATCH_SIZE = int(os.getenv("BIOLIT_API_BATCH_SIZE", "10000"))
+
 # ------------------------------
 # FETCH API
 # ------------------------------
-def fetch_biolit_from_api():
+def fetch_biolit_from_api(params: Optional[dict] = None, replay: Optional[bool] = None):
     url = os.getenv("BIOLIT_API_URL")
 
-    response = requests.get(url)
-    response.raise_for_status()
-
-    data = response.json()
+    data, _ = get_api_json(url, params, replay=replay)
 
     LOGGER.info("Nombre d'observations récupérées :", value=len(data))
     return data
 
+
+def _fetch_page(url: str, params: dict, replay: Optional[bool] = None) -> tuple[list, Optional[int]]:
+    """Récupère une page de l'API et le nombre total de pages s'il est annoncé."""
+    data, headers = get_api_json(url, params, replay=replay)
+
+    total_pages = headers.get("X-WP-TotalPages")
+    return data, int(total_pages) if total_pages else None
+
+
+def fetch_biolit_incremental(
+    watermark: dict,
+    page_size: int = API_PAGE_SIZE,
+    max_workers: int = API_MAX_WORKERS,
+    replay: Optional[bool] = None,
+) -> list:
+    """
+    Récupère uniquement les observations créées ou modifiées depuis le
+    dernier run (watermark stocké dans Postgres).
+
+    Si l'API annonce le nombre de pages (X-WP-TotalPages), les pages
+    suivantes sont téléchargées en parallèle. Sinon on pagine
+    séquentiellement jusqu'à une page incomplète ou déjà vue.
+    """
+    url = os.getenv("BIOLIT_API_URL")
+    since = watermark["last_run_at"] - API_LOOKBACK
+    base_params = {
+        API_SINCE_PARAM: since.isoformat(timespec="seconds"),
+        "per_page": page_size,
+    }
+
+    first_page, total_pages = _fetch_page(url, {**base_params, "page": 1}, replay)
+    data = list(first_page)
+
+    if total_pages is not None:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pages = pool.map(
+                lambda page: _fetch_page(url, {**base_params, "page": page}, replay)[0],
+                range(2, total_pages + 1),
+            )
+            for page_data in pages:
+                data.extend(page_data)
+    else:
+        seen = {item["id"] for item in first_page}
+        page_data, page = first_page, 2
+        while len(page_data) >= page_size:
+            page_data, _ = _fetch_page(url, {**base_params, "page": page}, replay)
+            new_items = [item for item in page_data if item["id"] not in seen]
+            # L'API ignore la pagination : on a déjà tout
+            if not new_items:
+                break
+            seen.update(item["id"] for item in new_items)
+            data.extend(new_items)
+            page += 1
+
+    LOGGER.info(
+        "Observations récupérées en incrémental",
+        since=since.isoformat(),
+        pages=total_pages,
+        value=len(data),
+    )
+    return data
+
 # ------------------------------
 # RENAME OF COLUMNS
 # ------------------------------
@@ -58,25 +135,243 @@ COLUMN_MAPPING = {
 }
 
 
+# Schéma fixe des lots streamés : champs bruts de l'API, lus en texte puis
+# typés par parse_observations
+RAW_API_SCHEMA = {key: pl.Utf8 for key in COLUMN_MAPPING}
+
+# Schéma cible de la table observations
+OBSERVATION_SCHEMA = {
+    "id_observation": pl.Int64,
+    "date_observation": pl.Datetime,
+    "lien_observation": pl.Utf8,
+    "observateur": pl.Utf8,
+    "url_sortie": pl.Utf8,
+    "espece_identifiee": pl.Utf8,
+    "heure_debut": pl.Time,
+    "heure_fin": pl.Time,
+    "latitude": pl.Float64,
+    "longitude": pl.Float64,
+    "photos": pl.Utf8,
+    "relais": pl.Int64,
+    "id_espece": pl.Int64,
+    "nom_scientifique": pl.Utf8,
+    "nom_commun": pl.Utf8,
+    "categorie_programme": pl.Int64,
+    "programme": pl.Utf8,
+    "validee": pl.Boolean,
+}
+
+# Formats acceptés, essayés dans l'ordre (pas d'inférence coûteuse)
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
+TIME_FORMATS = ["%H:%M:%S", "%H:%M"]
+
+_TYPED_SUFFIX = "__typed"
+
+
+@functools.lru_cache(maxsize=None)
+def _column_name(key: str) -> str:
+    """Nom de colonne cible : mapping si connu, sinon normalisation auto."""
+    return COLUMN_MAPPING.get(key, normalize_column_name(key))
+
+
 # ------------------------------
 # ADAPT API -> PARQUET
 # ------------------------------
 def adapt_api_to_dataframe(data: list) -> pl.DataFrame:
-    rows = []
+    df = pl.DataFrame(data)
 
-    for item in data:
-        new_row = {}
+    # Renommage une seule fois par schéma, pas par ligne
+    return df.rename({key: _column_name(key) for key in df.columns})
 
-        for key, value in item.items():
-            # mapping si connu, sinon normalisation auto
-            new_key = COLUMN_MAPPING.get(key, normalize_column_name(key))
-            new_row[new_key] = value
 
-        rows.append(new_row)
+# ------------------------------
+# TYPAGE + VALIDATION (LAZY)
+# ------------------------------
+def _parse_expr(name: str, dtype: pl.DataType) -> pl.Expr:
+    """Expression de typage d'une colonne brute (texte) vers le schéma cible."""
+    raw = pl.col(name).cast(pl.Utf8).str.strip_chars().replace("", None)
 
-    df = pl.DataFrame(rows)
+    if dtype == pl.Int64:
+        return raw.str.strip_suffix(".0").str.to_integer(strict=False)
+    if dtype == pl.Float64:
+        return raw.cast(pl.Float64, strict=False)
+    if dtype == pl.Datetime:
+        return pl.coalesce(
+            [raw.str.to_datetime(fmt, strict=False) for fmt in DATETIME_FORMATS]
+        )
+    if dtype == pl.Time:
+        return pl.coalesce([raw.str.to_time(fmt, strict=False) for fmt in TIME_FORMATS])
+    if dtype == pl.Boolean:
+        return raw.str.to_lowercase().replace_strict(
+            {"true": True, "false": False}, default=None, return_dtype=pl.Boolean
+        )
+    return pl.col(name).cast(pl.Utf8)
 
-    return df
+
+def _rejection_reason() -> pl.Expr:
+    """Première règle de validation non respectée (null si la ligne est valide)."""
+    def typed(name: str) -> pl.Expr:
+        return pl.col(f"{name}{_TYPED_SUFFIX}")
+
+    return (
+        pl.when(typed("id_observation").is_null())
+        .then(pl.lit("id_observation invalide"))
+        .when(~typed("latitude").is_between(-90, 90))
+        .then(pl.lit("latitude hors bornes"))
+        .when(~typed("longitude").is_between(-180, 180))
+        .then(pl.lit("longitude hors bornes"))
+        .when(
+            typed("date_observation").is_null()
+            & pl.col("date_observation").cast(pl.Utf8).str.strip_chars().ne("")
+        )
+        .then(pl.lit("date_observation illisible"))
+        .otherwise(None)
+        .alias("rejection_reason")
+    )
+
+
+def build_observation_plan(frame: pl.DataFrame | pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Plan lazy unique : typage explicite selon OBSERVATION_SCHEMA
+    et calcul du motif de rejet, en une seule passe sur les données.
+    """
+    lf = frame.lazy()
+    missing = [
+        pl.lit(None, dtype=pl.Utf8).alias(name)
+        for name in OBSERVATION_SCHEMA
+        if name not in lf.collect_schema().names()
+    ]
+
+    return (
+        lf.with_columns(missing)
+        .with_columns(
+            _parse_expr(name, dtype).alias(f"{name}{_TYPED_SUFFIX}")
+            for name, dtype in OBSERVATION_SCHEMA.items()
+        )
+        .with_columns(_rejection_reason())
+    )
+
+
+def parse_observations(
+    frame: pl.DataFrame | pl.LazyFrame,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Type et valide des observations (colonnes déjà renommées).
+
+    Retourne:
+        (observations typées prêtes pour Postgres,
+         lignes rejetées avec leurs valeurs brutes et rejection_reason)
+    """
+    plan = build_observation_plan(frame)
+    reason = pl.col("rejection_reason")
+
+    valid = plan.filter(reason.is_null()).select(
+        pl.col(f"{name}{_TYPED_SUFFIX}").alias(name) for name in OBSERVATION_SCHEMA
+    )
+    rejected = plan.filter(reason.is_not_null()).select(
+        *OBSERVATION_SCHEMA, "rejection_reason"
+    )
+    valid, rejected = pl.collect_all([valid, rejected])
+
+    if not rejected.is_empty():
+        LOGGER.warning(
+            "Observations rejetées",
+            count=len(rejected),
+            reasons=rejected["rejection_reason"].value_counts().rows(),
+        )
+    return valid, rejected
+
+
+# ------------------------------
+# STREAMING API -> LOTS POLARS
+# ------------------------------
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Décode au fil de l'eau un tableau JSON reçu par morceaux et
+    retourne ses éléments un par un, sans charger tout le corps en mémoire.
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = False
+
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            buffer += utf8.decode(b"", final=True)
+        else:
+            buffer += utf8.decode(chunk)
+
+        while True:
+            # On saute les séparateurs entre éléments
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("La réponse de l'API n'est pas un tableau JSON")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                # On consomme la fin du flux (publication du snapshot en cache)
+                for _ in chunks:
+                    pass
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Élément incomplet : on attend le chunk suivant
+                if chunk is None:
+                    raise
+                break
+            # Un nombre peut être coupé par la frontière du chunk
+            if end == len(buffer) and chunk is not None:
+                break
+            yield item
+            pos = end
+
+        buffer = buffer[pos:]
+        pos = 0
+
+    if started:
+        raise ValueError("Tableau JSON de l'API tronqué")
+
+
+def iter_observation_batches(
+    items: Iterable[dict],
+    batch_size: int = API_BATCH_SIZE,
+) -> Iterator[pl.DataFrame]:
+    """
+    Regroupe les observations brutes en lots Polars au schéma fixe
+    (colonnes de COLUMN_MAPPING, déjà renommées).
+    """
+    renaming = {key: _column_name(key) for key in RAW_API_SCHEMA}
+
+    for batch in itertools.batched(items, batch_size):
+        yield pl.from_dicts(batch, schema=RAW_API_SCHEMA, strict=False).rename(renaming)
+
+
+def stream_biolit_from_api(
+    batch_size: int = API_BATCH_SIZE,
+    replay: Optional[bool] = None,
+) -> Iterator[pl.DataFrame]:
+    """
+    Télécharge l'historique complet en streaming : la mémoire reste
+    proportionnelle à un lot, pas à l'historique.
+    La réponse brute passe par le cache disque (voir biolit.api_cache).
+    """
+    url = os.getenv("BIOLIT_API_URL")
+    n_rows = 0
+
+    chunks, _ = open_api_request(url, replay=replay)
+    for batch in iter_observation_batches(iter_json_array(chunks), batch_size):
+        n_rows += len(batch)
+        yield batch
+
+    LOGGER.info("Nombre d'observations récupérées :", value=n_rows)
 
 
 # ------------------------------
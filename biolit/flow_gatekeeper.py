@@ -2,6 +2,9 @@ import polars as pl
 import os
 from dotenv import load_dotenv
 
+from biolit.bulk_load import copy_rows, staging_name
+from biolit.sql_metrics import execute_recorded
+
 load_dotenv()
 
 FORCE_REPROCESS = os.getenv("FORCE_REPROCESS", "false").lower() == "true"
@@ -9,28 +12,73 @@ FORCE_REPROCESS = os.getenv("FORCE_REPROCESS", "false").lower() == "true"
 # =========================
 # HELPERS DB
 # =========================
-def get_already_cropped_observations(engine) -> pl.DataFrame:
+def select_existing_ids(
+    engine,
+    ids: pl.Series,
+    exists_query: str,
+    column: str = "id_observation",
+    sql_type: str = "BIGINT",
+) -> pl.DataFrame:
+    """
+    Anti-jointure côté serveur : envoie les ids candidats dans une table
+    temporaire (COPY) et ne récupère que ceux déjà présents en base.
+    Le coût dépend du lot candidat, pas de la taille de l'historique.
+
+    exists_query est la sous-requête du EXISTS, où les candidats sont
+    accessibles via l'alias c (ex: SELECT 1 FROM ml_crops m
+    WHERE m.id_observation = c.id_observation).
+    """
+    ids = ids.drop_nulls().unique().alias(column)
+    if ids.is_empty():
+        return ids.to_frame()
+
+    staging = staging_name("gatekeeper_ids")
+    select_query = f"""
+        SELECT c.{column}
+        FROM {staging} c
+        WHERE EXISTS ({exists_query})
+    """
+
+    # Curseur brut : les requêtes sont comptées à la main dans les métriques SQL
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            execute_recorded(cursor, f"CREATE TEMP TABLE {staging} ({column} {sql_type}) ON COMMIT DROP")
+            copy_rows(cursor, staging, ids.to_frame())
+            execute_recorded(cursor, select_query)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    return pl.DataFrame({column: [r[0] for r in rows]}, schema={column: ids.dtype})
+
+
+def _observation_ids(df: pl.DataFrame) -> pl.Series:
+    return df["id_observation"].cast(pl.Int64, strict=False)
+
+
+def get_already_cropped_observations(engine, ids: pl.Series) -> pl.DataFrame:
     """
-    Récupère les identifiants des observations déjà passées par l'étape de crop (ML1).
+    Parmi les ids candidats, ceux déjà passés par l'étape de crop (ML1).
     On prend en compte à la fois :
     - les observations avec crops détectés (ml_crops)
     - les observations sans détection (ml_no_crops)
     """
-    query = """
-        SELECT DISTINCT CAST(split_part(id_crops,'_',1) AS BIGINT) AS id_observation FROM ml_crops
-        UNION
-        SELECT DISTINCT CAST(id_observation AS BIGINT) FROM ml_no_crops
-    """
-    return pl.read_database(query, engine)
+    return select_existing_ids(engine, ids, """
+        SELECT 1 FROM ml_crops m WHERE m.id_observation = c.id_observation
+        UNION ALL
+        SELECT 1 FROM ml_no_crops n WHERE n.id_observation = c.id_observation
+    """)
 
 
-def get_already_classified_observations(engine) -> pl.DataFrame:
+def get_already_classified_observations(engine, ids: pl.Series) -> pl.DataFrame:
     """
-    Récupère les identifiants des observations déjà passées par l'étape de classification (ML2).
+    Parmi les ids candidats, ceux déjà passés par l'étape de classification (ML2).
 
     """
-    query = "SELECT DISTINCT id_observation FROM ml_taxonomy"
-    return pl.read_database(query, engine)
+    return select_existing_ids(engine, ids, """
+        SELECT 1 FROM ml_taxonomy t WHERE t.id_observation = c.id_observation
+    """)
 
 
 # =========================
@@ -46,12 +94,14 @@ def filter_observations_for_crop(df: pl.DataFrame, engine) -> pl.DataFrame:
     if FORCE_REPROCESS:
         return df
 
-    processed = get_already_cropped_observations(engine)
+    processed = get_already_cropped_observations(engine, _observation_ids(df))
 
     if processed.is_empty():
         return df
 
-    return df.filter(~pl.col("id_observation").is_in(processed["id_observation"]))
+    return df.filter(
+        ~pl.col("id_observation").cast(pl.Int64, strict=False).is_in(processed["id_observation"].implode())
+    )
 
 
 def filter_crops_for_classification(df_crops: pl.DataFrame, engine) -> pl.DataFrame:
@@ -65,12 +115,14 @@ def filter_crops_for_classification(df_crops: pl.DataFrame, engine) -> pl.DataFr
     if FORCE_REPROCESS:
         return df_crops
 
-    classified = get_already_classified_observations(engine)
+    classified = get_already_classified_observations(engine, _observation_ids(df_crops))
 
     if classified.is_empty():
         return df_crops
 
-    return df_crops.filter(~pl.col("id_observation").is_in(classified["id_observation"]))
+    return df_crops.filter(
+        ~pl.col("id_observation").cast(pl.Int64, strict=False).is_in(classified["id_observation"].implode())
+    )
 
 
 def filter_processed_no_crop_annotations( df: pl.DataFrame, engine) -> pl.DataFrame:
@@ -82,30 +134,11 @@ def filter_processed_no_crop_annotations( df: pl.DataFrame, engine) -> pl.DataFr
         - taxonomy_queue (id_crops)
         """
         # =========================
-        # Récupération BD finale
-        # =========================
-        query_finale = """
-            SELECT id_observation
-            FROM db_finale
-        """
-
-        df_finale = pl.read_database(
-            query=query_finale,
-            connection=engine
-        )
-
-        # =========================
-        # Récupération taxonomy queue
+        # Observations déjà en BD finale
         # =========================
-        query_taxo = """
-            SELECT crops_id
-            FROM taxonomy_queue
-        """
-
-        df_taxo = pl.read_database(
-            query=query_taxo,
-            connection=engine
-        )
+        df_finale = select_existing_ids(engine, _observation_ids(df), """
+            SELECT 1 FROM db_finale f WHERE f.id_observation = c.id_observation
+        """)
 
         # =========================
         # Filtre observations finales
@@ -113,43 +146,43 @@ def filter_processed_no_crop_annotations( df: pl.DataFrame, engine) -> pl.DataFr
         if not df_finale.is_empty():
 
             df = df.filter(
-                ~pl.col("id_observation").is_in(
-                    df_finale["id_observation"]
+                ~pl.col("id_observation").cast(pl.Int64, strict=False).is_in(
+                    df_finale["id_observation"].implode()
                 )
             )
 
         # =========================
         # Filtre crops déjà envoyés ML
         # =========================
-        if (
-            "crops_id" in df.columns
-            and not df_taxo.is_empty()
-        ):
+        if "id_crops" in df.columns:
+
+            df_taxo = select_existing_ids(
+                engine,
+                df["id_crops"].cast(pl.Utf8),
+                "SELECT 1 FROM taxonomy_queue q WHERE q.id_crops = c.id_crops",
+                column="id_crops",
+                sql_type="TEXT",
+            )
 
-            df = df.filter(
-                ~pl.col("crops_id").is_in(
-                    df_taxo["crops_id"]
+            if not df_taxo.is_empty():
+                df = df.filter(
+                    ~pl.col("id_crops").cast(pl.Utf8).is_in(
+                        df_taxo["id_crops"].implode()
+                    )
                 )
-            )
 
         return df
 
 def filter_processed_crop_annotations(df: pl.DataFrame,engine):
-        query = """
-            SELECT id_observation
-            FROM db_finale
-        """
-
-        existing = pl.read_database(
-            query=query,
-            connection=engine
-        )
+        existing = select_existing_ids(engine, _observation_ids(df), """
+            SELECT 1 FROM db_finale f WHERE f.id_observation = c.id_observation
+        """)
 
         if existing.is_empty():
             return df
 
         return df.filter(
-            ~pl.col("id_observation").is_in(
-                existing["id_observation"]
+            ~pl.col("id_observation").cast(pl.Int64, strict=False).is_in(
+                existing["id_observation"].implode()
             )
-        )
\ No newline at end of file
+        )
@@ -1,56 +1,142 @@
 import geopandas as gpd
-from shapely.geometry import Point
-from typing import Tuple, Optional
+from shapely.geometry import Point, box
+from typing import Callable, Iterator, Tuple, Optional
+import numpy as np
 import pandas as pd
 import requests
 import structlog
-import io
+import hashlib
+import json
+import os
+from dotenv import load_dotenv
 from io import BytesIO
 from pathlib import Path
 import tempfile
 import zipfile
 
 from biolit import DATA_GOUV_INFO_COMMUNES_URL, DATA_GOUV_CONTOUR_COMMUNES_URL, WORLD_COAST_LINES_URL
-from biolit.create_table import load_observations_from_db
+from biolit.create_table import DB_CHUNK_SIZE, iter_observations_from_db
+from biolit.geoloc_cache import (
+    clear_geoloc_cache,
+    enrich_with_cache,
+    log_cache_stats,
+    new_cache_stats,
+    prune_geoloc_cache,
+)
+from biolit.reference_cache import load_reference_layer, reference_etag
 from biolit.s3 import (
     create_s3_client,
     _check_file_existence_s3,
-    _read_file_s3
 )
 
 LOGGER = structlog.get_logger()
+load_dotenv()
+
+
+# Zone d'intérêt du trait de côte : bbox EPSG:4326 "minx,miny,maxx,maxy"
+# (par défaut France métropolitaine et Corse), marge et tolérance en mètres
+COASTLINE_AOI_BBOX = tuple(
+    float(v) for v in os.getenv("COASTLINE_AOI_BBOX", "-6.5,41.0,10.0,51.5").split(",")
+)
+COASTLINE_AOI_MARGIN_M = float(os.getenv("COASTLINE_AOI_MARGIN_M", "30000"))
+COASTLINE_SIMPLIFY_TOLERANCE_M = float(os.getenv("COASTLINE_SIMPLIFY_TOLERANCE_M", "50"))
+
+# Couches de référence sur S3
+REFERENCE_BUCKET = "biolit-uploads"
+COMMUNES_KEY = "geoloc/data_gouv/geometry_communes.parquet"
+INFO_COMMUNES_KEY = "geoloc/data_gouv/info_communes.parquet"
+COASTLINES_KEY = "geoloc/osm/coastlines.parquet"
+
+# Seules colonnes utiles à l'enrichissement (projection côté SQL)
+GEOLOC_COLUMNS = ["id_observation", "latitude", "longitude"]
+
+# Observations jamais enrichies, ou dont les coordonnées ont changé
+# depuis leur enrichissement (clé primaire de observations_enriched)
+TO_ENRICH_WHERE = """
+    NOT EXISTS (
+        SELECT 1 FROM observations_enriched e
+        WHERE e.id_observation = observations.id_observation
+        AND e.latitude IS NOT DISTINCT FROM observations.latitude
+        AND e.longitude IS NOT DISTINCT FROM observations.longitude
+    )
+"""
 
 
-def geoloc_enrichie_data_biolit_db(engine):
+def geoloc_enrichie_data_biolit_db(engine, recompute_all: bool = False):
     """
     Pipeline :
     DB → enrichissement → dataframe
     """
-
-    # 1. Load depuis PostgreSQL
-    df_biolit = get_biolit_df_from_db(engine)
-
-    # 2. Enrichissement commune
-    df = get_info_nearest_commune(df_biolit)
-
-    # 3. Enrichissement littoral
-    df_coastal = get_info_distance_to_coast(df, 8000)
-
-    LOGGER.info("Geoloc enrichment done", count=len(df_coastal))
-
-    return df_coastal
+    chunks = list(iter_geoloc_enrichie_data_biolit_db(engine, recompute_all=recompute_all))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+def iter_geoloc_enrichie_data_biolit_db(
+    engine,
+    chunk_size: int = DB_CHUNK_SIZE,
+    recompute_all: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """
+    Pipeline par chunks, en mémoire constante :
+    DB (curseur serveur) → enrichissement → dataframe enrichi par chunk
+
+    Seules les observations nouvelles ou déplacées sont enrichies, sauf
+    recompute_all (mise à jour des couches de référence : le cache par
+    coordonnées est alors vidé).
+    Les coordonnées déjà vues sont relues dans geoloc_cache ; les couches
+    de référence ne sont chargées qu'au premier calcul nécessaire.
+    """
+    where = None if recompute_all else TO_ENRICH_WHERE
+    if recompute_all:
+        clear_geoloc_cache(engine)
+    layers = None
+    version = None
+    stats = new_cache_stats()
+
+    def enrich(points: pd.DataFrame) -> pd.DataFrame:
+        nonlocal layers
+        if layers is None:
+            layers = get_geometry_communes(), get_info_communes(), get_trace_littoral_aoi()
+        communes, info_communes, coast_gdf = layers
+
+        # 2. Enrichissement commune
+        df = get_info_nearest_commune(points, communes, info_communes)
+
+        # 3. Enrichissement littoral (couche mondiale hors zone d'intérêt)
+        return get_info_distance_to_coast_with_fallback(df, 8000, coast_gdf)
+
+    count = 0
+    for df_biolit in iter_biolit_df_from_db(engine, chunk_size, where=where):
+        if version is None:
+            version = geoloc_layers_version()
+            prune_geoloc_cache(engine, version)
+        df_coastal = enrich_with_cache(engine, df_biolit, enrich, stats=stats, version=version)
+
+        count += len(df_coastal)
+        yield df_coastal
+
+    log_cache_stats(stats)
+    LOGGER.info("Geoloc enrichment done", count=count, recompute_all=recompute_all)
 
 def get_biolit_df_from_db(engine) -> pd.DataFrame:
-    df = load_observations_from_db(engine)
+    chunks = list(iter_biolit_df_from_db(engine))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=GEOLOC_COLUMNS)
 
-    LOGGER.info("biolit df loaded from DB", count=len(df))
+def iter_biolit_df_from_db(
+    engine,
+    chunk_size: int = DB_CHUNK_SIZE,
+    where: Optional[str] = None,
+) -> Iterator[pd.DataFrame]:
+    for df in iter_observations_from_db(engine, columns=GEOLOC_COLUMNS, where=where, chunk_size=chunk_size):
+        LOGGER.info("biolit df chunk loaded from DB", count=len(df))
+        yield df.to_pandas()
 
-    return df.to_pandas()
+def _read_geoparquet(path: Path) -> gpd.GeoDataFrame:
+    return gpd.read_parquet(path, memory_map=True)
 
 def get_geometry_communes() -> gpd.GeoDataFrame:
     client = create_s3_client()
-    key = "geoloc/data_gouv/geometry_communes.parquet"
-    bucket_name = "biolit-uploads"
+    key = COMMUNES_KEY
+    bucket_name = REFERENCE_BUCKET
     url = DATA_GOUV_CONTOUR_COMMUNES_URL
 
     if not _check_file_existence_s3(client, bucket_name, key):
@@ -82,16 +168,15 @@ def get_geometry_communes() -> gpd.GeoDataFrame:
         )
         LOGGER.info("Parquet uploaded", path=f"s3://{bucket_name}/{key}")
 
-    data = _read_file_s3(client, bucket_name, key)
-    gdf = gpd.read_parquet(io.BytesIO(data))
+    gdf = load_reference_layer(client, bucket_name, key, _read_geoparquet)
 
     LOGGER.info("geometry_communes_loaded", count=len(gdf))
     return gdf
 
 def get_info_communes() -> pd.DataFrame:
     client = create_s3_client()
-    key = "geoloc/data_gouv/info_communes.parquet"
-    bucket_name = "biolit-uploads"
+    key = INFO_COMMUNES_KEY
+    bucket_name = REFERENCE_BUCKET
     url = DATA_GOUV_INFO_COMMUNES_URL
 
     if not _check_file_existence_s3(client, bucket_name, key):
@@ -130,18 +215,22 @@ def get_info_communes() -> pd.DataFrame:
 
         LOGGER.info("Parquet uploaded", path=f"s3://{bucket_name}/{key}")
 
-    data = _read_file_s3(client, bucket_name, key)
-    df = pd.read_parquet(io.BytesIO(data))
-
-    df = df[["code_insee", "code_postal", "reg_nom", "dep_nom"]]
+    df = load_reference_layer(
+        client,
+        bucket_name,
+        key,
+        lambda path: pd.read_parquet(
+            path, columns=["code_insee", "code_postal", "reg_nom", "dep_nom"], memory_map=True
+        ),
+    )
 
     LOGGER.info("info_communes_loaded", count=len(df))
     return df
 
 def get_trace_littoral() -> gpd.GeoDataFrame:
     client = create_s3_client()
-    bucket_name = "biolit-uploads"
-    key = "geoloc/osm/coastlines.parquet"
+    bucket_name = REFERENCE_BUCKET
+    key = COASTLINES_KEY
     url = WORLD_COAST_LINES_URL
 
     if not _check_file_existence_s3(client, bucket_name, key):
@@ -176,13 +265,142 @@ def get_trace_littoral() -> gpd.GeoDataFrame:
 
         LOGGER.info("Parquet uploaded", path=f"s3://{bucket_name}/{key}")
 
-    data = _read_file_s3(client, bucket_name, key)
+    return load_reference_layer(client, bucket_name, key, _read_geoparquet)
+
+def build_coastline_aoi(
+    coast_gdf: gpd.GeoDataFrame,
+    bbox: Tuple[float, float, float, float] = COASTLINE_AOI_BBOX,
+    margin_m: float = COASTLINE_AOI_MARGIN_M,
+    tolerance_m: float = COASTLINE_SIMPLIFY_TOLERANCE_M,
+) -> gpd.GeoDataFrame:
+    """
+    Trait de côte découpé sur la zone d'intérêt (bbox en EPSG:4326,
+    élargie de margin_m) puis simplifié (Douglas-Peucker).
+
+    Chaque sommet d'origine reste à moins de tolerance_m de la ligne
+    simplifiée : une distance au trait de côte varie donc d'au plus
+    tolerance_m, à comparer au seuil is_coastal de 8 km. La marge doit
+    dépasser le rayon de recherche (20 km) pour que les points en bord
+    de zone trouvent la même côte que sur la couche mondiale.
+    """
+    zone = gpd.GeoSeries([box(*bbox).segmentize(0.1)], crs="EPSG:4326").to_crs(coast_gdf.crs)
+    minx, miny, maxx, maxy = zone.total_bounds
+    envelope = box(minx - margin_m, miny - margin_m, maxx + margin_m, maxy + margin_m)
+
+    clipped = coast_gdf.iloc[coast_gdf.sindex.query(envelope)]
+    clipped = clipped.set_geometry(
+        clipped.geometry.clip_by_rect(*envelope.bounds).simplify(tolerance_m)
+    )
+    clipped = clipped[~clipped.geometry.is_empty].reset_index(drop=True)
+
+    LOGGER.info(
+        "Trait de côte découpé et simplifié",
+        segments_in=len(coast_gdf),
+        segments_out=len(clipped),
+        tolerance_m=tolerance_m,
+    )
+    return clipped
+
+def coastline_aoi_key() -> str:
+    """Clé S3 du trait de côte découpé, dérivée des paramètres de découpe."""
+    params = json.dumps(
+        [COASTLINE_AOI_BBOX, COASTLINE_AOI_MARGIN_M, COASTLINE_SIMPLIFY_TOLERANCE_M]
+    )
+    tag = hashlib.sha256(params.encode()).hexdigest()[:12]
+    return f"geoloc/osm/coastlines_aoi_{tag}.parquet"
+
+def geoloc_layers_version() -> str:
+    """
+    Version des couches de référence de l'enrichissement (ETags S3),
+    stockée avec chaque entrée du cache géoloc : une couche mise à jour
+    invalide le cache sans --recompute-all. Une couche absente de S3 est
+    d'abord construite.
+    """
+    client = create_s3_client()
+    builders = {
+        COMMUNES_KEY: get_geometry_communes,
+        INFO_COMMUNES_KEY: get_info_communes,
+        coastline_aoi_key(): get_trace_littoral_aoi,
+        COASTLINES_KEY: get_trace_littoral,
+    }
+    etags = []
+    for key, build in builders.items():
+        if not _check_file_existence_s3(client, REFERENCE_BUCKET, key):
+            build()
+        etags.append(reference_etag(client, REFERENCE_BUCKET, key))
+    return hashlib.sha256(json.dumps(etags).encode()).hexdigest()[:12]
+
+def get_trace_littoral_aoi(rebuild: bool = False) -> gpd.GeoDataFrame:
+    """
+    Trait de côte de la zone d'intérêt (GeoParquet compact), construit
+    depuis la couche mondiale s'il n'existe pas encore pour ces paramètres.
+    La clé S3 dépend des paramètres : les modifier produit un nouvel artefact.
+    """
+    client = create_s3_client()
+    bucket_name = REFERENCE_BUCKET
+    key = coastline_aoi_key()
+
+    if rebuild or not _check_file_existence_s3(client, bucket_name, key):
+        gdf = build_coastline_aoi(get_trace_littoral())
+
+        buffer = BytesIO()
+        gdf.to_parquet(buffer, compression="zstd")
+        buffer.seek(0)
+
+        client.put_object(
+            Body=buffer,
+            Bucket=bucket_name,
+            Key=key,
+            ContentLength=buffer.getbuffer().nbytes,
+        )
+
+        LOGGER.info("Parquet uploaded", path=f"s3://{bucket_name}/{key}")
+
+    return load_reference_layer(client, bucket_name, key, _read_geoparquet)
 
-    return gpd.read_parquet(io.BytesIO(data))
+def nearest_geometries(
+    points: gpd.GeoSeries,
+    layer: gpd.GeoDataFrame,
+    max_distance: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Géométrie la plus proche de chaque point, en une seule requête sur
+    l'index spatial (STRtree) de la couche.
+
+    max_distance est un rayon exact. Les versions point par point
+    (distance_to_communes, distance_to_coast) filtrent sur la bbox du
+    cercle : elles trouvent aussi des géométries entre max_distance et
+    ~1,41 × max_distance (coin du carré), ignorées ici.
+
+    Retourne:
+        (positions dans layer, distances) alignés sur points ;
+        -1 / NaN quand rien n'est trouvé à moins de max_distance
+        (ou pour un point sans coordonnées)
+    """
+    positions = np.full(len(points), -1, dtype=np.int64)
+    distances = np.full(len(points), np.nan)
+
+    # Les points POINT (NaN NaN) font échouer la requête GEOS
+    valid = np.flatnonzero(
+        (~points.is_empty & np.isfinite(points.x) & np.isfinite(points.y)).to_numpy()
+    )
+    if not len(valid):
+        return positions, distances
+
+    (input_idx, tree_idx), dist = layer.sindex.nearest(
+        points.to_numpy()[valid],
+        return_all=False,
+        max_distance=max_distance,
+        return_distance=True,
+    )
+    positions[valid[input_idx]] = tree_idx
+    distances[valid[input_idx]] = dist
+    return positions, distances
 
 def distance_to_communes(point: Point, communes_gdf: gpd.GeoDataFrame, sindex, search_radius: float = 20000) -> Tuple[Optional[float], Optional[str], Optional[str]]:
     """
     Fonction permettant de déterminer le polygon le plus proche du point
+    (version point par point, gardée comme référence : voir nearest_geometries)
     """
     candidate_idx = list(
         sindex.intersection(point.buffer(search_radius).bounds)
@@ -200,9 +418,16 @@ def distance_to_communes(point: Point, communes_gdf: gpd.GeoDataFrame, sindex, s
         communes_gdf.loc[min_idx, "code_insee"]
     )
 
-def get_info_nearest_commune(frame: pd.DataFrame) -> pd.DataFrame:
+def get_info_nearest_commune(
+    frame: pd.DataFrame,
+    communes: Optional[gpd.GeoDataFrame] = None,
+    info_communes: Optional[pd.DataFrame] = None,
+    search_radius: float = 20000,
+) -> pd.DataFrame:
     """
     Fonction permettant d'attribuer à un point Biolit la commune la plus proche + info departement / region
+    Les couches communes / info_communes sont chargées si non fournies.
+    Au-delà de search_radius (m), aucune commune n'est attribuée.
     """
     # Points DB Biolit
     biolit_df = frame
@@ -213,21 +438,23 @@ def get_info_nearest_commune(frame: pd.DataFrame) -> pd.DataFrame:
     ).to_crs(epsg=2154)
 
     # Information Géometrie Communes
-    communes = get_geometry_communes()
-    sindex = communes.sindex
-
-    # Recherche de la commune la plus proche
-    results = gdf.geometry.apply(
-        lambda p: distance_to_communes(p, communes, sindex, search_radius=20000)
-    )
-    gdf["distance_commune_m"] = results.apply(lambda x: x[0])
-    gdf["nearest_commune"] = results.apply(lambda x: x[1])
-    gdf["code_insee"] = results.apply(lambda x: x[2])
+    if communes is None:
+        communes = get_geometry_communes()
+
+    # Recherche de la commune la plus proche, en une requête sur tous les points
+    idx, distances = nearest_geometries(gdf.geometry, communes, max_distance=search_radius)
+    found = idx >= 0
+    gdf["distance_commune_m"] = distances
+    for source, target in (("nom_communes", "nearest_commune"), ("code_insee", "code_insee")):
+        values = np.full(len(gdf), None, dtype=object)
+        values[found] = communes[source].to_numpy()[idx[found]]
+        gdf[target] = values
 
     df_export = gdf.drop(columns="geometry")
 
     # Informations sur la commune la plus proche
-    info_communes = get_info_communes()
+    if info_communes is None:
+        info_communes = get_info_communes()
 
     df_export = df_export.merge(
         info_communes,
@@ -239,7 +466,10 @@ def get_info_nearest_commune(frame: pd.DataFrame) -> pd.DataFrame:
     return df_export
 
 def distance_to_coast(point: Point, coast_gdf: gpd.GeoDataFrame, sindex, search_radius: float = 20000) -> Optional[float]:
-    """ Fonction de Calcul de distance entre le point et la ligne de côte """
+    """
+    Fonction de Calcul de distance entre le point et la ligne de côte
+    (version point par point, gardée comme référence : voir nearest_geometries)
+    """
     candidate_idx = list(
         sindex.intersection(point.buffer(search_radius).bounds)
     )
@@ -250,21 +480,29 @@ def distance_to_coast(point: Point, coast_gdf: gpd.GeoDataFrame, sindex, search_
     candidates = coast_gdf.iloc[candidate_idx]
     return candidates.distance(point).min()
 
-def get_info_distance_to_coast(frame: pd.DataFrame, distance_max: float = 8000) -> pd.DataFrame:
+def get_info_distance_to_coast(
+    frame: pd.DataFrame,
+    distance_max: float = 8000,
+    coast_gdf: Optional[gpd.GeoDataFrame] = None,
+    search_radius: float = 20000,
+) -> pd.DataFrame:
+    """
+    Distance (m) de chaque point au trait de côte le plus proche, en une
+    requête sur tous les points ; NaN au-delà de search_radius (rayon
+    exact : l'ancien calcul par bbox donnait encore une distance entre
+    20 et ~28 km, voir nearest_geometries). Sans effet sur is_coastal
+    tant que distance_max <= search_radius.
+    is_coastal : distance <= distance_max.
+    """
     # Récupération Tracé Littoral
-    coast_gdf = get_trace_littoral()
-    coast_sindex = coast_gdf.sindex
+    if coast_gdf is None:
+        coast_gdf = get_trace_littoral_aoi()
 
     # Points Biolit
     biolit_df = frame
     gdf = gpd.GeoDataFrame(biolit_df, geometry=gpd.points_from_xy(biolit_df["longitude"], biolit_df["latitude"]), crs="EPSG:4326").to_crs(epsg=2154)
-    distances = []
 
-    for p in gdf.geometry:
-        d = distance_to_coast(p, coast_gdf, coast_sindex, search_radius=20000)
-        distances.append(d)
-
-    gdf["distance_to_coast"] = distances
+    _, gdf["distance_to_coast"] = nearest_geometries(gdf.geometry, coast_gdf, max_distance=search_radius)
 
     gdf["is_coastal"] = (
         gdf["distance_to_coast"].notna()
@@ -274,4 +512,34 @@ def get_info_distance_to_coast(frame: pd.DataFrame, distance_max: float = 8000)
     gdf_export = gdf.drop(columns="geometry", errors="ignore")
 
     LOGGER.info("Biolit Data Points enriched with distance to coast", nb_not_coastal = (~gdf_export["is_coastal"]).sum(), nb_coastal = gdf_export["is_coastal"].sum())
-    return gdf_export
\ No newline at end of file
+    return gdf_export
+
+def in_coastline_aoi(
+    frame: pd.DataFrame,
+    bbox: Tuple[float, float, float, float] = COASTLINE_AOI_BBOX,
+) -> pd.Series:
+    """Points (longitude / latitude) dans la zone d'intérêt du trait de côte découpé."""
+    minx, miny, maxx, maxy = bbox
+    return frame["longitude"].between(minx, maxx) & frame["latitude"].between(miny, maxy)
+
+def get_info_distance_to_coast_with_fallback(
+    frame: pd.DataFrame,
+    distance_max: float = 8000,
+    coast_aoi_gdf: Optional[gpd.GeoDataFrame] = None,
+    get_full_coast: Callable[[], gpd.GeoDataFrame] = get_trace_littoral,
+    bbox: Tuple[float, float, float, float] = COASTLINE_AOI_BBOX,
+) -> pd.DataFrame:
+    """
+    get_info_distance_to_coast avec le trait de côte découpé pour les
+    points de la zone d'intérêt, et la couche mondiale (chargée seulement
+    si nécessaire) pour les autres : outre-mer, points hors bbox.
+    """
+    inside = in_coastline_aoi(frame, bbox)
+    if inside.all():
+        return get_info_distance_to_coast(frame, distance_max, coast_aoi_gdf)
+
+    LOGGER.info("Points hors zone d'intérêt : couche mondiale du trait de côte", count=int((~inside).sum()))
+    parts = [get_info_distance_to_coast(frame[~inside], distance_max, get_full_coast())]
+    if inside.any():
+        parts.append(get_info_distance_to_coast(frame[inside], distance_max, coast_aoi_gdf))
+    return pd.concat(parts).loc[frame.index]
@@ -0,0 +1,188 @@
+"""
+Cache de l'enrichissement géographique, par coordonnées arrondies.
+
+Les observations Biolit se concentrent sur quelques sites (relais) et des
+points GPS répétés : l'enrichissement (commune la plus proche, distance à
+la côte) est calculé une seule fois par coordonnée arrondie à
+GEOLOC_CACHE_PRECISION décimales (5 par défaut, ~1 m), puis relu dans la
+table geoloc_cache.
+
+Le calcul est fait sur la coordonnée arrondie elle-même : une entrée du
+cache ne dépend que de sa clé, pas de l'observation qui l'a remplie. La
+clé contient aussi la version des couches de référence (layers_version) :
+une couche mise à jour rend les anciennes entrées inutilisables.
+"""
+
+import os
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import structlog
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from biolit.bulk_load import copy_into_table
+from biolit.db_read import read_database_arrow
+
+LOGGER = structlog.get_logger()
+load_dotenv()
+
+GEOLOC_CACHE_PRECISION = int(os.getenv("GEOLOC_CACHE_PRECISION", "5"))
+
+CACHED_COLUMNS = [
+    "nearest_commune",
+    "code_insee",
+    "distance_commune_m",
+    "code_postal",
+    "reg_nom",
+    "dep_nom",
+    "distance_to_coast",
+    "is_coastal",
+]
+_KEYS = ["lat_key", "lon_key"]
+
+
+def coordinate_keys(df: pd.DataFrame, precision: int = GEOLOC_CACHE_PRECISION) -> pd.DataFrame:
+    """Clés entières (lat_key, lon_key) ; <NA> pour une observation sans coordonnées."""
+    scale = 10 ** precision
+    return pd.DataFrame(
+        {
+            "lat_key": np.round(df["latitude"].astype(float) * scale).astype("Int64"),
+            "lon_key": np.round(df["longitude"].astype(float) * scale).astype("Int64"),
+        },
+        index=df.index,
+    )
+
+
+def lookup_geoloc_cache(
+    engine,
+    keys: pd.DataFrame,
+    precision: int = GEOLOC_CACHE_PRECISION,
+    version: str = "",
+) -> pd.DataFrame:
+    """Entrées du cache pour les clés demandées (clés distinctes, sans NA)."""
+    if keys.empty:
+        return pd.DataFrame(columns=[*_KEYS, *CACHED_COLUMNS])
+
+    df = read_database_arrow(f"""
+        SELECT c.lat_key, c.lon_key, {", ".join(f"c.{col}" for col in CACHED_COLUMNS)}
+        FROM unnest(CAST(:lat_keys AS BIGINT[]), CAST(:lon_keys AS BIGINT[])) AS k (lat_key, lon_key)
+        JOIN geoloc_cache c
+            ON c.precision = :precision
+            AND c.layers_version = :version
+            AND c.lat_key = k.lat_key
+            AND c.lon_key = k.lon_key
+    """, engine, params={
+        "precision": precision,
+        "version": version,
+        "lat_keys": keys["lat_key"].astype(int).tolist(),
+        "lon_keys": keys["lon_key"].astype(int).tolist(),
+    })
+    return df.to_pandas()
+
+
+def store_geoloc_cache(
+    engine,
+    df: pd.DataFrame,
+    precision: int = GEOLOC_CACHE_PRECISION,
+    version: str = "",
+):
+    """Ajoute les clés calculées ; une clé déjà présente (autre worker) est conservée."""
+    if df.empty:
+        return
+
+    copy_into_table(
+        pl.from_pandas(df[[*_KEYS, *CACHED_COLUMNS]]).with_columns(
+            pl.lit(precision, dtype=pl.Int16).alias("precision"),
+            pl.lit(version).alias("layers_version"),
+        ),
+        "geoloc_cache",
+        engine,
+        columns=["precision", "layers_version", *_KEYS, *CACHED_COLUMNS],
+        conflict_columns=["precision", "layers_version", *_KEYS],
+    )
+
+
+def clear_geoloc_cache(engine):
+    """Vide le cache (mise à jour des couches de référence)."""
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE geoloc_cache"))
+    LOGGER.info("Cache géoloc vidé")
+
+
+def prune_geoloc_cache(engine, version: str):
+    """Supprime les entrées calculées avec une autre version des couches."""
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("DELETE FROM geoloc_cache WHERE layers_version <> :version"),
+            {"version": version},
+        )
+    if result.rowcount:
+        LOGGER.info("Cache géoloc : entrées obsolètes supprimées", rows=result.rowcount)
+
+
+def new_cache_stats() -> dict:
+    """
+    Compteurs par observation (row_*) et par coordonnée distincte (key_*) :
+    hits + misses = total dans chaque unité.
+    """
+    return {"rows": 0, "row_hits": 0, "row_misses": 0, "keys": 0, "key_hits": 0, "key_misses": 0}
+
+
+def log_cache_stats(stats: dict):
+    """Taux de succès : part des observations résolues sans calcul géométrique."""
+    hit_rate = stats["row_hits"] / stats["rows"] if stats["rows"] else None
+    LOGGER.info(
+        "Cache géoloc",
+        **stats,
+        hit_rate=round(hit_rate, 4) if hit_rate is not None else None,
+    )
+
+
+def enrich_with_cache(
+    engine,
+    df: pd.DataFrame,
+    enrich: Callable[[pd.DataFrame], pd.DataFrame],
+    precision: int = GEOLOC_CACHE_PRECISION,
+    stats: Optional[dict] = None,
+    version: str = "",
+) -> pd.DataFrame:
+    """
+    Ajoute CACHED_COLUMNS à df (colonnes latitude / longitude).
+
+    enrich(points) ne reçoit que les coordonnées arrondies absentes du
+    cache, une fois chacune, et doit retourner CACHED_COLUMNS ; ses
+    résultats sont ensuite ajoutés au cache.
+    """
+    keys = coordinate_keys(df, precision)
+    distinct = keys.dropna().drop_duplicates()
+
+    cached = lookup_geoloc_cache(engine, distinct, precision, version)
+    missing = distinct.merge(cached[_KEYS], on=_KEYS, how="left", indicator=True)
+    missing = missing.loc[missing["_merge"] == "left_only", _KEYS].reset_index(drop=True)
+
+    if not missing.empty:
+        points = missing.assign(
+            latitude=missing["lat_key"].astype(float) / 10 ** precision,
+            longitude=missing["lon_key"].astype(float) / 10 ** precision,
+        )
+        computed = enrich(points)
+        store_geoloc_cache(engine, computed, precision, version)
+        cached = pd.concat([cached, computed[[*_KEYS, *CACHED_COLUMNS]]], ignore_index=True)
+
+    if stats is not None:
+        located = keys.dropna()
+        row_misses = len(located.merge(missing, on=_KEYS))
+        stats["rows"] += len(located)
+        stats["row_hits"] += len(located) - row_misses
+        stats["row_misses"] += row_misses
+        stats["keys"] += len(distinct)
+        stats["key_hits"] += len(distinct) - len(missing)
+        stats["key_misses"] += len(missing)
+
+    cached = cached.astype({"lat_key": "Int64", "lon_key": "Int64"})
+    out = pd.concat([df, keys], axis=1).merge(cached, on=_KEYS, how="left")
+    out["is_coastal"] = out["is_coastal"].eq(True)
+    return out.drop(columns=_KEYS)
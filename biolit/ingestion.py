@@ -0,0 +1,92 @@
+"""
+Étape 1 du pipeline : ingestion des observations depuis l'API Biolit.
+
+Incrémentale par défaut (watermark), complète avec full_refresh, ou
+rejouée depuis le dernier snapshot en cache avec replay.
+"""
+
+import datetime
+from typing import Optional
+
+import polars as pl
+import structlog
+
+from biolit.api_cache import API_REPLAY
+from biolit.bronze import append_observations_batch, compact_observations
+from biolit.create_table import (
+    get_ingestion_watermark,
+    insert_dataframe,
+    update_ingestion_watermark,
+)
+from biolit.export_api import (
+    fetch_biolit_incremental,
+    iter_observation_batches,
+    parse_observations,
+    stream_biolit_from_api,
+)
+
+LOGGER = structlog.get_logger()
+
+
+def ingest_observations(
+    engine,
+    run_started_at: datetime.datetime,
+    full_refresh: bool = False,
+    replay: Optional[bool] = None,
+    stats: Optional[dict] = None,
+) -> dict:
+    """
+    Charge les observations dans Postgres et la couche bronze, lot par lot.
+
+    Un replay relit un snapshot ancien : il ne touche pas au watermark,
+    sans quoi le run incrémental suivant ignorerait les modifications
+    faites entre le snapshot et maintenant. Sans replay explicite,
+    BIOLIT_API_REPLAY décide, pour la lecture comme pour le watermark.
+
+    Retourne:
+        Compteurs de chargement (inserted, updated, unchanged)
+    """
+    replay = API_REPLAY if replay is None else replay
+    watermark = None if full_refresh or replay else get_ingestion_watermark(engine)
+    if replay:
+        LOGGER.info("Replaying cached API snapshot (no network)...")
+        batches = stream_biolit_from_api(replay=True)
+    elif watermark is None:
+        LOGGER.info("Fetching data (full refresh, streaming)...")
+        batches = stream_biolit_from_api()
+    else:
+        LOGGER.info("Fetching data (incremental)...", last_run_at=watermark["last_run_at"])
+        batches = iter_observation_batches(fetch_biolit_incremental(watermark))
+
+    # Les lots sont chargés au fil de l'eau : seuls les max id/date sont gardés
+    batch_maxima = []
+    n_rejected = 0
+    load_counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for batch in batches:
+        LOGGER.info("Preparing for Postgres...", rows=len(batch))
+        if stats is not None:
+            stats["rows_in"] += len(batch)
+        df, df_rejected = parse_observations(batch)
+        n_rejected += len(df_rejected)
+
+        LOGGER.info("Loading into Postgres...")
+        counts = insert_dataframe(df)
+        for key, value in counts.items():
+            load_counts[key] += value
+        append_observations_batch(df)
+        batch_maxima.append(df.select(pl.col("id_observation", "date_observation").max()))
+
+    if not batch_maxima:
+        LOGGER.info("Aucune observation nouvelle ou modifiée depuis le dernier run")
+    LOGGER.info("Ingestion terminée", rows_rejected=n_rejected, **load_counts)
+    if stats is not None:
+        stats["rows_out"] = load_counts["inserted"] + load_counts["updated"]
+    compact_observations()
+
+    if replay:
+        LOGGER.info("Replay : watermark d'ingestion inchangé")
+    else:
+        df_maxima = pl.concat(batch_maxima) if batch_maxima else pl.DataFrame()
+        update_ingestion_watermark(engine, df_maxima, run_started_at)
+
+    return load_counts
@@ -11,7 +11,7 @@ from biolit.minio import (
 )
 
 from biolit.create_table import (
-    get_observation_image_path
+    resolve_observation_image_paths
 )
 from biolit.flow_gatekeeper import(
     filter_processed_no_crop_annotations,
@@ -89,6 +89,16 @@ def process_no_crop_annotations(df: pl.DataFrame, run_name: str, engine ):
         # -------------------------
         client = create_minio_client()
 
+        # Paths S3 de toutes les images en une seule requête
+        image_paths = {
+            id_obs: {"bucket": bucket, "rest": key}
+            for id_obs, bucket, key in resolve_observation_image_paths(
+                engine,
+                data_process["id_observation"].to_list(),
+                "ml_no_crops"
+            ).iter_rows()
+        }
+
         rows_db = []
 
         # -------------------------
@@ -117,12 +127,11 @@ def process_no_crop_annotations(df: pl.DataFrame, run_name: str, engine ):
             # =========================
             # Récupération image source
             # =========================
-            image_path = get_observation_image_path(
-                engine,
-                row["id_observation"],
-                "ml_no_crops"
-            )
-            LOGGER.info(f"bucket name {image_path["bucket"]} and object key {image_path["rest"]}")
+            image_path = image_paths.get(int(row["id_observation"]))
+            if image_path is None:
+                LOGGER.info(f"No IMAGE for this {row['id_observation']}")
+                continue
+            LOGGER.info(f"bucket name {image_path['bucket']} and object key {image_path['rest']}")
             image = load_image_from_s3_mino(
                 client,
                 bucket_name=image_path["bucket"],
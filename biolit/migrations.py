@@ -0,0 +1,429 @@
+"""
+Migrations versionnées du schéma PostgreSQL.
+
+Toutes les tables du projet (biolit et ml) sont créées et modifiées ici,
+et uniquement ici. Chaque migration est appliquée une seule fois, dans sa
+propre transaction, et enregistrée dans schema_migrations. Un verrou
+consultatif évite que deux workers migrent en même temps.
+
+Pour faire évoluer le schéma : ajouter une migration en fin de liste,
+ne jamais modifier une migration déjà livrée.
+"""
+
+import structlog
+from sqlalchemy import text
+
+LOGGER = structlog.get_logger()
+
+# Identifiant arbitraire du verrou consultatif des migrations
+_MIGRATION_LOCK_ID = 1_404_2025
+
+
+# -------------------------
+# 1. Schéma historique (tel que créé par create_table.py)
+# -------------------------
+_INITIAL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS observations (
+        id_observation BIGINT PRIMARY KEY,
+        date_observation TIMESTAMP,
+        lien_observation TEXT,
+        observateur TEXT,
+        url_sortie TEXT,
+        espece_identifiee TEXT,
+        heure_debut TIME,
+        heure_fin TIME,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        photos TEXT,
+        relais BIGINT,
+        id_espece BIGINT,
+        nom_scientifique TEXT,
+        nom_commun TEXT,
+        categorie_programme BIGINT,
+        programme TEXT,
+        validee TEXT,
+        row_hash TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS observations_enriched (
+        id_observation BIGINT PRIMARY KEY,
+        nearest_commune TEXT,
+        code_insee TEXT,
+        distance_commune_m DOUBLE PRECISION,
+        code_postal TEXT,
+        reg_nom TEXT,
+        dep_nom TEXT,
+        distance_to_coast DOUBLE PRECISION,
+        is_coastal BOOLEAN
+    );
+
+    CREATE TABLE IF NOT EXISTS ingestion_watermark (
+        source TEXT PRIMARY KEY,
+        last_id_observation BIGINT,
+        last_date_observation TIMESTAMP,
+        last_run_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS doris_table (
+        nom_scientifique TEXT,
+        lien_doris TEXT,
+        UNIQUE (nom_scientifique)
+    );
+
+    CREATE TABLE IF NOT EXISTS ml_no_crops (
+        run_name TEXT,
+        id_observation TEXT PRIMARY KEY,
+        path_s3 TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS ml_crops (
+        run_name TEXT,
+        id_crops TEXT PRIMARY KEY,
+        regne TEXT,
+        confiance FLOAT,
+        path_s3 TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS ml_taxonomy (
+        id_crops        TEXT PRIMARY KEY,
+        run_name        TEXT,
+        id_observation  TEXT,
+        regne           TEXT,
+        confiance       DOUBLE PRECISION,
+        path_s3         TEXT,
+        best_level      TEXT,
+        best_label      TEXT,
+        best_score      DOUBLE PRECISION,
+        phylum          TEXT,
+        classe          TEXT,
+        ordre           TEXT,
+        famille         TEXT,
+        species_name    TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS db_finale (
+        id_crops TEXT PRIMARY KEY,
+        id_observation BIGINT,
+        nom_scientifique TEXT,
+        annotateur  TEXT,
+        source  TEXT,
+        validee  TEXT,
+        espece_identifiee TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS taxonomy_queue (
+        id_crops TEXT PRIMARY KEY,
+        id_observation BIGINT NOT NULL,
+        task_created_date TIMESTAMP,
+        crop_index INTEGER,
+        x FLOAT,
+        y FLOAT,
+        width FLOAT,
+        height FLOAT,
+        original_width INTEGER,
+        original_height INTEGER,
+        nom_scientifique TEXT,
+        annotateur TEXT,
+        annotated_at TIMESTAMP,
+        commentaire TEXT,
+        source TEXT,
+        validee TEXT,
+        espece_identifiee TEXT
+    );
+"""
+
+# -------------------------
+# 2. Réconciliation avec infra/init.sql et ml/classification/db.py
+# -------------------------
+# Les bases initialisées par init.sql ont des INT au lieu de BIGINT et un
+# ml_taxonomy différent : on converge vers un schéma unique.
+_RECONCILE_SCHEMA = """
+    ALTER TABLE observations
+        ADD COLUMN IF NOT EXISTS row_hash TEXT,
+        ALTER COLUMN id_observation TYPE BIGINT,
+        ALTER COLUMN relais TYPE BIGINT,
+        ALTER COLUMN id_espece TYPE BIGINT,
+        ALTER COLUMN categorie_programme TYPE BIGINT,
+        ALTER COLUMN latitude TYPE DOUBLE PRECISION,
+        ALTER COLUMN longitude TYPE DOUBLE PRECISION;
+
+    ALTER TABLE ml_no_crops
+        ALTER COLUMN id_observation TYPE BIGINT USING id_observation::BIGINT;
+
+    ALTER TABLE ml_taxonomy
+        ALTER COLUMN id_observation TYPE BIGINT USING id_observation::BIGINT,
+        ALTER COLUMN confiance TYPE DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS best_level TEXT,
+        ADD COLUMN IF NOT EXISTS best_label TEXT,
+        ADD COLUMN IF NOT EXISTS best_score DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS phylum TEXT,
+        ADD COLUMN IF NOT EXISTS classe TEXT,
+        ADD COLUMN IF NOT EXISTS ordre TEXT,
+        ADD COLUMN IF NOT EXISTS famille TEXT,
+        ADD COLUMN IF NOT EXISTS species_name TEXT,
+        ADD COLUMN IF NOT EXISTS nom_scientifique TEXT,
+        ADD COLUMN IF NOT EXISTS lien_doris TEXT;
+"""
+
+# -------------------------
+# 3. validee booléen + index des requêtes ML
+# -------------------------
+_ML_CANDIDATE_INDEXES = """
+    -- Valeurs ni true ni false : conservées avant d'être mises à NULL
+    CREATE TABLE IF NOT EXISTS observations_validee_rejected AS
+    SELECT id_observation, validee::TEXT AS validee_raw, now() AS rejected_at
+    FROM observations
+    WHERE validee IS NOT NULL
+    AND LOWER(validee::TEXT) NOT IN ('true', 'false');
+
+    ALTER TABLE observations
+        ALTER COLUMN validee TYPE BOOLEAN
+        USING (CASE LOWER(validee::TEXT)
+            WHEN 'true' THEN TRUE
+            WHEN 'false' THEN FALSE
+        END);
+
+    -- Candidats ML : observations non validées (les URLs sont filtrées
+    -- dans observation_photos, pas sur le TEXT photos multi-URLs)
+    CREATE INDEX IF NOT EXISTS idx_observations_not_validated
+        ON observations (id_observation)
+        WHERE validee IS FALSE;
+
+    -- ml_no_crops.id_observation est déjà indexé par sa clé primaire
+    CREATE INDEX IF NOT EXISTS idx_ml_taxonomy_id_observation
+        ON ml_taxonomy (id_observation);
+
+    CREATE INDEX IF NOT EXISTS idx_db_finale_id_observation
+        ON db_finale (id_observation);
+
+    CREATE INDEX IF NOT EXISTS idx_taxonomy_queue_id_observation
+        ON taxonomy_queue (id_observation);
+"""
+
+# -------------------------
+# 4. id_observation stocké sur ml_crops
+# -------------------------
+# id_crops = "{id_observation}_{...}" : la colonne générée évite les
+# split_part non indexables dans les requêtes d'anti-jointure.
+_ML_CROPS_ID_OBSERVATION = """
+    ALTER TABLE ml_crops
+        ADD COLUMN IF NOT EXISTS id_observation BIGINT
+        GENERATED ALWAYS AS (CAST(split_part(id_crops, '_', 1) AS BIGINT)) STORED;
+
+    CREATE INDEX IF NOT EXISTS idx_ml_crops_id_observation
+        ON ml_crops (id_observation);
+"""
+
+# -------------------------
+# 5. File de travail ML (biolit/work_queue.py)
+# -------------------------
+_ML_WORK_QUEUE = """
+    CREATE TABLE IF NOT EXISTS ml_work_queue (
+        id_observation BIGINT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        leased_by TEXT,
+        lease_expires_at TIMESTAMPTZ,
+        last_error TEXT,
+        enqueued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        CHECK (status IN ('pending', 'leased', 'done', 'failed'))
+    );
+
+    -- Seules les lignes réservables sont parcourues par le lease
+    CREATE INDEX IF NOT EXISTS idx_ml_work_queue_claimable
+        ON ml_work_queue (id_observation)
+        WHERE status IN ('pending', 'leased');
+"""
+
+# -------------------------
+# 6. Photos normalisées (une ligne par URL)
+# -------------------------
+_OBSERVATION_PHOTOS = """
+    CREATE TABLE IF NOT EXISTS observation_photos (
+        id_observation BIGINT NOT NULL,
+        photo_index INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        content_hash TEXT,
+        width INTEGER,
+        height INTEGER,
+        status TEXT NOT NULL DEFAULT 'pending',
+        fetched_at TIMESTAMPTZ,
+        PRIMARY KEY (id_observation, photo_index),
+        CHECK (status IN ('pending', 'fetched', 'failed'))
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_observation_photos_url
+        ON observation_photos (url);
+
+    CREATE INDEX IF NOT EXISTS idx_observation_photos_content_hash
+        ON observation_photos (content_hash)
+        WHERE content_hash IS NOT NULL;
+
+    -- Reprise de l'historique : photos = URLs séparées par '|'
+    INSERT INTO observation_photos (id_observation, photo_index, url)
+    SELECT o.id_observation, t.ord - 1, btrim(t.url)
+    FROM observations o,
+        unnest(string_to_array(o.photos, '|')) WITH ORDINALITY AS t(url, ord)
+    WHERE btrim(t.url) LIKE 'http%'
+    ON CONFLICT DO NOTHING;
+"""
+
+# -------------------------
+# 7. Dimension taxonomie (TAXREF, voir biolit/taxref.py)
+# -------------------------
+_TAXONOMY = """
+    CREATE TABLE IF NOT EXISTS taxonomy (
+        cd_nom BIGINT PRIMARY KEY,
+        species_name TEXT NOT NULL,
+        regne TEXT,
+        phylum TEXT,
+        classe TEXT,
+        ordre TEXT,
+        famille TEXT,
+        sous_famille TEXT,
+        ancestor_path TEXT[],
+        lineage TEXT
+    );
+
+    -- species_name est normalisé puis dédoublonné au chargement
+    -- (load_taxref_to_db garde le nom retenu cd_nom = cd_ref)
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_taxonomy_species_name
+        ON taxonomy (species_name);
+
+    -- Descendants d'un taxon : ancestor_path @> ARRAY['Mollusca']
+    CREATE INDEX IF NOT EXISTS idx_taxonomy_ancestor_path
+        ON taxonomy USING GIN (ancestor_path);
+"""
+
+_PIPELINE_RUNS = """
+    -- run_name n'est pas unique : deux workers peuvent démarrer dans la
+    -- même seconde, le worker est enregistré à côté
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        run_id BIGSERIAL PRIMARY KEY,
+        run_name TEXT NOT NULL,
+        worker_id TEXT,
+        started_at TIMESTAMP NOT NULL DEFAULT now(),
+        ended_at TIMESTAMP,
+        status TEXT NOT NULL DEFAULT 'running'
+            CHECK (status IN ('running', 'success', 'failed')),
+        options JSONB
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_pipeline_runs_run_name
+        ON pipeline_runs (run_name);
+
+    -- peak_rss_mb : pic de l'étape ; process_peak_rss_mb : pic du processus
+    -- depuis son démarrage (ru_maxrss). skipped : étape non exécutée
+    CREATE TABLE IF NOT EXISTS pipeline_stage_runs (
+        run_id BIGINT NOT NULL REFERENCES pipeline_runs (run_id) ON DELETE CASCADE,
+        stage TEXT NOT NULL,
+        stage_order INTEGER NOT NULL,
+        started_at TIMESTAMP NOT NULL DEFAULT now(),
+        ended_at TIMESTAMP,
+        duration_s DOUBLE PRECISION,
+        rows_in BIGINT,
+        rows_out BIGINT,
+        bytes_downloaded BIGINT,
+        bytes_uploaded BIGINT,
+        peak_rss_mb DOUBLE PRECISION,
+        process_peak_rss_mb DOUBLE PRECISION,
+        status TEXT NOT NULL DEFAULT 'running'
+            CHECK (status IN ('running', 'success', 'failed', 'skipped')),
+        error TEXT,
+        PRIMARY KEY (run_id, stage)
+    );
+
+    -- Tendance par étape : WHERE stage = ... ORDER BY started_at
+    CREATE INDEX IF NOT EXISTS idx_pipeline_stage_runs_stage_started
+        ON pipeline_stage_runs (stage, started_at);
+"""
+
+# Coordonnées utilisées pour l'enrichissement : seules les observations
+# nouvelles ou déplacées sont recalculées. Les lignes existantes (sans
+# coordonnées) sont recalculées une fois au run suivant.
+_ENRICHED_COORDINATES = """
+    ALTER TABLE observations_enriched
+        ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION,
+        ADD COLUMN IF NOT EXISTS enriched_at TIMESTAMP DEFAULT now();
+"""
+
+# Enrichissement géographique par coordonnées arrondies : clés entières
+# round(coordonnée * 10^precision), pour une égalité exacte ; layers_version
+# identifie les couches de référence (ETags S3) utilisées pour le calcul
+_GEOLOC_CACHE = """
+    CREATE TABLE IF NOT EXISTS geoloc_cache (
+        precision SMALLINT NOT NULL,
+        layers_version TEXT NOT NULL,
+        lat_key BIGINT NOT NULL,
+        lon_key BIGINT NOT NULL,
+        nearest_commune TEXT,
+        code_insee TEXT,
+        distance_commune_m DOUBLE PRECISION,
+        code_postal TEXT,
+        reg_nom TEXT,
+        dep_nom TEXT,
+        distance_to_coast DOUBLE PRECISION,
+        is_coastal BOOLEAN,
+        computed_at TIMESTAMP NOT NULL DEFAULT now(),
+        PRIMARY KEY (precision, layers_version, lat_key, lon_key)
+    );
+"""
+
+MIGRATIONS = [
+    (1, "initial_schema", _INITIAL_SCHEMA),
+    (2, "reconcile_schema", _RECONCILE_SCHEMA),
+    (3, "ml_candidate_indexes", _ML_CANDIDATE_INDEXES),
+    (4, "ml_crops_id_observation", _ML_CROPS_ID_OBSERVATION),
+    (5, "ml_work_queue", _ML_WORK_QUEUE),
+    (6, "observation_photos", _OBSERVATION_PHOTOS),
+    (7, "taxonomy", _TAXONOMY),
+    (8, "pipeline_runs", _PIPELINE_RUNS),
+    (9, "enriched_coordinates", _ENRICHED_COORDINATES),
+    (10, "geoloc_cache", _GEOLOC_CACHE),
+]
+
+
+def run_migrations(engine) -> list[int]:
+    """
+    Applique les migrations manquantes, dans l'ordre.
+
+    Retourne:
+        Liste des versions appliquées pendant cet appel
+    """
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+        """))
+
+    applied = []
+    for version, name, sql in MIGRATIONS:
+        with engine.begin() as conn:
+            # Verrou relâché à la fin de la transaction
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(:lock_id)"),
+                {"lock_id": _MIGRATION_LOCK_ID},
+            )
+            already_applied = conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :version"),
+                {"version": version},
+            ).first()
+            if already_applied:
+                continue
+
+            conn.execute(text(sql))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name},
+            )
+        LOGGER.info("Migration appliquée", version=version, name=name)
+        applied.append(version)
+
+    return applied
@@ -8,6 +8,8 @@ from io import BytesIO
 from PIL import Image
 import json
 
+from biolit.run_registry import count_bytes
+
 LOGGER = structlog.get_logger()
 load_dotenv()
 
@@ -86,6 +88,7 @@ def upload_crop_image(client, pil_img: Image.Image, bucket_name: str, object_nam
         length=buffer.getbuffer().nbytes,
         content_type="image/jpeg"
     )
+    count_bytes(uploaded=buffer.getbuffer().nbytes)
 
 
 def _get_label_studios_info_minio():
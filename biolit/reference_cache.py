@@ -0,0 +1,118 @@
+"""
+Cache local des couches de référence stockées sur S3 (communes, trait de côte...).
+
+Chaque objet est copié sur disque sous un nom qui contient son ETag :
+un run (ou un autre worker sur la même machine) relit la copie locale
+tant que l'objet S3 n'a pas changé, au prix d'un seul head_object.
+Dans un même processus, la couche déjà lue est gardée en mémoire.
+
+    data/cache/reference/<bucket>/<key sans extension>.<etag><extension>
+"""
+
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+import structlog
+from dotenv import load_dotenv
+
+from biolit import DATADIR
+from biolit.run_registry import count_bytes
+
+LOGGER = structlog.get_logger()
+load_dotenv()
+
+REFERENCE_CACHE_DIR = Path(
+    os.getenv("BIOLIT_REFERENCE_CACHE_DIR", DATADIR / "cache" / "reference")
+)
+
+_CHUNK_BYTES = 1 << 20
+_MEMO: dict[tuple[str, str, str], Any] = {}
+_LOCK = threading.Lock()
+
+
+def reference_etag(client, bucket_name: str, key: str) -> str:
+    """ETag de l'objet S3 (version de la couche), nettoyé pour un nom de fichier."""
+    etag = client.head_object(Bucket=bucket_name, Key=key)["ETag"]
+    # ETag entre guillemets, avec "-N" pour un upload multipart
+    return re.sub(r"[^A-Za-z0-9-]", "", etag)
+
+
+def _local_path(bucket_name: str, key: str, etag: str, cache_dir: Path) -> Path:
+    path = cache_dir / bucket_name / key
+    return path.with_name(f"{path.stem}.{etag}{path.suffix}")
+
+
+def cached_s3_path(
+    client,
+    bucket_name: str,
+    key: str,
+    cache_dir: Path = REFERENCE_CACHE_DIR,
+) -> Path:
+    """
+    Chemin local de l'objet S3, téléchargé seulement si son ETag a changé.
+    Les versions précédentes du même objet sont supprimées.
+    """
+    return _fetch(client, bucket_name, key, reference_etag(client, bucket_name, key), cache_dir)
+
+
+def _fetch(client, bucket_name: str, key: str, etag: str, cache_dir: Path) -> Path:
+    path = _local_path(bucket_name, key, etag, cache_dir)
+    if path.exists():
+        LOGGER.info("Couche de référence en cache local", key=key, path=str(path))
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    body = client.get_object(Bucket=bucket_name, Key=key)["Body"]
+    # Écriture atomique : un autre worker ne lit jamais un fichier partiel
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+        try:
+            for chunk in body.iter_chunks(_CHUNK_BYTES):
+                f.write(chunk)
+                count_bytes(downloaded=len(chunk))
+        except BaseException:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+    os.replace(f.name, path)
+    LOGGER.info("Couche de référence téléchargée", key=key, path=str(path))
+
+    stem = Path(key).stem
+    for old in path.parent.glob(f"{stem}.*{path.suffix}"):
+        old_etag = old.name[len(stem) + 1 : len(old.name) - len(path.suffix)]
+        if old != path and "." not in old_etag:
+            old.unlink(missing_ok=True)
+
+    return path
+
+
+def load_reference_layer(
+    client,
+    bucket_name: str,
+    key: str,
+    reader: Callable[[Path], Any],
+    cache_dir: Path = REFERENCE_CACHE_DIR,
+) -> Any:
+    """
+    Couche lue par reader(chemin local), mémorisée dans le processus
+    pour un ETag donné. L'objet retourné est partagé : ne pas le modifier.
+    """
+    etag = reference_etag(client, bucket_name, key)
+    memo_key = (bucket_name, key, etag)
+    with _LOCK:
+        if memo_key in _MEMO:
+            return _MEMO[memo_key]
+
+    layer = reader(_fetch(client, bucket_name, key, etag, cache_dir))
+    with _LOCK:
+        for old_key in [k for k in _MEMO if k[:2] == (bucket_name, key)]:
+            del _MEMO[old_key]
+        _MEMO[memo_key] = layer
+    return layer
+
+
+def clear_reference_memo():
+    with _LOCK:
+        _MEMO.clear()
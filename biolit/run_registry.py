@@ -0,0 +1,251 @@
+"""
+Registre des runs du pipeline (tables pipeline_runs et pipeline_stage_runs).
+
+Chaque run est enregistré avec ses options, puis chaque étape avec ses
+horaires, ses volumes (lignes en entrée / en sortie, octets téléchargés /
+envoyés), son pic de mémoire et son statut. stage_throughput()
+agrège ces lignes par jour pour suivre le débit d'une étape d'un run à
+l'autre.
+
+Les octets sont comptés là où ils transitent (API, photos, S3/MinIO) via
+count_bytes(), imputés à l'étape en cours.
+"""
+
+import datetime
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import polars as pl
+import structlog
+from sqlalchemy import text
+
+from biolit.db_read import read_database_arrow
+from biolit.sql_metrics import set_sql_stage
+from biolit.work_queue import default_worker_id
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOGGER = structlog.get_logger()
+
+_CURRENT_STAGE: Optional[dict] = None
+_LOCK = threading.Lock()
+
+
+def count_bytes(downloaded: int = 0, uploaded: int = 0):
+    """Impute des octets transférés à l'étape en cours (sans effet hors étape)."""
+    with _LOCK:
+        if _CURRENT_STAGE is None:
+            return
+        _CURRENT_STAGE["bytes_downloaded"] += downloaded
+        _CURRENT_STAGE["bytes_uploaded"] += uploaded
+
+
+def process_peak_rss_mb() -> Optional[float]:
+    """
+    Pic de mémoire résidente du processus depuis son démarrage
+    (ru_maxrss : en Ko sous Linux).
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Remet à zéro le pic mémoire du processus (VmHWM, Linux uniquement),
+    pour mesurer le pic d'une étape seule.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pic mémoire depuis le dernier reset_peak_rss() (VmHWM, Linux uniquement)."""
+    try:
+        with open("/proc/self/status") as f:
+            match = re.search(r"^VmHWM:\s+(\d+) kB", f.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) / 1024 if match else None
+
+
+class RunRecorder:
+    """
+    Enregistre un run et ses étapes :
+
+        with RunRecorder(engine, run_name, options={...}) as recorder:
+            with recorder.stage("geoloc") as stats:
+                ...
+                stats["rows_in"] += len(df)
+            recorder.skip("ml_crops")
+
+    Une exception dans une étape la marque en échec ; toute exception
+    sortant du bloc marque le run en échec, puis est propagée.
+    """
+
+    def __init__(self, engine, run_name: str, options: Optional[dict] = None):
+        self.engine = engine
+        self.run_name = run_name
+        self._stage_order = 0
+        with engine.begin() as conn:
+            self.run_id = conn.execute(text("""
+                INSERT INTO pipeline_runs (run_name, worker_id, options)
+                VALUES (:run_name, :worker_id, CAST(:options AS JSONB))
+                RETURNING run_id
+            """), {
+                "run_name": run_name,
+                "worker_id": default_worker_id(),
+                "options": json.dumps(options or {}, default=str),
+            }).scalar_one()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish("failed" if exc_type else "success")
+        return False
+
+    @contextmanager
+    def stage(self, name: str):
+        global _CURRENT_STAGE
+
+        self._stage_order += 1
+        stats = {"rows_in": 0, "rows_out": 0, "bytes_downloaded": 0, "bytes_uploaded": 0}
+        started_at = datetime.datetime.now()
+        t0 = time.perf_counter()
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO pipeline_stage_runs (run_id, stage, stage_order, started_at)
+                VALUES (:run_id, :stage, :stage_order, :started_at)
+            """), {
+                "run_id": self.run_id,
+                "stage": name,
+                "stage_order": self._stage_order,
+                "started_at": started_at,
+            })
+
+        set_sql_stage(name)
+        stats["_peak_reset"] = reset_peak_rss()
+        with _LOCK:
+            _CURRENT_STAGE = stats
+        try:
+            yield stats
+        except BaseException as e:
+            self._end_stage(name, stats, time.perf_counter() - t0, "failed", repr(e))
+            raise
+        else:
+            self._end_stage(name, stats, time.perf_counter() - t0, "success")
+        finally:
+            with _LOCK:
+                _CURRENT_STAGE = None
+
+    def _end_stage(
+        self,
+        name: str,
+        stats: dict,
+        duration_s: float,
+        status: str,
+        error: Optional[str] = None,
+    ):
+        peak_reset = stats.pop("_peak_reset", False)
+        params = {
+            **stats,
+            "run_id": self.run_id,
+            "stage": name,
+            "duration_s": duration_s,
+            "peak_rss_mb": peak_rss_mb() if peak_reset else None,
+            "process_peak_rss_mb": process_peak_rss_mb(),
+            "status": status,
+            "error": error,
+        }
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE pipeline_stage_runs SET
+                    ended_at = now(),
+                    duration_s = :duration_s,
+                    rows_in = :rows_in,
+                    rows_out = :rows_out,
+                    bytes_downloaded = :bytes_downloaded,
+                    bytes_uploaded = :bytes_uploaded,
+                    peak_rss_mb = :peak_rss_mb,
+                    process_peak_rss_mb = :process_peak_rss_mb,
+                    status = :status,
+                    error = :error
+                WHERE run_id = :run_id AND stage = :stage
+            """), params)
+
+        LOGGER.info(
+            "Étape terminée",
+            stage=name,
+            status=status,
+            duration_s=round(duration_s, 3),
+            **stats,
+        )
+
+    def skip(self, *names: str, reason: Optional[str] = None):
+        """Trace les étapes non exécutées (ex: aucune observation à traiter)."""
+        with self.engine.begin() as conn:
+            for name in names:
+                self._stage_order += 1
+                conn.execute(text("""
+                    INSERT INTO pipeline_stage_runs (
+                        run_id, stage, stage_order, ended_at, duration_s,
+                        rows_in, rows_out, status, error
+                    ) VALUES (
+                        :run_id, :stage, :stage_order, now(), 0,
+                        0, 0, 'skipped', :reason
+                    )
+                """), {
+                    "run_id": self.run_id,
+                    "stage": name,
+                    "stage_order": self._stage_order,
+                    "reason": reason,
+                })
+        LOGGER.info("Étapes non exécutées", stages=list(names), reason=reason)
+
+    def finish(self, status: str = "success"):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE pipeline_runs SET ended_at = now(), status = :status
+                WHERE run_id = :run_id AND status = 'running'
+            """), {"run_id": self.run_id, "status": status})
+
+
+def stage_throughput(engine, days: int = 30, stage: Optional[str] = None) -> pl.DataFrame:
+    """
+    Débit par étape et par jour sur les `days` derniers jours
+    (étapes réussies uniquement).
+
+    Retourne:
+        DataFrame (jour, stage, runs, rows_out, duration_s, rows_per_s,
+        mb_downloaded, mb_uploaded, peak_rss_mb)
+    """
+    return read_database_arrow("""
+        SELECT
+            CAST(date_trunc('day', started_at) AS DATE) AS jour,
+            stage,
+            count(*) AS runs,
+            sum(rows_out) AS rows_out,
+            sum(duration_s) AS duration_s,
+            sum(rows_out) / NULLIF(sum(duration_s), 0) AS rows_per_s,
+            sum(bytes_downloaded) / 1048576.0 AS mb_downloaded,
+            sum(bytes_uploaded) / 1048576.0 AS mb_uploaded,
+            max(peak_rss_mb) AS peak_rss_mb
+        FROM pipeline_stage_runs
+        WHERE status = 'success'
+        AND started_at >= now() - make_interval(days => :days)
+        AND (CAST(:stage AS TEXT) IS NULL OR stage = :stage)
+        GROUP BY 1, 2
+        ORDER BY 1, min(stage_order)
+    """, engine, params={"days": days, "stage": stage})
@@ -7,6 +7,8 @@ from botocore.exceptions import ClientError
 from io import BytesIO
 from PIL import Image
 
+from biolit.run_registry import count_bytes
+
 LOGGER = structlog.get_logger()
 load_dotenv()
 
@@ -74,6 +76,7 @@ def upload_parquet_s3(client, df, bucket_name: str, object_name: str):
         Key=object_name,
         ContentLength=buffer.getbuffer().nbytes,
     )
+    count_bytes(uploaded=buffer.getbuffer().nbytes)
     LOGGER.info("Parquet uploaded", path=f"s3://{bucket_name}/{object_name}")
 
 def _check_file_existence_s3(client, bucket_name: str, key: str) -> bool:
@@ -92,8 +95,10 @@ def _check_file_existence_s3(client, bucket_name: str, key: str) -> bool:
 
 def _read_file_s3(client, bucket_name: str, key: str) -> bytes:
     obj = client.get_object(Bucket=bucket_name, Key=key)
+    body = obj["Body"].read()
+    count_bytes(downloaded=len(body))
     LOGGER.info("Fichier Lu :", key=key)
-    return obj["Body"].read()
+    return body
 
 def upload_image_s3(client, pil_img: Image.Image, bucket_name: str, object_name: str):
     buffer = BytesIO()
@@ -107,6 +112,7 @@ def upload_image_s3(client, pil_img: Image.Image, bucket_name: str, object_name:
         ContentEncoding="image/jpeg",
         ContentLength=buffer.getbuffer().nbytes
     )
+    count_bytes(uploaded=buffer.getbuffer().nbytes)
 
 def load_image_from_s3(s3_client,
                        bucket_name:str,
@@ -0,0 +1,143 @@
+"""
+Instrumentation SQL (opt-in : SQL_METRICS=true).
+
+Chaque requête passant par un engine partagé (biolit/engine.py) est
+chronométrée via les événements SQLAlchemy, puis agrégée par étape du
+pipeline et par empreinte (requête normalisée, sans valeurs littérales).
+Les requêtes exécutées sur le curseur psycopg2 brut (COPY de bulk_load,
+anti-jointures de flow_gatekeeper) sont enregistrées explicitement avec
+record_statement ou execute_recorded.
+
+En fin de run, log_sql_summary() écrit le top-N des empreintes les plus
+coûteuses dans les logs.
+"""
+
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+import structlog
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+LOGGER = structlog.get_logger()
+load_dotenv()
+
+SQL_METRICS_ENABLED = os.getenv("SQL_METRICS", "false").lower() == "true"
+SQL_METRICS_TOP_N = int(os.getenv("SQL_METRICS_TOP_N", "10"))
+
+_STAGE = contextvars.ContextVar("sql_stage", default="hors_etape")
+_STATS: dict[tuple[str, str], dict] = defaultdict(
+    lambda: {"calls": 0, "total_s": 0.0, "max_s": 0.0, "rows": 0}
+)
+_LOCK = threading.Lock()
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"\b(_staging_\w+)_[0-9a-f]{8}\b"), r"\1_?"),  # tables temporaires (bulk_load.staging_name)
+    (re.compile(r"'(?:[^']|'')*'"), "?"),              # chaînes
+    (re.compile(r"%\(\w+\)s|(?<!:):\w+|\$\d+"), "?"),  # paramètres liés
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),            # nombres
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"), # listes IN (...)
+    (re.compile(r"\s+"), " "),
+]
+
+
+def fingerprint(statement: str) -> str:
+    """Requête normalisée : les valeurs variables sont remplacées par ?."""
+    for pattern, replacement in _FINGERPRINT_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def set_sql_stage(stage: str):
+    """Étape du pipeline à laquelle les requêtes suivantes sont imputées."""
+    _STAGE.set(stage)
+
+
+def record_statement(statement: str, duration_s: float, rows: int = 0):
+    if not SQL_METRICS_ENABLED:
+        return
+
+    key = (_STAGE.get(), fingerprint(statement))
+    with _LOCK:
+        stats = _STATS[key]
+        stats["calls"] += 1
+        stats["total_s"] += duration_s
+        stats["max_s"] = max(stats["max_s"], duration_s)
+        stats["rows"] += max(rows or 0, 0)
+
+
+def execute_recorded(cursor, statement: str):
+    """cursor.execute sur un curseur brut, compté dans les métriques de l'étape."""
+    t0 = time.perf_counter()
+    cursor.execute(statement)
+    record_statement(statement, time.perf_counter() - t0, cursor.rowcount)
+
+
+def instrument_engine(engine):
+    """Branche le chronométrage sur les événements de l'engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("sql_metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0 = conn.info["sql_metrics_t0"].pop()
+        record_statement(statement, time.perf_counter() - t0, cursor.rowcount)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("sql_metrics_t0"):
+            conn.info["sql_metrics_t0"].pop()
+
+
+def get_sql_stats() -> list[dict]:
+    """Statistiques agrégées, triées par temps total décroissant."""
+    with _LOCK:
+        rows = [
+            {"stage": stage, "fingerprint": fp, **stats}
+            for (stage, fp), stats in _STATS.items()
+        ]
+    return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+
+def reset_sql_stats():
+    with _LOCK:
+        _STATS.clear()
+
+
+def log_sql_summary(top_n: Optional[int] = None):
+    """Écrit le temps SQL par étape et le top-N des requêtes les plus lentes."""
+    if not SQL_METRICS_ENABLED:
+        return
+
+    stats = get_sql_stats()
+    per_stage = defaultdict(lambda: {"calls": 0, "total_s": 0.0})
+    for row in stats:
+        per_stage[row["stage"]]["calls"] += row["calls"]
+        per_stage[row["stage"]]["total_s"] += row["total_s"]
+
+    LOGGER.info(
+        "SQL par étape",
+        stages={
+            stage: {"calls": s["calls"], "total_s": round(s["total_s"], 3)}
+            for stage, s in per_stage.items()
+        },
+    )
+    for rank, row in enumerate(stats[: top_n or SQL_METRICS_TOP_N], start=1):
+        LOGGER.info(
+            "SQL top requêtes",
+            rank=rank,
+            stage=row["stage"],
+            calls=row["calls"],
+            total_s=round(row["total_s"], 3),
+            max_s=round(row["max_s"], 3),
+            rows=row["rows"],
+            fingerprint=row["fingerprint"][:300],
+        )
@@ -5,8 +5,11 @@ from pathlib import Path
 import requests
 import zipfile
 import shutil
+from typing import Sequence
 
 from biolit import DATADIR, TAXREFURL
+from biolit.bulk_load import copy_into_table
+from biolit.db_read import read_database_arrow
 
 TAXREF_HIERARCHY = ["regne", "phylum", "classe", "ordre", "famille", "sous_famille"]
 LOGGER = structlog.get_logger()
@@ -28,11 +31,14 @@ def format_taxref():
                 + col("famille").is_not_null() * 10
                 + col("ordre").is_not_null() * 100
                 + col("classe").is_not_null() * 1000
+                # Nom retenu (cd_nom == cd_ref) avant ses synonymes
+                + (col("cd_nom") == col("cd_ref")) * 10000
             ).alias("priority"),
         )
         .select(
             [
                 col("cd_nom").alias("species_id"),
+                "cd_ref",
                 col("lb_nom").alias("species_name"),
                 "priority",
             ]
@@ -48,6 +54,85 @@ def format_taxref():
     taxref.write_parquet(DATADIR / "taxref.parquet")
 
 
+def normalize_species_name(expr: pl.Expr) -> pl.Expr:
+    """Nom d'espèce normalisé : minuscules, espaces simples."""
+    return expr.str.to_lowercase().str.strip_chars().str.replace_all(r"\s+", " ")
+
+
+def load_taxref_to_db(engine, fn: Path = DATADIR / "taxref.parquet"):
+    """
+    Charge taxref.parquet (voir format_taxref) dans la table taxonomy,
+    avec le chemin des ancêtres précalculé (regne → sous_famille).
+
+    species_name est unique en base : deux noms qui ne diffèrent que par
+    la casse ou les espaces sont dédoublonnés après normalisation, en
+    gardant le nom retenu (cd_nom == cd_ref), puis le plus petit cd_nom.
+    """
+    # Tableau PostgreSQL au format texte : {"Animalia","Mollusca",...}
+    quoted = pl.format('"{}"', pl.element().str.replace_all('"', '\\"'))
+    ancestors = pl.concat_list(TAXREF_HIERARCHY).list.drop_nulls()
+
+    taxref = pl.read_parquet(fn)
+    # taxref.parquet antérieur à l'ajout de cd_ref : pas de nom retenu connu
+    accepted = (
+        col("species_id") == col("cd_ref") if "cd_ref" in taxref.columns else pl.lit(False)
+    )
+    taxref = (
+        taxref.with_columns(
+            normalize_species_name(col("species_name")).alias("species_name"),
+            accepted.alias("accepted"),
+        )
+        .sort(["species_name", "accepted", "species_id"], descending=[False, True, False])
+        .unique("species_name", keep="first", maintain_order=True)
+    )
+
+    taxonomy = taxref.select(
+        col("species_id").alias("cd_nom"),
+        "species_name",
+        *TAXREF_HIERARCHY,
+        pl.concat_str(
+            pl.lit("{"), ancestors.list.eval(quoted).list.join(","), pl.lit("}")
+        ).alias("ancestor_path"),
+        ancestors.list.join(" > ").alias("lineage"),
+    )
+
+    rows = copy_into_table(
+        taxonomy,
+        "taxonomy",
+        engine,
+        conflict_columns=["cd_nom"],
+        update_columns=[c for c in taxonomy.columns if c != "cd_nom"],
+    )
+    LOGGER.info("taxonomy chargée", rows=rows)
+
+
+def load_tax_lookup_from_db(engine, species: Sequence[str]) -> dict:
+    """
+    Taxonomie des espèces demandées, au format du tax_lookup du modèle :
+    {espèce → {regne, phylum, classe, ordre, famille}}.
+    Les clés sont les noms tels que fournis ; les espèces absentes
+    de la table ne sont pas retournées.
+    """
+    names = pl.DataFrame({"label": list(species)}).with_columns(
+        normalize_species_name(col("label")).alias("species_name")
+    )
+    found = read_database_arrow(
+        """
+            SELECT species_name, regne, phylum, classe, ordre, famille
+            FROM taxonomy
+            WHERE species_name = ANY(:names)
+        """,
+        engine,
+        params={"names": names["species_name"].unique().to_list()},
+    )
+    lookup = names.join(found, on="species_name", how="inner")
+
+    return {
+        row.pop("label"): {k: v for k, v in row.items() if k != "species_name"}
+        for row in lookup.iter_rows(named=True)
+    }
+
+
 def _check_duplicates(frame: pl.DataFrame):
     frame = frame.sort("species_name").filter(col("species_name").is_duplicated())
     if frame.is_empty():
@@ -0,0 +1,290 @@
+"""
+File de travail PostgreSQL pour les étapes ML (crop puis classification).
+
+Les observations candidates sont ajoutées à ml_work_queue, puis chaque
+worker réserve un lot avec FOR UPDATE SKIP LOCKED : plusieurs workers
+(sur une ou plusieurs machines) vident la file en parallèle sans traiter
+deux fois la même observation.
+
+Cycle de vie d'une ligne :
+    pending → leased → done
+                     → pending (échec, nouvelle tentative)
+                     → failed  (échec après ML_MAX_ATTEMPTS tentatives)
+
+Un bail expiré (worker mort) rend l'observation de nouveau réservable,
+ou la passe en failed si elle a épuisé ses tentatives. Une observation
+réservée qui n'a plus de photo exploitable passe directement en failed.
+"""
+
+import os
+import socket
+from typing import Iterable, Optional, Sequence
+
+import polars as pl
+import structlog
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+LOGGER = structlog.get_logger()
+load_dotenv()
+
+ML_BATCH_SIZE = int(os.getenv("ML_BATCH_SIZE", "20"))
+ML_LEASE_SECONDS = int(os.getenv("ML_LEASE_SECONDS", "3600"))
+ML_MAX_ATTEMPTS = int(os.getenv("ML_MAX_ATTEMPTS", "3"))
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_ml_candidates(engine) -> int:
+    """
+    Ajoute à la file les observations non validées avec photo qui ne sont
+    passées ni par ml_crops ni par ml_no_crops.
+
+    Retourne:
+        Nombre d'observations ajoutées
+    """
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            INSERT INTO ml_work_queue (id_observation)
+            SELECT o.id_observation
+            FROM observations o
+            WHERE o.validee IS FALSE
+            AND EXISTS (
+                SELECT 1 FROM observation_photos p
+                WHERE p.id_observation = o.id_observation
+                AND p.url LIKE 'https:%'
+                AND p.status <> 'failed'
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM ml_crops c WHERE c.id_observation = o.id_observation
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM ml_no_crops n WHERE n.id_observation = o.id_observation
+            )
+            ON CONFLICT (id_observation) DO NOTHING
+        """))
+
+    LOGGER.info("ml_work_queue: observations ajoutées", rows=result.rowcount)
+    return result.rowcount
+
+
+def _expire_exhausted_leases(conn, max_attempts: int) -> int:
+    """
+    Bail expiré sans tentative restante (worker mort au dernier essai) :
+    l'observation ne serait plus jamais réservée, elle passe en failed.
+    """
+    result = conn.execute(text("""
+        UPDATE ml_work_queue SET
+            status = 'failed',
+            lease_expires_at = NULL,
+            last_error = COALESCE(last_error, 'bail expiré après ' || attempts || ' tentatives'),
+            updated_at = now()
+        WHERE status = 'leased'
+        AND lease_expires_at < now()
+        AND attempts >= :max_attempts
+    """), {"max_attempts": max_attempts})
+
+    if result.rowcount:
+        LOGGER.warning("ml_work_queue: baux expirés passés en failed", rows=result.rowcount)
+    return result.rowcount
+
+
+def lease_observations(
+    engine,
+    batch_size: Optional[int] = None,
+    worker_id: Optional[str] = None,
+    lease_seconds: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    Réserve jusqu'à batch_size observations pour ce worker et retourne
+    les colonnes utiles au flow ML (mêmes colonnes que
+    load_observations_from_db_for_ML).
+    """
+    params = {
+        "batch_size": batch_size or ML_BATCH_SIZE,
+        "worker_id": worker_id or default_worker_id(),
+        "lease_seconds": lease_seconds or ML_LEASE_SECONDS,
+        "max_attempts": max_attempts or ML_MAX_ATTEMPTS,
+    }
+
+    query = """
+        WITH claimed AS (
+            SELECT
+                q.id_observation,
+                EXISTS (
+                    SELECT 1 FROM observation_photos p
+                    WHERE p.id_observation = q.id_observation
+                    AND p.url LIKE 'https:%'
+                    AND p.status <> 'failed'
+                ) AS has_photo
+            FROM ml_work_queue q
+            WHERE attempts < :max_attempts
+            AND (
+                status = 'pending'
+                OR (status = 'leased' AND lease_expires_at < now())
+            )
+            ORDER BY id_observation
+            LIMIT :batch_size
+            FOR UPDATE OF q SKIP LOCKED
+        ),
+        leased AS (
+            -- Sans photo exploitable (photos passées en failed depuis
+            -- l'ajout à la file) : échec immédiat plutôt qu'un bail que
+            -- le worker ne verrait jamais
+            UPDATE ml_work_queue q SET
+                status = CASE WHEN claimed.has_photo THEN 'leased' ELSE 'failed' END,
+                attempts = q.attempts + 1,
+                leased_by = :worker_id,
+                lease_expires_at = CASE
+                    WHEN claimed.has_photo THEN now() + make_interval(secs => :lease_seconds)
+                END,
+                last_error = CASE
+                    WHEN claimed.has_photo THEN q.last_error
+                    ELSE 'aucune photo exploitable'
+                END,
+                updated_at = now()
+            FROM claimed
+            WHERE q.id_observation = claimed.id_observation
+            RETURNING q.id_observation, q.status
+        )
+        SELECT
+            o.id_observation,
+            p.url AS photos,
+            p.photo_index,
+            o.latitude,
+            o.longitude,
+            o.relais,
+            e.nearest_commune,
+            e.reg_nom,
+            e.dep_nom,
+            o.validee
+        FROM leased
+        JOIN observations o USING (id_observation)
+        JOIN LATERAL (
+            -- Première photo exploitable de l'observation
+            SELECT p.url, p.photo_index
+            FROM observation_photos p
+            WHERE p.id_observation = o.id_observation
+            AND p.url LIKE 'https:%'
+            AND p.status <> 'failed'
+            ORDER BY p.photo_index
+            LIMIT 1
+        ) p ON TRUE
+        LEFT JOIN observations_enriched e USING (id_observation)
+        WHERE leased.status = 'leased'
+    """
+
+    with engine.begin() as conn:
+        _expire_exhausted_leases(conn, params["max_attempts"])
+        df = pl.read_database(
+            query=text(query),
+            connection=conn,
+            execute_options={"parameters": params},
+        )
+
+    LOGGER.info(
+        "ml_work_queue: lot réservé",
+        rows=len(df),
+        worker_id=params["worker_id"],
+    )
+    return df
+
+
+def _log_lost_leases(action: str, ids: Sequence[int], rowcount: int, worker_id: str):
+    """Bail expiré puis repris par un autre worker : ces lignes ne sont plus à nous."""
+    if rowcount < len(ids):
+        LOGGER.warning(
+            "ml_work_queue: baux perdus, lignes ignorées",
+            action=action,
+            rows=len(ids),
+            rows_updated=rowcount,
+            worker_id=worker_id,
+        )
+
+
+def complete_observations(
+    engine,
+    ids: Sequence[int],
+    worker_id: Optional[str] = None,
+) -> None:
+    """
+    Marque les observations comme traitées. Seules les lignes encore
+    réservées par ce worker sont modifiées.
+    """
+    if not len(ids):
+        return
+
+    worker_id = worker_id or default_worker_id()
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            UPDATE ml_work_queue SET
+                status = 'done',
+                lease_expires_at = NULL,
+                last_error = NULL,
+                updated_at = now()
+            WHERE id_observation = ANY(:ids)
+            AND leased_by = :worker_id
+            AND status = 'leased'
+        """), {"ids": list(ids), "worker_id": worker_id})
+
+    _log_lost_leases("complete", ids, result.rowcount, worker_id)
+
+
+def fail_observations(
+    engine,
+    ids: Sequence[int],
+    error: str,
+    max_attempts: Optional[int] = None,
+    worker_id: Optional[str] = None,
+) -> None:
+    """
+    Libère le bail après un échec : l'observation repasse en pending,
+    ou en failed si le nombre maximal de tentatives est atteint. Seules
+    les lignes encore réservées par ce worker sont modifiées.
+    """
+    if not len(ids):
+        return
+
+    worker_id = worker_id or default_worker_id()
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            UPDATE ml_work_queue SET
+                status = CASE
+                    WHEN attempts >= :max_attempts THEN 'failed'
+                    ELSE 'pending'
+                END,
+                lease_expires_at = NULL,
+                last_error = :error,
+                updated_at = now()
+            WHERE id_observation = ANY(:ids)
+            AND leased_by = :worker_id
+            AND status = 'leased'
+        """), {
+            "ids": list(ids),
+            "error": error,
+            "max_attempts": max_attempts or ML_MAX_ATTEMPTS,
+            "worker_id": worker_id,
+        })
+
+    LOGGER.warning("ml_work_queue: lot en échec", rows=result.rowcount, error=error)
+    _log_lost_leases("fail", ids, result.rowcount, worker_id)
+
+
+def settle_observations(
+    engine,
+    leased_ids: Sequence[int],
+    done_ids: Iterable[int],
+    error: str,
+    worker_id: Optional[str] = None,
+) -> None:
+    """
+    Clôt un lot réservé : les ids de done_ids passent en done, les autres
+    repassent en pending (ou failed) pour être repris, par exemple sur la
+    photo exploitable suivante après un téléchargement en échec.
+    """
+    done = {int(i) for i in done_ids}
+    complete_observations(engine, [i for i in leased_ids if i in done], worker_id=worker_id)
+    fail_observations(engine, [i for i in leased_ids if i not in done], error, worker_id=worker_id)
@@ -1,53 +1,3 @@
-CREATE TABLE IF NOT EXISTS doris_table (
-    nom_scientifique TEXT,
-    lien_doris TEXT,
-    UNIQUE (nom_scientifique)
-);
-
-CREATE TABLE IF NOT EXISTS ml_no_crops (
-    run_name TEXT,
-    id_observation TEXT PRIMARY KEY,
-    path_s3 TEXT
-);
-
-CREATE TABLE IF NOT EXISTS ml_crops (
-    run_name TEXT,
-    id_crops TEXT PRIMARY KEY,
-    regne TEXT,
-    confiance FLOAT,
-    path_s3 TEXT
-);
-
-CREATE TABLE IF NOT EXISTS ml_taxonomy (
-    run_name TEXT,
-    id_crops TEXT PRIMARY KEY,
-    id_observation INT,
-    latitude FLOAT,
-    longitude FLOAT,
-    regne TEXT,
-    confiance FLOAT,
-    path_s3 TEXT,
-    nom_scientifique TEXT,
-    lien_doris TEXT
-);
-
-CREATE TABLE IF NOT EXISTS observations (
-    id_observation INT PRIMARY KEY,
-    date_observation TIMESTAMP,
-    lien_observation TEXT,
-    observateur TEXT,
-    url_sortie TEXT,
-    espece_identifiee TEXT,
-    heure_debut TIME,
-    heure_fin TIME,
-    latitude FLOAT,
-    longitude FLOAT,
-    photos TEXT,
-    relais INT,
-    id_espece INT,
-    nom_scientifique TEXT,
-    nom_commun TEXT,
-    categorie_programme INT,
-    programme TEXT,
-    validee TEXT
-);
\ No newline at end of file
+-- Le schéma est géré par les migrations versionnées (biolit/migrations.py),
+-- appliquées au démarrage du pipeline (pipelines/run.py).
+-- Ne pas ajouter de DDL ici : les tables divergeraient à nouveau.
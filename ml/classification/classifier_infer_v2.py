@@ -2,6 +2,7 @@
 Inference du modèle de classification
 """
 
+import os
 import pickle
 from dataclasses import dataclass
 from pathlib import Path
@@ -62,13 +63,31 @@ def _hf_download(filename: str) -> Path:
     return Path(hf_hub_download(repo_id=HF_REPO_ID, filename=filename))
 
 
+def load_tax_lookup_from_db(species_list: list) -> dict:
+    """
+    Taxonomie des espèces du modèle depuis la table taxonomy (PostgreSQL).
+    Retourne {} si la base n'est pas configurée ou inaccessible.
+    """
+    if not os.getenv("POSTGRES_URL"):
+        return {}
+    try:
+        from biolit.engine import get_shared_engine
+        from biolit.taxref import load_tax_lookup_from_db as _load
+
+        return _load(get_shared_engine(), species_list)
+    except Exception as e:
+        print(f"⚠ Taxonomie indisponible en base ({e!r}) — repli sur {TAX_LOOKUP_FILE.name}")
+        return {}
+
+
 def load_model(device: torch.device = DEVICE) -> BioModel:
     """
     Charge le modèle depuis Hugging Face Hub.
+    La taxonomie vient de la table taxonomy ; le pickle tax_lookup
+    n'est téléchargé que pour les espèces absentes de la base.
     """
     print(f"Chargement depuis Hugging Face : {HF_REPO_ID}")
     model_file = _hf_download(MODEL_FILE.name)
-    tax_file   = _hf_download(TAX_LOOKUP_FILE.name)
     mlp_file   = _hf_download(MLP_MODEL_FILE.name)
 
     # === Proto-CLIP ===
@@ -80,8 +99,13 @@ def load_model(device: torch.device = DEVICE) -> BioModel:
     temperature = float(data["temperature"][0])
 
     # === Taxonomie ===
-    with open(tax_file, "rb") as f:
-        tax_lookup = pickle.load(f)
+    tax_lookup = load_tax_lookup_from_db(species_list)
+    missing = [sp for sp in species_list if sp not in tax_lookup]
+    if missing:
+        print(f"Taxonomie : {len(missing)} espèces absentes de la base → {TAX_LOOKUP_FILE.name}")
+        with open(_hf_download(TAX_LOOKUP_FILE.name), "rb") as f:
+            pickled = pickle.load(f)
+        tax_lookup.update({sp: pickled[sp] for sp in missing if sp in pickled})
 
     # === MLP par niveau ===
     mlp_dict = {}
@@ -9,7 +9,9 @@ import os
 import structlog
 import polars as pl
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+
+from biolit.bulk_load import copy_into_table
+from biolit.engine import get_shared_engine
 
 LOGGER = structlog.get_logger()
 load_dotenv()
@@ -22,7 +24,7 @@ def get_engine():
             "POSTGRES_URL manquant dans .env — "
             "utilise --no-db pour tester sans PostgreSQL"
         )
-    return create_engine(url)
+    return get_shared_engine(url)
 
 
 def insert_taxonomy_predictions(df: pl.DataFrame, run_name: str) -> None:
@@ -38,43 +40,28 @@ def insert_taxonomy_predictions(df: pl.DataFrame, run_name: str) -> None:
     """
     engine = get_engine()
 
-    rows = []
-    for row in df.iter_rows(named=True):
-        rows.append({
-            "run_name": run_name,
-            "id_crops": row["id_crops"],
-            "id_observation": row.get("id_observation"),
-            "latitude": row.get("latitude"),
-            "longitude": row.get("longitude"),
-            "regne": row.get("regne_yolo"),
-            "confiance": row.get("confiance_yolo"),
-            "path_s3": row.get("path_s3"),
-            "nom_scientifique": row.get("best_label"),
-            "lien_doris": row.get("lien_doris"),
-        })
+    nullable = ["id_observation", "path_s3", "latitude", "longitude", "lien_doris"]
+    df = df.with_columns(
+        [pl.lit(None).alias(col) for col in nullable if col not in df.columns]
+    ).select(
+        pl.lit(run_name).alias("run_name"),
+        "id_crops",
+        "id_observation",
+        "latitude",
+        "longitude",
+        pl.col("regne_yolo").alias("regne"),
+        pl.col("confiance_yolo").alias("confiance"),
+        "path_s3",
+        pl.col("best_label").alias("nom_scientifique"),
+        "lien_doris",
+    )
 
-    with engine.begin() as conn:
-        for row in rows:
-            conn.execute(
-                text("""
-                    INSERT INTO ml_taxonomy (
-                        run_name, id_crops, id_observation,
-                        latitude, longitude,
-                        regne, confiance, path_s3,
-                        nom_scientifique, lien_doris
-                    ) VALUES (
-                        :run_name, :id_crops, :id_observation,
-                        :latitude, :longitude,
-                        :regne, :confiance, :path_s3,
-                        :nom_scientifique, :lien_doris
-                    )
-                    ON CONFLICT (id_crops) DO UPDATE SET
-                        run_name        = EXCLUDED.run_name,
-                        nom_scientifique = EXCLUDED.nom_scientifique,
-                        confiance       = EXCLUDED.confiance,
-                        lien_doris      = EXCLUDED.lien_doris
-                """),
-                row,
-            )
+    rows = copy_into_table(
+        df,
+        "ml_taxonomy",
+        engine,
+        conflict_columns=["id_crops"],
+        update_columns=["run_name", "nom_scientifique", "confiance", "lien_doris"],
+    )
 
-    LOGGER.info("ml_taxonomy: %d lignes insérées (run=%s)", len(rows), run_name)
+    LOGGER.info("ml_taxonomy: lignes insérées", rows_inserted=rows, run=run_name)
@@ -1,10 +1,12 @@
 import argparse
+import hashlib
 import json
 import logging
 import time
 import polars as pl
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Optional
 import yaml
 import torch
 import requests
@@ -14,6 +16,7 @@ from ultralytics import YOLO
 from .model_loader import load_model_weights
 from .utils.logger import setup_logger
 from biolit.s3 import create_s3_client, upload_image_s3
+from biolit.run_registry import count_bytes
 
 import ultralytics.nn.modules as modules
 import sys
@@ -254,32 +257,82 @@ def run_predict(source: str, config_path: str, run_name: str, log_level: str = "
     )
     return df_crops, df_no_crops, crops_images
 
-def download_all_images(df, tmp_dir: str):
+def download_all_images(df, tmp_dir: str) -> pl.DataFrame:
+    """
+    Télécharge une photo par observation (colonne photos = URL).
+
+    Retourne le statut de chaque photo, pour observation_photos :
+    (id_observation, photo_index, url, status, content_hash, width, height).
+    Une photo en échec est ignorée sans interrompre le lot.
+    """
     tmp_dir = Path(tmp_dir)
-    paths = []
+    statuses = []
 
     for row in df.to_dicts():
         id_obs = row["id_observation"]
         url = row["photos"]
 
         file_path = tmp_dir / f"{id_obs}.jpg"
-
-        response = requests.get(url,stream=True)
-        # response = requests.get(url, stream=True)
-        response.raise_for_status()
-
-        with open(file_path, "wb") as f:
-            for chunk in response.iter_content(1024 * 1024):
-                f.write(chunk)
-
-        paths.append(str(file_path))
-
-    return paths
+        status = {
+            "id_observation": id_obs,
+            "photo_index": row.get("photo_index") or 0,
+            "url": url,
+            "status": "failed",
+            "content_hash": None,
+            "width": None,
+            "height": None,
+        }
+
+        try:
+            response = requests.get(url,stream=True)
+            response.raise_for_status()
+
+            digest = hashlib.sha256()
+            with open(file_path, "wb") as f:
+                for chunk in response.iter_content(1024 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    count_bytes(downloaded=len(chunk))
+
+            # Lecture de l'en-tête seulement
+            with Image.open(file_path) as img:
+                status["width"], status["height"] = img.size
+            status["content_hash"] = digest.hexdigest()
+            status["status"] = "fetched"
+        except Exception:
+            LOGGER.warning("Téléchargement photo impossible", id_observation=id_obs, url=url, exc_info=True)
+            file_path.unlink(missing_ok=True)
+
+        statuses.append(status)
+
+    return pl.DataFrame(
+        statuses,
+        schema={
+            "id_observation": pl.Int64,
+            "photo_index": pl.Int32,
+            "url": pl.Utf8,
+            "status": pl.Utf8,
+            "content_hash": pl.Utf8,
+            "width": pl.Int32,
+            "height": pl.Int32,
+        },
+    )
 
 
-def flow_ml_crops(df: pl.DataFrame, config: Path, run_name: str) -> tuple[pl.DataFrame, pl.DataFrame, dict]:
+def flow_ml_crops(
+    df: pl.DataFrame,
+    config: Path,
+    run_name: str,
+    on_download: Optional[Callable[[pl.DataFrame], None]] = None,
+) -> tuple[pl.DataFrame, pl.DataFrame, dict]:
+    """
+    on_download reçoit le statut des photos téléchargées
+    (ex: enregistrement dans observation_photos).
+    """
     with tempfile.TemporaryDirectory() as tmp_dir:
-        download_all_images(df, tmp_dir)
+        photo_status = download_all_images(df, tmp_dir)
+        if on_download is not None:
+            on_download(photo_status)
         df_crops, df_no_crops, crops_images = run_predict(
             source=tmp_dir,
             config_path=config,
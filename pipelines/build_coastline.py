@@ -0,0 +1,26 @@
+import argparse
+import sys
+from pathlib import Path
+
+_base_dir = str(Path(__file__).parent.parent)
+if _base_dir not in sys.path:
+    sys.path.insert(0, _base_dir)
+
+if True:
+    from biolit.geoloc import get_trace_littoral_aoi
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Construit le trait de côte découpé sur la zone d'intérêt et simplifié "
+            "(COASTLINE_AOI_BBOX, COASTLINE_AOI_MARGIN_M, COASTLINE_SIMPLIFY_TOLERANCE_M)"
+        )
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Reconstruit l'artefact même s'il existe déjà sur S3",
+    )
+    args = parser.parse_args()
+
+    get_trace_littoral_aoi(rebuild=args.rebuild)
@@ -1,21 +1,28 @@
-from biolit.export_api import fetch_biolit_from_api, adapt_api_to_dataframe
+from biolit.ingestion import ingest_observations
 from biolit.create_table import (
     get_engine,
-    create_table,
-    create_enriched_table,
-    create_db_finale_table,
-    create_taxonomy_queue_table,
-    prepare_dataframe_for_postgres,
     prepare_db_finale_dataframe,
-    insert_dataframe,
     insert_enriched_dataframe,
     insert_crops_dataframe,
     insert_no_crops_dataframe,
     insert_db_finale_dataframe,
     insert_taxonomy_queue_dataframe,
-    load_observations_from_db_for_ML
+    clear_image_path_cache,
+    update_photo_status,
+)
+from biolit.geoloc import iter_geoloc_enrichie_data_biolit_db
+from biolit.engine import get_pool_metrics
+from biolit.sql_metrics import set_sql_stage, log_sql_summary
+from biolit.migrations import run_migrations
+from biolit.run_registry import RunRecorder
+from biolit.work_queue import (
+    default_worker_id,
+    enqueue_ml_candidates,
+    lease_observations,
+    complete_observations,
+    fail_observations,
+    settle_observations,
 )
-from biolit.geoloc import geoloc_enrichie_data_biolit_db
 from biolit.flow_gatekeeper import(
     filter_observations_for_crop
 )
@@ -33,6 +40,7 @@ from biolit.s3 import (
 #from biolit.label_studio_postprocessing import (process_no_crop_annotations)
 from ml.crop_inference.predict import flow_ml_crops
 from ml.classification.pipeline_classification import flow_ml_classification
+import argparse
 import datetime
 import structlog
 import polars as pl
@@ -41,150 +49,260 @@ from dotenv import load_dotenv
 LOGGER = structlog.get_logger()
 load_dotenv()
 
-def run_pipeline():
-    dossier_inference = datetime.datetime.now().strftime("run_%Y%m%d_%H%M%S")
+def _observation_ids(*frames: pl.DataFrame) -> set:
+    """Ids d'observation présents dans les DataFrames (éventuellement vides, sans colonne)."""
+    return {
+        int(i)
+        for df in frames
+        if "id_observation" in df.columns
+        for i in df["id_observation"].to_list()
+    }
+
+def run_pipeline(
+    full_refresh: bool = False,
+    replay: bool | None = None,
+    ml_batch_size: int | None = None,
+    recompute_all: bool = False,
+):
+    run_started_at = datetime.datetime.now()
+    dossier_inference = run_started_at.strftime("run_%Y%m%d_%H%M%S")
     LOGGER.info(dossier_inference)
+    engine = get_engine()
+    clear_image_path_cache()
 
-    # -------------------------
-    # 1. INGESTION API
-    # -------------------------
-    LOGGER.info("Fetching data...")
-    data = fetch_biolit_from_api()
+    set_sql_stage("migrations")
+    LOGGER.info("Applying schema migrations...")
+    run_migrations(engine)
 
-    LOGGER.info("Transforming...")
-    df = adapt_api_to_dataframe(data)
+    options = {
+        "full_refresh": full_refresh,
+        "replay": replay,
+        "ml_batch_size": ml_batch_size,
+        "recompute_all": recompute_all,
+    }
+    # Toute exception, dans une étape ou entre deux, marque le run en échec
+    with RunRecorder(engine, dossier_inference, options=options) as recorder:
+        _run_stages(engine, recorder, run_started_at, dossier_inference, **options)
 
-    LOGGER.info("Preparing for Postgres...")
-    df = prepare_dataframe_for_postgres(df)
+    LOGGER.info("Pool Postgres", **get_pool_metrics())
+    log_sql_summary()
+    LOGGER.info("Fin du Flow : succès ✅")
 
-    LOGGER.info("Creating table if not exists...")
-    create_table()
 
-    LOGGER.info("Loading into Postgres...")
-    insert_dataframe(df)
+def _run_stages(
+    engine,
+    recorder: RunRecorder,
+    run_started_at: datetime.datetime,
+    dossier_inference: str,
+    full_refresh: bool,
+    replay: bool | None,
+    ml_batch_size: int | None,
+    recompute_all: bool,
+):
+    # -------------------------
+    # 1. INGESTION API
+    # -------------------------
+    with recorder.stage("ingestion") as stats:
+        ingest_observations(
+            engine,
+            run_started_at,
+            full_refresh=full_refresh,
+            replay=replay,
+            stats=stats,
+        )
 
     # -------------------------
     # 2. ENRICHISSEMENT GEOLOC
     # -------------------------
-    LOGGER.info("Starting geolocation enrichment...")
-    engine = get_engine()
-    df_geo = geoloc_enrichie_data_biolit_db(engine)
-
-    LOGGER.info("Creating enriched table if not exists...")
-    create_enriched_table(engine)
-
-    LOGGER.info("Saving enriched data into Postgres...")
-    insert_enriched_dataframe(df_geo, engine)
-    LOGGER.info("Geoloc Enrichment DONE ✅")
+    with recorder.stage("geoloc") as stats:
+        LOGGER.info("Starting geolocation enrichment...", recompute_all=recompute_all)
+        # Chunk par chunk, observations nouvelles ou déplacées uniquement
+        for df_geo in iter_geoloc_enrichie_data_biolit_db(engine, recompute_all=recompute_all):
+            LOGGER.info("Saving enriched data into Postgres...", rows=len(df_geo))
+            insert_enriched_dataframe(df_geo, engine)
+            stats["rows_in"] += len(df_geo)
+            stats["rows_out"] += len(df_geo)
+        LOGGER.info("Geoloc Enrichment DONE ✅")
 
     # -------------------------
     # 3. FLOW ML CROPS
     # -------------------------
-    LOGGER.info("Creating tables for ML if not exist...")
-    create_db_finale_table(engine)
-    create_taxonomy_queue_table(engine)
-
-    LOGGER.info("Récupération des données à traiter pour le ML")
-    df_ml = load_observations_from_db_for_ML(engine)
-    # On filtre le df avec toutes les images qui sont déjà passées dans le flow
-    df_ml_to_process = filter_observations_for_crop(df_ml, engine)
-    nb_to_process = len(df_ml_to_process)
-
-    LOGGER.info(
-        "Nombre d'observations à traiter",
-        value=nb_to_process
-    )
+    with recorder.stage("ml_crops") as stats:
+        LOGGER.info("Récupération des données à traiter pour le ML")
+        enqueue_ml_candidates(engine)
+        # Lot réservé pour ce worker : les autres workers ne le verront pas
+        worker_id = default_worker_id()
+        df_ml = lease_observations(engine, batch_size=ml_batch_size, worker_id=worker_id)
+        leased_ids = df_ml["id_observation"].to_list()
+        stats["rows_in"] = len(df_ml)
+        # On filtre le df avec toutes les images qui sont déjà passées dans le flow
+        df_ml_to_process = filter_observations_for_crop(df_ml, engine)
+        nb_to_process = len(df_ml_to_process)
+
+        LOGGER.info(
+            "Nombre d'observations à traiter",
+            value=nb_to_process
+        )
+
+        if nb_to_process == 0:
+            complete_observations(engine, leased_ids, worker_id=worker_id)
+        else:
+            LOGGER.info("Lancement du Flow de ML Crop")
+            config_name="ml/crop_inference/config.yaml"
+            try:
+                df_crops, df_no_crops, crops_images= flow_ml_crops(
+                    df_ml_to_process,
+                    config_name,
+                    dossier_inference,
+                    on_download=lambda df_photos: update_photo_status(df_photos, engine),
+                )
+                LOGGER.info("Cropping des images réalisées")
+                LOGGER.info("Crops uploadés sur S3")
+
+                LOGGER.info("Enregistrement des observations traitées dans Postgres")
+                insert_crops_dataframe(df_crops, engine)
+                insert_no_crops_dataframe(df_no_crops, engine)
+            except Exception as e:
+                fail_observations(engine, leased_ids, repr(e), worker_id=worker_id)
+                raise
+            # Traitées : présentes dans ml_crops / ml_no_crops, ou écartées
+            # par le gatekeeper. Les autres (photo non téléchargée) repartent
+            # en file pour leur photo exploitable suivante.
+            settle_observations(
+                engine,
+                leased_ids,
+                done_ids=(
+                    set(leased_ids) - set(df_ml_to_process["id_observation"].to_list())
+                ) | _observation_ids(df_crops, df_no_crops),
+                error="photo non téléchargée",
+                worker_id=worker_id,
+            )
+            stats["rows_out"] = len(df_crops) + len(df_no_crops)
+            LOGGER.info("Table de Crops et No Crops mises à jours")
 
     if nb_to_process == 0:
         LOGGER.info("Aucune nouvelle observation à traiter → arrêt du pipeline ✅")
+        recorder.skip(
+            "ml_taxonomie",
+            "label_studio_no_crops",
+            "label_studio_annotations",
+            "cleaning",
+            reason="aucune observation à traiter",
+        )
         return
 
-    LOGGER.info("Lancement du Flow de ML Crop")
-    config_name="ml/crop_inference/config.yaml"
-    df_crops, df_no_crops, crops_images= flow_ml_crops(df_ml_to_process, config_name, dossier_inference)
-    LOGGER.info("Cropping des images réalisées")
-    LOGGER.info("Crops uploadés sur S3")
-
-    LOGGER.info("Enregistrement des observations traitées dans Postgres")
-    insert_crops_dataframe(df_crops, engine)
-    insert_no_crops_dataframe(df_no_crops, engine)
-    LOGGER.info("Table de Crops et No Crops mises à jours")
-
     # -------------------------
     # 4. PASSAGE ML TAXONOMIE EXPORT VERS LABEL STUDIO
     # -------------------------
-    if len(crops_images) > 0:
-        LOGGER.info("Lancement du Flow de Classification Taxonomique")
-        df_taxonomy = flow_ml_classification(crops_images, df_crops)
-
-        s3_client = create_s3_client()
-        parquet_key = f"{dossier_inference}/taxonomy/predictions.parquet"
-        upload_parquet_s3(s3_client, df_taxonomy, "biolit-uploads", parquet_key)
-
-        # Ajout des lien Doris
-        doris_file = _read_file_s3(s3_client, "biolit-uploads", "lien_doris/lien_doris.csv")
-        df_doris = pl.read_parquet(doris_file)
-        LOGGER.info("Fichier avec les liens Doris Lu")
-        df_doris = df_doris.with_columns(pl.col("nom_scientifique").str.to_lowercase())
-        df_taxonomy = df_taxonomy.with_columns(pl.col("species_name").str.to_lowercase())
-        # Enrichissement fichier taxo avec les liens Doris
-        df_taxonomy = df_taxonomy.join(df_doris, left_on="species_name", right_on="nom_scientifique", how="left")
-        df_taxonomy = df_taxonomy.with_columns(
-            pl.col("id_observation").cast(pl.Int64)
-        ).join(
-            df_ml_to_process, on="id_observation"
-        )
-        push_tasks_label_studio_crops("Biolit Crops", df_taxonomy)
-        LOGGER.info("Classification taxonomique DONE ✅")
-    else:
-        LOGGER.info("Aucun crop à classifier → skip taxonomie ✅")
+    with recorder.stage("ml_taxonomie") as stats:
+        stats["rows_in"] = len(crops_images)
+        if len(crops_images) > 0:
+            LOGGER.info("Lancement du Flow de Classification Taxonomique")
+            df_taxonomy = flow_ml_classification(crops_images, df_crops)
+
+            s3_client = create_s3_client()
+            parquet_key = f"{dossier_inference}/taxonomy/predictions.parquet"
+            upload_parquet_s3(s3_client, df_taxonomy, "biolit-uploads", parquet_key)
+
+            # Ajout des lien Doris
+            doris_file = _read_file_s3(s3_client, "biolit-uploads", "lien_doris/lien_doris.csv")
+            df_doris = pl.read_parquet(doris_file)
+            LOGGER.info("Fichier avec les liens Doris Lu")
+            df_doris = df_doris.with_columns(pl.col("nom_scientifique").str.to_lowercase())
+            df_taxonomy = df_taxonomy.with_columns(pl.col("species_name").str.to_lowercase())
+            # Enrichissement fichier taxo avec les liens Doris
+            df_taxonomy = df_taxonomy.join(df_doris, left_on="species_name", right_on="nom_scientifique", how="left")
+            df_taxonomy = df_taxonomy.with_columns(
+                pl.col("id_observation").cast(pl.Int64)
+            ).join(
+                df_ml_to_process, on="id_observation"
+            )
+            push_tasks_label_studio_crops("Biolit Crops", df_taxonomy)
+            stats["rows_out"] = len(df_taxonomy)
+            LOGGER.info("Classification taxonomique DONE ✅")
+        else:
+            LOGGER.info("Aucun crop à classifier → skip taxonomie ✅")
 
     # -------------------------
     # 5. ENVOIE DES IMAGES NON CROPPEES A LABEL STUDIO
     # -------------------------
-    LOGGER.info("Connection to Label Studio...")
-    if len(df_no_crops) == 0:
-        LOGGER.info("Aucune image à envoyer à Label Studio → skip ✅")
-    else:
-        df_no_crops = df_no_crops.with_columns(
-            pl.col("id_observation").cast(pl.Int64)
-        ).join(
-            df_ml_to_process, on="id_observation"
-        )
+    with recorder.stage("label_studio_no_crops") as stats:
+        LOGGER.info("Connection to Label Studio...")
+        stats["rows_in"] = len(df_no_crops)
+        if len(df_no_crops) == 0:
+            LOGGER.info("Aucune image à envoyer à Label Studio → skip ✅")
+        else:
+            df_no_crops = df_no_crops.with_columns(
+                pl.col("id_observation").cast(pl.Int64)
+            ).join(
+                df_ml_to_process, on="id_observation"
+            )
 
-        push_tasks_label_studio_no_crops("Biolit No Crops", df_no_crops)
-        LOGGER.info("LABEL STUDIO DONE ✅")
+            push_tasks_label_studio_no_crops("Biolit No Crops", df_no_crops)
+            stats["rows_out"] = len(df_no_crops)
+            LOGGER.info("LABEL STUDIO DONE ✅")
 
     # -------------------------
     # 6. RECUPERATION DES INFOS DEPUIS LABEL STUDIO
     # -------------------------
-    LOGGER.info("Récupération des annotations réalisées depuis le dernier run ...")
-    data_label_studio_crops = extract_crops_data_from_label_studio("Biolit Crops", datetime.datetime(2025, 1, 1), datetime.datetime(2027, 1, 1))
-    LOGGER.info("Data collected from label studio projet Crops")
-    data_label_studio_no_crops = extract_no_crops_data_from_label_studio("Biolit No Crops", datetime.datetime(2025, 1, 1), datetime.datetime(2027, 1, 1))
-    LOGGER.info("Data collected from label studio projet No Crops")
-
-    # Insertion des données récupérées dans les tables postgresql
-    data_label_studio_crops_filtered = prepare_db_finale_dataframe(data_label_studio_crops)
-    insert_db_finale_dataframe(data_label_studio_crops_filtered, engine)
-    LOGGER.info("Insertion db_finale terminée projet crops", rows_inserted=len(data_label_studio_crops_filtered))
-    data_label_studio_no_crops_filtered = prepare_db_finale_dataframe(data_label_studio_no_crops)
-    LOGGER.info("Insertion db_finale terminée projet no crops", rows_inserted=len(data_label_studio_no_crops_filtered))
-    insert_db_finale_dataframe(data_label_studio_no_crops_filtered, engine)
-
-    # Enregistrement données de crops pour réentrainnement
-    insert_taxonomy_queue_dataframe(data_label_studio_no_crops, engine)
-    LOGGER.info("Stockage données pour réentrainement projet, nombre de lignes stockées", rows_inserted=len(data_label_studio_no_crops))
+    with recorder.stage("label_studio_annotations") as stats:
+        LOGGER.info("Récupération des annotations réalisées depuis le dernier run ...")
+        data_label_studio_crops = extract_crops_data_from_label_studio("Biolit Crops", datetime.datetime(2025, 1, 1), datetime.datetime(2027, 1, 1))
+        LOGGER.info("Data collected from label studio projet Crops")
+        data_label_studio_no_crops = extract_no_crops_data_from_label_studio("Biolit No Crops", datetime.datetime(2025, 1, 1), datetime.datetime(2027, 1, 1))
+        LOGGER.info("Data collected from label studio projet No Crops")
+        stats["rows_in"] = len(data_label_studio_crops) + len(data_label_studio_no_crops)
+
+        # Insertion des données récupérées dans les tables postgresql
+        data_label_studio_crops_filtered = prepare_db_finale_dataframe(data_label_studio_crops)
+        insert_db_finale_dataframe(data_label_studio_crops_filtered, engine)
+        LOGGER.info("Insertion db_finale terminée projet crops", rows_inserted=len(data_label_studio_crops_filtered))
+        data_label_studio_no_crops_filtered = prepare_db_finale_dataframe(data_label_studio_no_crops)
+        LOGGER.info("Insertion db_finale terminée projet no crops", rows_inserted=len(data_label_studio_no_crops_filtered))
+        insert_db_finale_dataframe(data_label_studio_no_crops_filtered, engine)
+        stats["rows_out"] = len(data_label_studio_crops_filtered) + len(data_label_studio_no_crops_filtered)
+
+        # Enregistrement données de crops pour réentrainnement
+        insert_taxonomy_queue_dataframe(data_label_studio_no_crops, engine)
+        LOGGER.info("Stockage données pour réentrainement projet, nombre de lignes stockées", rows_inserted=len(data_label_studio_no_crops))
 
     # -------------------------
     # 7. CLEANING : SUPPRESION TACHES LABEL STUDIO + SUPPRESSION IMAGES SUR S3
     # -------------------------
-    LOGGER.info("Cleaning des tâches annotées depuis le précédent flow ...")
-    LOGGER.info("Cleaning du S3 ...")
-    LOGGER.info("Cleaning de LabelStudio ...")
-
-    LOGGER.info("Fin du Flow : succès ✅")
-
+    with recorder.stage("cleaning"):
+        LOGGER.info("Cleaning des tâches annotées depuis le précédent flow ...")
+        LOGGER.info("Cleaning du S3 ...")
+        LOGGER.info("Cleaning de LabelStudio ...")
 
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline quotidien Biolit")
+    parser.add_argument(
+        "--ml-batch-size",
+        type=int,
+        default=None,
+        help="Nombre d'observations réservées pour le flow ML (défaut : ML_BATCH_SIZE)",
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Ignore le watermark et recharge tout l'historique de l'API",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        default=None,
+        help="Rejoue le dernier snapshot complet de l'API en cache (aucun appel réseau, défaut : BIOLIT_API_REPLAY)",
+    )
+    parser.add_argument(
+        "--recompute-all",
+        action="store_true",
+        help="Recalcule l'enrichissement géographique de toutes les observations (mise à jour des couches de référence)",
+    )
+    args = parser.parse_args()
+
+    run_pipeline(
+        full_refresh=args.full_refresh,
+        replay=args.replay,
+        ml_batch_size=args.ml_batch_size,
+        recompute_all=args.recompute_all,
+    )
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from biolit.api_cache import get_api_json, open_api_request
+
+
+def _response(status_code, body=b"", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.iter_content.return_value = [body[:5], body[5:]]
+    response.headers = headers or {}
+    return response
+
+
+class TestApiCache:
+    @patch("biolit.api_cache.requests.get")
+    def test_revalidation_etag_304(self, mock_get, tmp_path):
+        """Un 304 réutilise le snapshot enregistré au run précédent"""
+        body = json.dumps([{"id": 1}]).encode()
+        mock_get.return_value = _response(200, body, {"ETag": '"v1"'})
+        data, _ = get_api_json("https://api", cache_dir=tmp_path, replay=False)
+        assert data == [{"id": 1}]
+
+        mock_get.return_value = _response(304)
+        data, _ = get_api_json("https://api", cache_dir=tmp_path, replay=False)
+
+        assert data == [{"id": 1}]
+        assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+    @patch("biolit.api_cache.requests.get")
+    def test_replay_sans_reseau(self, mock_get, tmp_path):
+        """Le mode replay lit le snapshot sans appeler l'API"""
+        params = {"page": 2}
+        mock_get.return_value = _response(200, b'[{"id": 7}]', {"X-WP-TotalPages": "3"})
+        get_api_json("https://api", params, cache_dir=tmp_path, replay=False)
+        mock_get.reset_mock()
+
+        data, headers = get_api_json(None, params, cache_dir=tmp_path, replay=True)
+
+        mock_get.assert_not_called()
+        assert data == [{"id": 7}]
+        assert headers["X-WP-TotalPages"] == "3"
+
+    @patch("biolit.api_cache.requests.get")
+    def test_fenetres_incrementales_bornees(self, mock_get, tmp_path):
+        """Le watermark change à chaque run : l'ancien snapshot est supprimé"""
+        for since in ["2024-05-01T00:00:00", "2024-05-02T00:00:00"]:
+            mock_get.return_value = _response(200, b"[]")
+            get_api_json(
+                "https://api",
+                {"modified_after": since, "page": 1},
+                cache_dir=tmp_path,
+                replay=False,
+            )
+        mock_get.return_value = _response(200, b"[]")
+        get_api_json("https://api", {"page": 1}, cache_dir=tmp_path, replay=False)
+
+        assert len(list(tmp_path.glob("*.json.gz"))) == 2
+        assert len(list(tmp_path.glob("*.meta.json"))) == 2
+        data, _ = get_api_json(
+            None,
+            {"modified_after": "2024-05-02T00:00:00", "page": 1},
+            cache_dir=tmp_path,
+            replay=True,
+        )
+        assert data == []
+
+    def test_replay_sans_snapshot(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            open_api_request(None, {"page": 1}, cache_dir=tmp_path, replay=True)
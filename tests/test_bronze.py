@@ -0,0 +1,90 @@
+import datetime
+
+import polars as pl
+
+from biolit.bronze import (
+    append_observations_batch,
+    compact_observations,
+    scan_observations,
+)
+
+
+def _batch(ids, dates, espece):
+    return pl.DataFrame(
+        {
+            "id_observation": ids,
+            "date_observation": dates,
+            "nom_scientifique": espece,
+        }
+    )
+
+
+class TestBronze:
+    def test_partition_par_mois_et_scan_filtre(self, tmp_path):
+        append_observations_batch(
+            _batch(
+                [1, 2, 3],
+                [
+                    datetime.datetime(2024, 4, 30),
+                    datetime.datetime(2024, 5, 2),
+                    None,
+                ],
+                "carcinus maenas",
+            ),
+            root=tmp_path,
+        )
+
+        months = sorted(p.name for p in tmp_path.iterdir())
+        assert months == ["obs_month=2024-04", "obs_month=2024-05", "obs_month=unknown"]
+
+        out = scan_observations("2024-05", "2024-05", root=tmp_path).collect()
+        assert out["id_observation"].to_list() == [2]
+
+    def test_compaction_garde_la_derniere_version(self, tmp_path):
+        may = datetime.datetime(2024, 5, 2)
+        append_observations_batch(_batch([1, 2], [may, may], "ancien"), root=tmp_path)
+        append_observations_batch(_batch([2], [may], "corrige"), root=tmp_path)
+
+        assert compact_observations(root=tmp_path, min_files=2) == 1
+
+        partition = tmp_path / "obs_month=2024-05"
+        assert len(list(partition.glob("*.parquet"))) == 1
+        out = scan_observations(root=tmp_path).sort("id_observation").collect()
+        assert out["nom_scientifique"].to_list() == ["ancien", "corrige"]
+
+    def test_borne_exclut_partition_unknown(self, tmp_path):
+        append_observations_batch(
+            _batch([1, 2], [datetime.datetime(2024, 5, 2), None], "carcinus maenas"),
+            root=tmp_path,
+        )
+
+        out = scan_observations(start_month="2024-01", root=tmp_path).collect()
+        assert out["id_observation"].to_list() == [1]
+
+    def test_changement_de_mois_garde_la_derniere_version(self, tmp_path):
+        append_observations_batch(
+            _batch([1], [datetime.datetime(2024, 4, 30)], "ancien"), root=tmp_path
+        )
+        append_observations_batch(
+            _batch([1], [datetime.datetime(2024, 5, 2)], "corrige"), root=tmp_path
+        )
+
+        out = scan_observations(root=tmp_path).collect()
+        assert out["nom_scientifique"].to_list() == ["corrige"]
+        assert len(scan_observations(root=tmp_path, latest_only=False).collect()) == 2
+
+        # Plage bornée : seules les partitions demandées sont lues, la version
+        # périmée n'est retirée qu'avec across_partitions
+        april = scan_observations("2024-04", "2024-04", root=tmp_path).collect()
+        assert april["nom_scientifique"].to_list() == ["ancien"]
+        assert scan_observations(
+            "2024-04", "2024-04", root=tmp_path, across_partitions=True
+        ).collect().is_empty()
+
+    def test_plage_bornee_garde_la_derniere_version_du_mois(self, tmp_path):
+        may = datetime.datetime(2024, 5, 2)
+        append_observations_batch(_batch([1], [may], "ancien"), root=tmp_path)
+        append_observations_batch(_batch([1], [may], "corrige"), root=tmp_path)
+
+        out = scan_observations("2024-05", "2024-05", root=tmp_path).collect()
+        assert out["nom_scientifique"].to_list() == ["corrige"]
@@ -0,0 +1,136 @@
+import datetime
+
+import polars as pl
+
+from biolit.bulk_load import copy_into_table, upsert_changed_rows
+
+
+class FakeCursor:
+    def __init__(self):
+        self.statements = []
+        self.copied = []
+        self.rowcount = 0
+        self.description = None
+        self.result = None
+
+    def execute(self, query):
+        self.statements.append(query)
+        if query.strip().startswith("INSERT"):
+            self.rowcount = sum(len(c.splitlines()) for c in self.copied)
+        if query.strip().startswith("WITH upserted"):
+            self.description = [("inserted",), ("updated",)]
+
+    def fetchone(self):
+        return self.result
+
+    def copy_expert(self, query, buffer):
+        self.statements.append(query)
+        self.copied.append(buffer.read().decode())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self.connection = self
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeEngine:
+    def __init__(self):
+        self.cursor = FakeCursor()
+
+    def begin(self):
+        return FakeConnection(self.cursor)
+
+
+class TestCopyIntoTable:
+    def test_copy_par_chunks_puis_insert_unique(self):
+        engine = FakeEngine()
+        df = pl.DataFrame(
+            {
+                "id_observation": [1, 2, 3],
+                "heure_debut": [datetime.time(10, 30), None, None],
+                "photos": ["https://a.jpg", "", None],
+                "colonne_ignoree": ["x", "y", "z"],
+            }
+        )
+
+        rows = copy_into_table(
+            df,
+            "observations",
+            engine,
+            columns=["id_observation", "heure_debut", "photos"],
+            conflict_columns=["id_observation"],
+            chunk_size=2,
+        )
+
+        assert rows == 3
+        assert engine.cursor.copied == [
+            '1,10:30:00,https://a.jpg\n2,\\N,""\n',
+            "3,\\N,\\N\n",
+        ]
+        inserts = [s for s in engine.cursor.statements if "INSERT INTO" in s]
+        assert len(inserts) == 1
+        assert "ON CONFLICT (id_observation) DO NOTHING" in inserts[0]
+
+    def test_do_update_sur_colonnes_demandees(self):
+        engine = FakeEngine()
+        df = pl.DataFrame({"id_crops": ["1_animal"], "best_label": ["Fucaceae"]})
+
+        copy_into_table(
+            df,
+            "ml_taxonomy",
+            engine,
+            conflict_columns=["id_crops"],
+            update_columns=["best_label"],
+        )
+
+        insert = engine.cursor.statements[-1]
+        assert "SELECT DISTINCT ON (id_crops) id_crops, best_label" in insert
+        assert "best_label = EXCLUDED.best_label" in insert
+        # Dernière ligne du lot gagnante pour une même clé
+        assert "ORDER BY id_crops, _staging_row DESC" in insert
+
+    def test_table_de_staging_unique_par_chargement(self):
+        engine = FakeEngine()
+        df = pl.DataFrame({"id_crops": ["1_animal"], "best_label": ["Fucaceae"]})
+
+        copy_into_table(df, "ml_taxonomy", engine, conflict_columns=["id_crops"])
+        copy_into_table(df, "ml_taxonomy", engine, conflict_columns=["id_crops"])
+
+        creates = [s for s in engine.cursor.statements if "CREATE TEMP TABLE" in s]
+        names = {s.split()[3] for s in creates}
+        assert len(names) == 2
+        assert all(name.startswith("_staging_ml_taxonomy_") for name in names)
+
+    def test_dataframe_vide_aucun_appel(self):
+        engine = FakeEngine()
+
+        rows = copy_into_table(pl.DataFrame({"a": []}), "observations", engine)
+
+        assert rows == 0
+        assert engine.cursor.statements == []
+
+    def test_upsert_changed_rows_compte_les_lignes(self):
+        engine = FakeEngine()
+        engine.cursor.result = (1, 1)
+        df = pl.DataFrame({"id_observation": [1, 2, 3, 3], "validee": ["true"] * 4})
+
+        counts = upsert_changed_rows(df, "observations", engine, ["id_observation"])
+
+        assert counts == {"inserted": 1, "updated": 1, "unchanged": 1}
+        upsert = engine.cursor.statements[-1]
+        assert "md5(ROW(id_observation, validee)::text)" in upsert
+        assert "observations.row_hash IS DISTINCT FROM EXCLUDED.row_hash" in upsert
+        assert "id_observation = EXCLUDED.id_observation" not in upsert
@@ -0,0 +1,85 @@
+import polars as pl
+from sqlalchemy import create_engine, text
+
+from biolit import create_table
+from biolit.create_table import iter_observations_from_db
+
+
+def test_iter_observations_par_chunks_avec_projection_et_predicat():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE observations (id_observation INT, latitude FLOAT, photos TEXT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO observations VALUES (1, 1.0, 'a'), (2, NULL, NULL), (3, 3.0, 'c')"
+        ))
+
+    chunks = list(iter_observations_from_db(
+        engine,
+        columns=["id_observation", "latitude"],
+        where="id_observation >= :min_id",
+        params={"min_id": 2},
+        chunk_size=1,
+    ))
+
+    assert [len(c) for c in chunks] == [1, 1]
+    assert chunks[0].columns == ["id_observation", "latitude"]
+    # Chunk entièrement NULL : le type de la colonne est conservé
+    assert chunks[0].schema == chunks[1].schema
+
+
+def test_resolve_image_paths_une_requete_puis_cache(monkeypatch):
+    calls = []
+
+    def fake_read(query, engine, params=None):
+        calls.append(params["ids"])
+        return pl.DataFrame(
+            {"id_observation": [1, 2], "path_s3": ["s3://bucket/run/1.jpg", "s3://bucket/run/2.jpg"]}
+        )
+
+    monkeypatch.setattr(create_table, "read_database_arrow", fake_read)
+    create_table.clear_image_path_cache()
+
+    df = create_table.resolve_observation_image_paths(None, [2, 1, 3])
+    # 3 n'a pas d'image : résultat négatif gardé en cache aussi
+    again = create_table.resolve_observation_image_paths(None, [1, 2, 3])
+
+    assert calls == [[1, 2, 3]]
+    assert df.rows() == [(1, "bucket", "run/1.jpg"), (2, "bucket", "run/2.jpg")]
+    assert again.rows() == df.rows()
+
+
+def test_resolve_image_paths_redemande_les_absents_apres_insert(monkeypatch):
+    calls = []
+
+    def fake_read(query, engine, params=None):
+        calls.append(params["ids"])
+        return pl.DataFrame(schema={"id_observation": pl.Int64, "path_s3": pl.Utf8})
+
+    monkeypatch.setattr(create_table, "read_database_arrow", fake_read)
+    monkeypatch.setattr(create_table, "copy_into_table", lambda *args, **kwargs: 1)
+    create_table.clear_image_path_cache()
+
+    assert create_table.resolve_observation_image_paths(None, [4]).is_empty()
+    create_table.insert_no_crops_dataframe(pl.DataFrame(), None)
+    create_table.resolve_observation_image_paths(None, [4])
+
+    assert calls == [[4], [4]]
+
+
+def test_explode_observation_photos_garde_la_position():
+    df = pl.DataFrame(
+        {
+            "id_observation": [1, 2, 3],
+            "photos": ["https://a.jpg| https://b.jpg", None, "non_renseigne|https://c.jpg"],
+        }
+    )
+
+    out = create_table.explode_observation_photos(df)
+
+    assert out.rows() == [
+        (1, 0, "https://a.jpg"),
+        (1, 1, "https://b.jpg"),
+        (3, 1, "https://c.jpg"),
+    ]
@@ -0,0 +1,119 @@
+import datetime
+
+import polars as pl
+import psycopg2
+import pytest
+from sqlalchemy import create_engine, text
+
+from biolit import db_read
+from biolit.db_read import _cast_from_csv, read_database_arrow
+
+
+def test_fallback_sqlalchemy_hors_postgres():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE ml_no_crops (id_observation INT, path_s3 TEXT)"))
+        conn.execute(text("INSERT INTO ml_no_crops VALUES (1, 's3://a/1.jpg'), (2, NULL)"))
+
+    df = read_database_arrow(
+        "SELECT id_observation FROM ml_no_crops WHERE id_observation > :min_id;",
+        engine,
+        params={"min_id": 1},
+    )
+
+    assert df["id_observation"].to_list() == [2]
+
+
+def test_conversion_des_valeurs_copy_csv():
+    raw = pl.DataFrame(
+        {
+            "validee": ["t", "f", None],
+            "heure_debut": ["10:30:00", "08:00:00.5", None],
+            "date_observation": ["2025-06-01 10:30:00", None, "2025-06-02 00:00:00.123"],
+            "id_observation": ["1", "2", None],
+        }
+    )
+    schema = {
+        "validee": pl.Boolean,
+        "heure_debut": pl.Time,
+        "date_observation": pl.Datetime("us"),
+        "id_observation": pl.Int64,
+    }
+
+    out = raw.select(_cast_from_csv(name, dtype) for name, dtype in schema.items())
+
+    assert out.schema == schema
+    assert out["validee"].to_list() == [True, False, None]
+    assert out["heure_debut"][0] == datetime.time(10, 30)
+    assert out["date_observation"][0] == datetime.datetime(2025, 6, 1, 10, 30)
+
+
+class _PostgresEngine:
+    class dialect:
+        name = "postgresql"
+
+
+class _OtherDriverEngine(_PostgresEngine):
+    """Connexion PostgreSQL dont le curseur n'est pas celui de psycopg2."""
+
+    class _Cursor:
+        def close(self):
+            pass
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @property
+    def connection(self):
+        return self
+
+    def cursor(self):
+        return self._Cursor()
+
+
+def test_erreur_sql_remonte_sans_repli(monkeypatch):
+    def fail(*args):
+        raise psycopg2.errors.UndefinedTable("relation absente")
+
+    monkeypatch.setattr(db_read, "ADBC_AVAILABLE", False)
+    monkeypatch.setattr(db_read, "_read_copy", fail)
+    monkeypatch.setattr(db_read.pl, "read_database", lambda *args, **kwargs: pytest.fail("repli inattendu"))
+
+    with pytest.raises(psycopg2.errors.UndefinedTable):
+        read_database_arrow("SELECT * FROM absente", _PostgresEngine())
+
+
+def test_erreur_driver_repli_sqlalchemy(monkeypatch):
+    def fail(*args):
+        raise psycopg2.errors.FeatureNotSupported("COPY non supporté")
+
+    monkeypatch.setattr(db_read, "ADBC_AVAILABLE", False)
+    monkeypatch.setattr(db_read, "_read_copy", fail)
+    monkeypatch.setattr(db_read.pl, "read_database", lambda *args, **kwargs: pl.DataFrame({"a": [1]}))
+
+    assert read_database_arrow("SELECT 1 AS a", _PostgresEngine())["a"].to_list() == [1]
+
+
+def test_curseur_sans_copy_repli_sqlalchemy(monkeypatch):
+    monkeypatch.setattr(db_read, "ADBC_AVAILABLE", False)
+    monkeypatch.setattr(db_read.pl, "read_database", lambda *args, **kwargs: pl.DataFrame({"a": [1]}))
+
+    assert read_database_arrow("SELECT 1 AS a", _OtherDriverEngine())["a"].to_list() == [1]
+
+
+def test_attribute_error_remonte_sans_repli(monkeypatch):
+    def fail(*args):
+        raise AttributeError("bug dans le chemin COPY")
+
+    monkeypatch.setattr(db_read, "ADBC_AVAILABLE", False)
+    monkeypatch.setattr(db_read, "_read_copy", fail)
+    monkeypatch.setattr(db_read.pl, "read_database", lambda *args, **kwargs: pytest.fail("repli inattendu"))
+
+    with pytest.raises(AttributeError):
+        read_database_arrow("SELECT 1 AS a", _PostgresEngine())
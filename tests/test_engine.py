@@ -0,0 +1,27 @@
+from sqlalchemy import text
+
+from biolit.engine import dispose_engines, get_pool_metrics, get_shared_engine
+
+
+class TestSharedEngine:
+    def test_meme_url_meme_engine(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'biolit.db'}"
+
+        engine = get_shared_engine(url)
+
+        assert get_shared_engine(url) is engine
+        dispose_engines()
+
+    def test_metriques_du_pool(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'biolit.db'}"
+        engine = get_shared_engine(url)
+
+        for _ in range(3):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+        metrics = next(iter(get_pool_metrics().values()))
+        assert metrics["checkouts"] == 3
+        assert metrics["connections_opened"] == 1
+        assert metrics["checked_out"] == 0
+        dispose_engines()
@@ -1,9 +1,35 @@
-from biolit.export_api import fetch_biolit_from_api, adapt_api_to_dataframe
+import datetime
+import json
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import polars as pl
+import pytest
+
+from biolit.export_api import (
+    fetch_biolit_from_api,
+    fetch_biolit_incremental,
+    adapt_api_to_dataframe,
+    iter_json_array,
+    iter_observation_batches,
+    parse_observations,
+)
+
+# Snapshot API rejoué sans réseau (voir biolit.api_cache)
+API_SNAPSHOT_DIR = Path(__file__).parent / "fixtures" / "api_snapshot"
+
+
+@pytest.fixture
+def api_snapshot(monkeypatch):
+    monkeypatch.setattr("biolit.api_cache.API_CACHE_DIR", API_SNAPSHOT_DIR)
+    monkeypatch.setattr("biolit.api_cache.API_REPLAY", True)
+
 
 # -------------------------
 # Tests API
 # -------------------------
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_fetch_api_returns_data():
     """Vérifie que l'API retourne bien des données"""
     data = fetch_biolit_from_api()
@@ -14,6 +40,7 @@ def test_fetch_api_returns_data():
     print(f"\n✅ {len(data)} observations récupérées")
 
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_fetch_api_structure():
     """Vérifie la structure des données API"""
     data = fetch_biolit_from_api()
@@ -48,6 +75,7 @@ def test_fetch_api_structure():
 # Tests transformation
 # -------------------------
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_adapt_to_dataframe():
     """Vérifie la transformation en DataFrame"""
     data = fetch_biolit_from_api()
@@ -59,6 +87,7 @@ def test_adapt_to_dataframe():
     print(f"\n✅ DataFrame: {df.shape[0]} lignes, {df.shape[1]} colonnes")
 
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_expected_columns_present():
     """Vérifie les colonnes critiques"""
     data = fetch_biolit_from_api()
@@ -84,6 +113,7 @@ def test_expected_columns_present():
 # Tests qualité des données
 # -------------------------
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_unique_ids():
     """Vérifie qu'il n'y a pas de doublons"""
     data = fetch_biolit_from_api()
@@ -97,6 +127,7 @@ def test_unique_ids():
     print("\n✅ Pas de doublons")
 
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_no_null_coordinates():
     """Vérifie que les coordonnées sont présentes"""
     data = fetch_biolit_from_api()
@@ -113,6 +144,7 @@ def test_no_null_coordinates():
     assert null_lon < df.shape[0]
 
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_id_is_numeric():
     """Vérifie que les IDs sont bien numériques"""
     data = fetch_biolit_from_api()
@@ -130,6 +162,7 @@ def test_id_is_numeric():
 # Test global pipeline
 # -------------------------
 
+@pytest.mark.usefixtures("api_snapshot")
 def test_full_pipeline():
     """Test end-to-end"""
     data = fetch_biolit_from_api()
@@ -141,6 +174,108 @@ def test_full_pipeline():
     print(df.head(5))
 
 
+# -------------------------
+# Tests ingestion incrémentale (API mockée)
+# -------------------------
+
+def _mock_response(items, total_pages=None):
+    response = MagicMock()
+    response.status_code = 200
+    response.iter_content.return_value = [json.dumps(items).encode()]
+    response.headers = {"X-WP-TotalPages": str(total_pages)} if total_pages else {}
+    return response
+
+
+WATERMARK = {"last_run_at": datetime.datetime(2025, 6, 10)}
+
+
+@patch("biolit.api_cache.requests.get")
+def test_incremental_pages_annoncees(mock_get, tmp_path, monkeypatch):
+    """Toutes les pages annoncées par X-WP-TotalPages sont récupérées"""
+    monkeypatch.setattr("biolit.api_cache.API_CACHE_DIR", tmp_path)
+    pages = {1: [{"id": 1}, {"id": 2}], 2: [{"id": 3}, {"id": 4}], 3: [{"id": 5}]}
+    mock_get.side_effect = lambda url, params, headers, stream: _mock_response(
+        pages[params["page"]], total_pages=3
+    )
+
+    data = fetch_biolit_incremental(WATERMARK, page_size=2, max_workers=2)
+
+    assert [item["id"] for item in data] == [1, 2, 3, 4, 5]
+    params = mock_get.call_args_list[0].kwargs["params"]
+    assert params["modified_after"] == "2025-06-08T00:00:00"
+
+
+@patch("biolit.api_cache.requests.get")
+def test_incremental_sans_pagination_s_arrete(mock_get, tmp_path, monkeypatch):
+    """Une API qui ignore la pagination ne provoque pas de boucle infinie"""
+    monkeypatch.setattr("biolit.api_cache.API_CACHE_DIR", tmp_path)
+    mock_get.side_effect = lambda url, params, headers, stream: _mock_response(
+        [{"id": 1}, {"id": 2}]
+    )
+
+    data = fetch_biolit_incremental(WATERMARK, page_size=2)
+
+    assert [item["id"] for item in data] == [1, 2]
+    assert mock_get.call_count == 2
+
+
+# -------------------------
+# Tests décodage en streaming
+# -------------------------
+
+def test_iter_json_array_chunks_coupes():
+    """Les éléments coupés entre deux chunks sont bien reconstitués"""
+    payload = '[{"id": 1, "espece": "Crabe vert"}, {"id": 22, "common": "Étoile"}]'.encode()
+    chunks = [payload[i:i + 3] for i in range(0, len(payload), 3)]
+
+    items = list(iter_json_array(chunks))
+
+    assert items == [
+        {"id": 1, "espece": "Crabe vert"},
+        {"id": 22, "common": "Étoile"},
+    ]
+
+
+def test_iter_observation_batches_schema_fixe():
+    """Les lots ont toujours les colonnes renommées de COLUMN_MAPPING"""
+    items = [{"id": 1, "espece-identifiee": "oui", "inconnu": "x"}, {"id": 2}, {"id": 3}]
+
+    batches = list(iter_observation_batches(items, batch_size=2))
+
+    assert [len(b) for b in batches] == [2, 1]
+    assert batches[0].columns == batches[1].columns
+    assert "espece_identifiee" in batches[0].columns
+    assert "inconnu" not in batches[0].columns
+    assert batches[0]["id_observation"].to_list() == ["1", "2"]
+
+
+# -------------------------
+# Tests typage / validation
+# -------------------------
+
+def test_parse_observations_types_et_rejets():
+    """Les lignes typées vont dans le frame principal, les invalides à part"""
+    items = [
+        {"id": 1, "date": "2024-05-01 10:00:00", "heure-debut": "10:00",
+         "latitude": " 47.1", "longitude": "-2.1", "espece_id": "12.0", "relais": ""},
+        {"id": "abc", "latitude": "47.0"},
+        {"id": 3, "latitude": "123"},
+    ]
+    batch = next(iter_observation_batches(items))
+
+    valid, rejected = parse_observations(batch)
+
+    assert valid["id_observation"].to_list() == [1]
+    assert valid.schema["date_observation"] == pl.Datetime
+    assert valid.row(0, named=True)["latitude"] == 47.1
+    assert valid.row(0, named=True)["id_espece"] == 12
+    assert valid.row(0, named=True)["relais"] is None
+    assert rejected["rejection_reason"].to_list() == [
+        "id_observation invalide",
+        "latitude hors bornes",
+    ]
+
+
 # -------------------------
 # Execution directe
 # -------------------------
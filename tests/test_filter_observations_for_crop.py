@@ -2,7 +2,50 @@ import polars as pl
 import unittest
 from unittest.mock import patch
 
-from biolit.flow_gatekeeper import filter_observations_for_crop
+from biolit.flow_gatekeeper import (
+    filter_observations_for_crop,
+    filter_processed_no_crop_annotations,
+)
+
+
+class FakeCursor:
+    """Curseur psycopg2 minimal : répond aux SELECT avec des lignes prédéfinies."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.statements = []
+        self.copied = []
+        self.rowcount = -1
+
+    def execute(self, query):
+        self.statements.append(query)
+
+    def copy_expert(self, query, buffer):
+        self.copied.append(buffer.read().decode())
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, results):
+        self.cursor_ = FakeCursor(results)
+        self.connection = self
+
+    def begin(self):
+        return self
+
+    def cursor(self):
+        return self.cursor_
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
 
 
 class TestFilterObservationsForCrop(unittest.TestCase):
@@ -22,7 +65,11 @@ class TestFilterObservationsForCrop(unittest.TestCase):
         result = filter_observations_for_crop(self.df, engine=None)
 
         self.assertEqual(result["id_observation"].to_list(), [1111, 3223])
-        mock_get_already.assert_called_once_with(None)  # vérifie que le moteur est bien passé
+        mock_get_already.assert_called_once()
+        engine, ids = mock_get_already.call_args.args
+        self.assertIsNone(engine)  # vérifie que le moteur est bien passé
+        # seuls les ids candidats sont envoyés à la base
+        self.assertEqual(ids.to_list(), [1111, 2345, 3223, 4456])
     # ── Base vide - aucnne observation n'a été traitée ────────────────────────────────────────────────────────────
     @patch("biolit.flow_gatekeeper.get_already_cropped_observations")
     def test_base_vide_retourne_tout(self, mock_get_already):
@@ -59,5 +106,22 @@ class TestFilterObservationsForCrop(unittest.TestCase):
         self.assertEqual(result["id_observation"].to_list(), [1111, 2345, 3223, 4456])
 
 
+class TestFilterProcessedNoCropAnnotations(unittest.TestCase):
+
+    def test_anti_jointures_sur_les_seuls_candidats(self):
+        """
+        Seuls les ids candidats sont envoyés (COPY) ; les lignes déjà en
+        db_finale ou déjà envoyées dans taxonomy_queue (id_crops) sont exclues.
+        """
+        engine = FakeEngine(results=[[(1,)], [("2_a",)]])
+        df = pl.DataFrame({"id_observation": [1, 2, 3], "id_crops": ["1_a", "2_a", "3_a"]})
+
+        result = filter_processed_no_crop_annotations(df, engine)
+
+        self.assertEqual(result["id_crops"].to_list(), ["3_a"])
+        self.assertEqual(sorted(engine.cursor_.copied[0].split()), ["1", "2", "3"])
+        self.assertIn("taxonomy_queue q WHERE q.id_crops = c.id_crops", engine.cursor_.statements[-1])
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,10 +1,79 @@
+import geopandas as gpd
 import pandas as pd
 import numpy as np
 from pandas.testing import assert_frame_equal
+from shapely.geometry import LineString, box
+from sqlalchemy import create_engine, text
+
+from biolit import geoloc
+from biolit.geoloc import (
+    COASTLINE_SIMPLIFY_TOLERANCE_M,
+    build_coastline_aoi,
+    distance_to_coast,
+    distance_to_communes,
+    get_info_distance_to_coast,
+    get_info_distance_to_coast_with_fallback,
+    get_info_nearest_commune,
+    nearest_geometries,
+)
+
+
+def _points_4326(x, y) -> pd.DataFrame:
+    """Points donnés en Lambert 93, renvoyés en longitude / latitude."""
+    points = gpd.GeoSeries(gpd.points_from_xy(x, y), crs="EPSG:2154").to_crs(epsg=4326)
+    return pd.DataFrame({"longitude": points.x, "latitude": points.y})
+
+
+def _synthetic_communes() -> tuple[gpd.GeoDataFrame, pd.DataFrame]:
+    # Damier de communes de 4 km séparées de 1 km, en Lambert 93
+    cells = [
+        box(x, y, x + 4000, y + 4000)
+        for x in range(300000, 400000, 5000)
+        for y in range(6700000, 6800000, 5000)
+    ]
+    codes = [str(i) for i in range(len(cells))]
+    communes = gpd.GeoDataFrame(
+        {"nom_communes": [f"commune {c}" for c in codes], "code_insee": codes},
+        geometry=cells,
+        crs="EPSG:2154",
+    )
+    info = pd.DataFrame(
+        {"code_insee": codes, "code_postal": codes, "reg_nom": "r", "dep_nom": "d"}
+    )
+    return communes, info
+
+def _synthetic_coast() -> gpd.GeoDataFrame:
+    # Côte en dents de scie découpée en segments (comme coastlines-split)
+    xs = np.arange(300000, 400001, 2000)
+    ys = 6750000 + 3000 * np.sin(xs / 7000)
+    segments = [
+        LineString(list(zip(xs[i : i + 6], ys[i : i + 6])))
+        for i in range(0, len(xs) - 1, 5)
+    ]
+    return gpd.GeoDataFrame(geometry=segments, crs="EPSG:2154")
 
-from biolit.geoloc import get_info_nearest_commune, get_info_distance_to_coast
 
 class TestDistanceToCommunes:
+    def test_nearest_commune_identique_au_calcul_point_par_point(self):
+        communes, info = _synthetic_communes()
+        rng = np.random.default_rng(0)
+        # Points dans le damier, autour, et loin (> 20 km : aucune commune)
+        x = np.append(rng.uniform(290000, 410000, 300), [100000, np.nan])
+        y = np.append(rng.uniform(6690000, 6810000, 300), [6000000, np.nan])
+        inp = _points_4326(x, y)
+
+        out = get_info_nearest_commune(inp, communes, info)
+
+        points = gpd.GeoSeries(
+            gpd.points_from_xy(inp["longitude"], inp["latitude"]), crs="EPSG:4326"
+        ).to_crs(epsg=2154)
+        ref = [distance_to_communes(p, communes, communes.sindex) for p in points[:-1]]
+        ref_distances = np.array([np.nan if d is None else d for d, _, _ in ref])
+        np.testing.assert_allclose(out["distance_commune_m"][:-1], ref_distances)
+        assert out["code_insee"][:-2].tolist() == [c for _, _, c in ref[:-1]]
+        assert out["nearest_commune"].iloc[-2:].isna().all()
+        assert out["reg_nom"].iloc[-2:].isna().all()
+
     def test_get_info_nearest_commune(self):
         inp = pd.DataFrame(
             {
@@ -51,4 +120,165 @@ class TestDistanceToCommunes:
                 "is_coastal": [False, True, False],
             }
         )
-        assert_frame_equal(out, exp, check_dtype=False)
+        # Trait de côte simplifié : distance exacte à la tolérance près
+        assert_frame_equal(out, exp, check_dtype=False, atol=COASTLINE_SIMPLIFY_TOLERANCE_M)
+
+    def test_distance_to_coast_identique_au_calcul_point_par_point(self):
+        coast = _synthetic_coast()
+        rng = np.random.default_rng(1)
+        # Points à moins de 15 km de la côte, puis un point isolé et un sans coordonnées
+        x = np.append(rng.uniform(300000, 400000, 300), [100000, np.nan])
+        y = np.append(rng.uniform(6735000, 6765000, 300), [6000000, np.nan])
+        inp = _points_4326(x, y)
+
+        out = get_info_distance_to_coast(inp, 8000, coast)
+
+        points = gpd.GeoSeries(
+            gpd.points_from_xy(inp["longitude"], inp["latitude"]), crs="EPSG:4326"
+        ).to_crs(epsg=2154)
+        ref = np.array([
+            np.nan if (d := distance_to_coast(p, coast, coast.sindex)) is None else d
+            for p in points[:-1]
+        ])
+        np.testing.assert_allclose(out["distance_to_coast"][:-1], ref)
+        assert out["is_coastal"][:-1].tolist() == (ref <= 8000).tolist()
+        assert np.isnan(out["distance_to_coast"].iloc[-1])
+        assert not out["is_coastal"].iloc[-1]
+
+
+def test_rayon_de_recherche_exact_entre_20_et_28_km():
+    # Coin du carré de recherche : 25,5 km en diagonale de l'extrémité
+    # de la côte et de la commune, au-delà du rayon de 20 km
+    coast = gpd.GeoDataFrame(
+        geometry=[LineString([(300000, 6750000), (310000, 6750000)])], crs="EPSG:2154"
+    )
+    communes = gpd.GeoDataFrame(
+        {"nom_communes": ["Coin"], "code_insee": ["00001"]},
+        geometry=[box(300000, 6740000, 310000, 6750000)],
+        crs="EPSG:2154",
+    )
+    info = pd.DataFrame(
+        {"code_insee": ["00001"], "code_postal": ["00000"], "reg_nom": ["R"], "dep_nom": ["D"]}
+    )
+    inp = _points_4326([328000, 318000], [6768000, 6758000])
+    points = gpd.GeoSeries(
+        gpd.points_from_xy(inp["longitude"], inp["latitude"]), crs="EPSG:4326"
+    ).to_crs(epsg=2154)
+
+    # Ancien calcul point par point (bbox du cercle) : côte et commune trouvées
+    assert 25000 < distance_to_coast(points[0], coast, coast.sindex) < 26000
+    assert distance_to_communes(points[0], communes, communes.sindex)[2] == "00001"
+
+    # Rayon exact : rien au-delà de 20 km, inchangé en deçà (11,3 km)
+    coastal = get_info_distance_to_coast(inp, 8000, coast)
+    assert np.isnan(coastal["distance_to_coast"].iloc[0])
+    np.testing.assert_allclose(coastal["distance_to_coast"].iloc[1], 8000 * 2 ** 0.5, rtol=1e-3)
+    assert coastal["is_coastal"].tolist() == [False, False]
+
+    nearest = get_info_nearest_commune(inp, communes, info)
+    assert pd.isna(nearest["code_insee"].iloc[0])
+    assert nearest["code_insee"].iloc[1] == "00001"
+
+
+def test_trait_de_cote_decoupe_et_simplifie():
+    # Côte très détaillée (un sommet tous les 10 m) de part et d'autre de la zone
+    xs = np.arange(-200000, 1400000, 10)
+    ys = 6750000 + 3000 * np.sin(xs / 7000) + 5 * np.sin(xs / 30)
+    segments = [
+        LineString(list(zip(xs[i : i + 1001], ys[i : i + 1001])))
+        for i in range(0, len(xs) - 1, 1000)
+    ]
+    coast = gpd.GeoDataFrame(geometry=segments, crs="EPSG:2154")
+    bbox = (-2.0, 46.0, 2.0, 48.0)
+
+    aoi = build_coastline_aoi(coast, bbox=bbox, margin_m=25000, tolerance_m=50)
+
+    zone = gpd.GeoSeries([box(*bbox)], crs="EPSG:4326").to_crs(epsg=2154)
+    minx, _, maxx, _ = zone.total_bounds
+    assert aoi.total_bounds[0] >= minx - 25000 - 1
+    assert aoi.total_bounds[2] <= maxx + 25000 + 1
+    assert aoi.count_coordinates().sum() < coast.count_coordinates().sum() / 20
+
+    # Dans la zone, les distances changent d'au plus la tolérance
+    rng = np.random.default_rng(2)
+    points = gpd.GeoSeries(
+        gpd.points_from_xy(rng.uniform(minx, maxx, 500), rng.uniform(6735000, 6765000, 500)),
+        crs="EPSG:2154",
+    )
+    _, d_full = nearest_geometries(points, coast, max_distance=20000)
+    _, d_aoi = nearest_geometries(points, aoi, max_distance=20000)
+    assert (np.isnan(d_full) == np.isnan(d_aoi)).all()
+    assert np.nanmax(np.abs(d_full - d_aoi)) <= 50
+
+
+def test_points_hors_zone_sur_la_couche_mondiale():
+    aoi = _synthetic_coast()
+    # Couche mondiale : même côte plus une île loin de la zone d'intérêt
+    island = LineString([(900000, 6200000), (905000, 6200000)])
+    full = pd.concat(
+        [aoi, gpd.GeoDataFrame(geometry=[island], crs="EPSG:2154")], ignore_index=True
+    )
+    inp = _points_4326([350000, 902000], [6755000, 6201000])
+    bbox = tuple(
+        gpd.GeoSeries(gpd.points_from_xy([290000, 410000], [6700000, 6800000]), crs="EPSG:2154")
+        .to_crs(epsg=4326)
+        .total_bounds
+    )
+    loads = []
+
+    def get_full_coast():
+        loads.append("full")
+        return full
+
+    out = get_info_distance_to_coast_with_fallback(inp, 8000, aoi, get_full_coast, bbox=bbox)
+
+    assert loads == ["full"]
+    assert out.index.tolist() == [0, 1]
+    assert out["is_coastal"].tolist() == [True, True]
+    np.testing.assert_allclose(out["distance_to_coast"].iloc[1], 1000, atol=1)
+
+    get_info_distance_to_coast_with_fallback(inp.iloc[:1], 8000, aoi, get_full_coast, bbox=bbox)
+    assert loads == ["full"]
+
+
+def test_enrichissement_incremental_nouvelles_ou_deplacees(monkeypatch):
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE observations (id_observation INT, latitude FLOAT, longitude FLOAT)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE observations_enriched (id_observation INT, latitude FLOAT, longitude FLOAT)"
+        ))
+        # 1 : déjà enrichie, 2 : déplacée, 3 : nouvelle, 4 : sans coordonnées déjà enrichie
+        conn.execute(text(
+            "INSERT INTO observations VALUES (1, 47.1, -2.1), (2, 47.2, -2.2), (3, 47.3, -2.3), (4, NULL, NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO observations_enriched VALUES (1, 47.1, -2.1), (2, 47.0, -2.2), (4, NULL, NULL)"
+        ))
+
+    layers = []
+    monkeypatch.setattr(geoloc, "get_geometry_communes", lambda: layers.append("communes"))
+    monkeypatch.setattr(geoloc, "get_info_communes", lambda: None)
+    monkeypatch.setattr(geoloc, "get_trace_littoral_aoi", lambda: None)
+    monkeypatch.setattr(geoloc, "get_info_nearest_commune", lambda df, *args: df)
+    monkeypatch.setattr(geoloc, "get_info_distance_to_coast_with_fallback", lambda df, *args: df)
+    monkeypatch.setattr(geoloc, "enrich_with_cache", lambda engine, df, enrich, **kwargs: enrich(df))
+    monkeypatch.setattr(geoloc, "clear_geoloc_cache", lambda engine: None)
+    monkeypatch.setattr(geoloc, "prune_geoloc_cache", lambda engine, version: None)
+    monkeypatch.setattr(geoloc, "geoloc_layers_version", lambda: layers.append("version") or "v1")
+
+    def enriched_ids(**kwargs):
+        chunks = list(geoloc.iter_geoloc_enrichie_data_biolit_db(engine, **kwargs))
+        return sorted(i for df in chunks for i in df["id_observation"])
+
+    assert enriched_ids() == [2, 3]
+    assert enriched_ids(recompute_all=True) == [1, 2, 3, 4]
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM observations WHERE id_observation IN (2, 3)"))
+    layers.clear()
+    assert enriched_ids() == []
+    # Rien à enrichir : les couches de référence ne sont pas chargées
+    assert layers == []
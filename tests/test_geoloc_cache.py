@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from biolit import geoloc_cache
+from biolit.geoloc_cache import CACHED_COLUMNS, enrich_with_cache, new_cache_stats
+
+
+def _fake_cache(monkeypatch) -> pd.DataFrame:
+    store = {"df": pd.DataFrame(columns=["version", "lat_key", "lon_key", *CACHED_COLUMNS])}
+
+    def lookup(engine, keys, precision, version):
+        cached = store["df"][store["df"]["version"] == version].drop(columns="version")
+        return keys.merge(cached, on=["lat_key", "lon_key"])
+
+    def save(engine, df, precision, version):
+        store["df"] = pd.concat(
+            [store["df"], df[["lat_key", "lon_key", *CACHED_COLUMNS]].assign(version=version)],
+            ignore_index=True,
+        )
+
+    monkeypatch.setattr(geoloc_cache, "lookup_geoloc_cache", lookup)
+    monkeypatch.setattr(geoloc_cache, "store_geoloc_cache", save)
+    return store
+
+
+def _enrich(calls):
+    def enrich(points):
+        calls.append(len(points))
+        return points.assign(
+            nearest_commune="Pornic",
+            code_insee="44131",
+            distance_commune_m=0.0,
+            code_postal="44210",
+            reg_nom="Pays de la Loire",
+            dep_nom="Loire-Atlantique",
+            distance_to_coast=points["longitude"].abs(),
+            is_coastal=True,
+        )
+    return enrich
+
+
+def test_coordonnees_repetees_calculees_une_fois(monkeypatch):
+    _fake_cache(monkeypatch)
+    calls = []
+    df = pd.DataFrame(
+        {
+            "id_observation": [1, 2, 3, 4],
+            # 1 et 2 : même site à l'arrondi près ; 4 : sans coordonnées
+            "latitude": [47.111202, 47.1112021, 47.2, np.nan],
+            "longitude": [-2.108881, -2.1088814, -2.2, np.nan],
+        }
+    )
+    stats = new_cache_stats()
+
+    first = enrich_with_cache(None, df, _enrich(calls), precision=5, stats=stats)
+    again = enrich_with_cache(None, df, _enrich(calls), precision=5, stats=stats)
+
+    assert calls == [2]
+    assert first["id_observation"].tolist() == [1, 2, 3, 4]
+    assert first["latitude"].tolist()[:3] == df["latitude"].tolist()[:3]
+    assert first["distance_to_coast"].tolist()[:3] == [2.10888, 2.10888, 2.2]
+    assert pd.isna(first["nearest_commune"].iloc[3])
+    assert first["is_coastal"].tolist() == [True, True, True, False]
+    assert again.equals(first)
+    # 3 observations localisées par passage : 3 calculées puis 3 relues
+    assert stats == {
+        "rows": 6, "row_hits": 3, "row_misses": 3,
+        "keys": 4, "key_hits": 2, "key_misses": 2,
+    }
+
+
+def test_nouvelle_version_des_couches_recalcule(monkeypatch):
+    _fake_cache(monkeypatch)
+    calls = []
+    df = pd.DataFrame({"id_observation": [1], "latitude": [47.2], "longitude": [-2.2]})
+
+    enrich_with_cache(None, df, _enrich(calls), precision=5, version="v1")
+    enrich_with_cache(None, df, _enrich(calls), precision=5, version="v1")
+    enrich_with_cache(None, df, _enrich(calls), precision=5, version="v2")
+
+    assert calls == [1, 1]
@@ -0,0 +1,71 @@
+import datetime
+
+import polars as pl
+
+from biolit import ingestion
+
+
+def _patch_loading(monkeypatch, calls):
+    monkeypatch.setattr(
+        ingestion,
+        "parse_observations",
+        lambda batch: (
+            pl.DataFrame(
+                {
+                    "id_observation": [r["id"] for r in batch],
+                    "date_observation": [datetime.datetime(2025, 6, 1)] * len(batch),
+                }
+            ),
+            pl.DataFrame(),
+        ),
+    )
+    monkeypatch.setattr(
+        ingestion, "insert_dataframe", lambda df: {"inserted": len(df), "updated": 0, "unchanged": 0}
+    )
+    monkeypatch.setattr(ingestion, "append_observations_batch", lambda df: None)
+    monkeypatch.setattr(ingestion, "compact_observations", lambda: None)
+    monkeypatch.setattr(
+        ingestion, "update_ingestion_watermark", lambda *args: calls.append("watermark")
+    )
+
+
+def test_replay_ne_modifie_pas_le_watermark(monkeypatch):
+    calls = []
+    _patch_loading(monkeypatch, calls)
+    monkeypatch.setattr(ingestion, "stream_biolit_from_api", lambda replay=None: iter([[{"id": 1}]]))
+    monkeypatch.setattr(
+        ingestion, "get_ingestion_watermark", lambda engine: calls.append("get_watermark")
+    )
+    stats = {"rows_in": 0, "rows_out": 0}
+
+    counts = ingestion.ingest_observations(None, datetime.datetime.now(), replay=True, stats=stats)
+
+    assert counts["inserted"] == 1
+    assert stats == {"rows_in": 1, "rows_out": 1}
+    assert calls == []
+
+
+def test_full_refresh_avance_le_watermark(monkeypatch):
+    calls = []
+    _patch_loading(monkeypatch, calls)
+    monkeypatch.setattr(ingestion, "stream_biolit_from_api", lambda replay=None: iter([[{"id": 1}]]))
+
+    ingestion.ingest_observations(None, datetime.datetime.now(), full_refresh=True)
+
+    assert calls == ["watermark"]
+
+
+def test_replay_par_variable_d_environnement(monkeypatch):
+    """BIOLIT_API_REPLAY sans replay explicite : lecture du snapshot, watermark inchangé"""
+    calls = []
+    _patch_loading(monkeypatch, calls)
+    monkeypatch.setattr(ingestion, "API_REPLAY", True)
+    monkeypatch.setattr(
+        ingestion,
+        "stream_biolit_from_api",
+        lambda replay=None: calls.append(("stream", replay)) or iter([[{"id": 1}]]),
+    )
+
+    ingestion.ingest_observations(None, datetime.datetime.now())
+
+    assert calls == [("stream", True)]
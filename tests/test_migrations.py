@@ -0,0 +1,59 @@
+from biolit.migrations import MIGRATIONS, run_migrations
+
+
+class FakeResult:
+    def __init__(self, row):
+        self._row = row
+
+    def first(self):
+        return self._row
+
+
+class FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.engine.statements.append(sql)
+        if sql.startswith("SELECT 1 FROM schema_migrations"):
+            return FakeResult((1,) if params["version"] in self.engine.applied else None)
+        if sql.startswith("INSERT INTO schema_migrations"):
+            self.engine.applied.add(params["version"])
+        return FakeResult(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeEngine:
+    def __init__(self, applied=()):
+        self.applied = set(applied)
+        self.statements = []
+
+    def begin(self):
+        return FakeConnection(self)
+
+
+def test_versions_croissantes_et_uniques():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+def test_applique_seulement_les_migrations_manquantes():
+    engine = FakeEngine(applied={1})
+
+    applied = run_migrations(engine)
+
+    assert applied == [version for version, _, _ in MIGRATIONS][1:]
+    assert run_migrations(engine) == []
+    assert not any("CREATE TABLE IF NOT EXISTS observations (" in s for s in engine.statements)
+
+
+def test_validee_invalide_conservee_avant_conversion():
+    sql = dict((version, sql) for version, _, sql in MIGRATIONS)[3]
+
+    assert sql.index("observations_validee_rejected") < sql.index("ALTER COLUMN validee TYPE BOOLEAN")
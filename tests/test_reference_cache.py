@@ -0,0 +1,61 @@
+import hashlib
+from io import BytesIO
+
+from biolit import reference_cache
+from biolit.reference_cache import cached_s3_path, load_reference_layer
+
+
+class FakeBody(BytesIO):
+    def iter_chunks(self, chunk_size):
+        while chunk := self.read(chunk_size):
+            yield chunk
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+
+    def head_object(self, Bucket, Key):
+        return {"ETag": f'"{hashlib.md5(self.objects[Key]).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key):
+        self.downloads += 1
+        return {"Body": FakeBody(self.objects[Key])}
+
+
+def test_telechargement_uniquement_si_etag_change(tmp_path):
+    client = FakeS3()
+    client.objects["geoloc/osm/coastlines.parquet"] = b"v1"
+
+    first = cached_s3_path(client, "bucket", "geoloc/osm/coastlines.parquet", tmp_path)
+    again = cached_s3_path(client, "bucket", "geoloc/osm/coastlines.parquet", tmp_path)
+
+    assert first == again
+    assert first.read_bytes() == b"v1"
+    assert client.downloads == 1
+
+    client.objects["geoloc/osm/coastlines.parquet"] = b"v2"
+    updated = cached_s3_path(client, "bucket", "geoloc/osm/coastlines.parquet", tmp_path)
+
+    assert updated.read_bytes() == b"v2"
+    assert client.downloads == 2
+    # L'ancienne version est supprimée
+    assert list(updated.parent.iterdir()) == [updated]
+
+
+def test_couche_memorisee_dans_le_processus(tmp_path):
+    reference_cache.clear_reference_memo()
+    client = FakeS3()
+    client.objects["communes.parquet"] = b"communes"
+    reads = []
+
+    def reader(path):
+        reads.append(path)
+        return path.read_bytes()
+
+    a = load_reference_layer(client, "bucket", "communes.parquet", reader, tmp_path)
+    b = load_reference_layer(client, "bucket", "communes.parquet", reader, tmp_path)
+
+    assert a is b
+    assert len(reads) == 1
@@ -0,0 +1,93 @@
+import pytest
+
+from biolit.run_registry import RunRecorder, count_bytes
+
+
+class FakeResult:
+    def scalar_one(self):
+        return 42
+
+
+class FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, statement, params=None):
+        self.engine.calls.append((" ".join(str(statement).split()), params))
+        return FakeResult()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = []
+
+    def begin(self):
+        return FakeConnection(self)
+
+    def updates(self, table):
+        return [params for query, params in self.calls if query.startswith(f"UPDATE {table}")]
+
+
+def test_etape_enregistre_volumes_et_octets():
+    engine = FakeEngine()
+
+    count_bytes(downloaded=10)  # hors étape : ignoré
+    with RunRecorder(engine, "run_test", options={"replay": True}) as recorder:
+        with recorder.stage("ingestion") as stats:
+            stats["rows_in"] += 3
+            stats["rows_out"] += 2
+            count_bytes(downloaded=100)
+            count_bytes(uploaded=7)
+
+    [stage] = engine.updates("pipeline_stage_runs")
+    assert stage["run_id"] == 42
+    assert stage["stage"] == "ingestion"
+    assert (stage["rows_in"], stage["rows_out"]) == (3, 2)
+    assert (stage["bytes_downloaded"], stage["bytes_uploaded"]) == (100, 7)
+    assert stage["status"] == "success"
+    assert "_peak_reset" not in stage
+    assert engine.updates("pipeline_runs") == [{"run_id": 42, "status": "success"}]
+
+
+def test_echec_etape_marque_le_run_en_echec():
+    engine = FakeEngine()
+
+    with pytest.raises(RuntimeError):
+        with RunRecorder(engine, "run_test") as recorder:
+            with recorder.stage("geoloc"):
+                raise RuntimeError("couche absente")
+
+    [stage] = engine.updates("pipeline_stage_runs")
+    assert stage["status"] == "failed"
+    assert "couche absente" in stage["error"]
+    assert engine.updates("pipeline_runs") == [{"run_id": 42, "status": "failed"}]
+
+
+def test_echec_hors_etape_marque_le_run_en_echec():
+    engine = FakeEngine()
+
+    with pytest.raises(KeyError):
+        with RunRecorder(engine, "run_test") as recorder:
+            with recorder.stage("ingestion"):
+                pass
+            raise KeyError("id_observation")
+
+    assert engine.updates("pipeline_runs") == [{"run_id": 42, "status": "failed"}]
+
+
+def test_etapes_non_executees_tracees():
+    engine = FakeEngine()
+
+    with RunRecorder(engine, "run_test") as recorder:
+        with recorder.stage("ml_crops"):
+            pass
+        recorder.skip("ml_taxonomie", "cleaning", reason="aucune observation à traiter")
+
+    skipped = [p for q, p in engine.calls if "'skipped'" in q]
+    assert [(p["stage"], p["stage_order"]) for p in skipped] == [("ml_taxonomie", 2), ("cleaning", 3)]
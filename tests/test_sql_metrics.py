@@ -0,0 +1,33 @@
+from sqlalchemy import create_engine, text
+
+from biolit import sql_metrics
+from biolit.sql_metrics import fingerprint, get_sql_stats, instrument_engine, set_sql_stage
+
+
+def test_fingerprint_sans_valeurs_litterales():
+    a = fingerprint("SELECT * FROM obs WHERE id = 12 AND nom = 'x''y'  AND p IN (1, 2, 3)")
+    b = fingerprint("SELECT * FROM obs\n WHERE id = %(id)s AND nom = 'z' AND p IN (4)")
+
+    assert a == b == "SELECT * FROM obs WHERE id = ? AND nom = ? AND p IN (?)"
+    assert fingerprint("SELECT validee::text") == "SELECT validee::text"
+    # Suffixe aléatoire des tables temporaires : une seule empreinte
+    assert fingerprint("COPY _staging_ml_crops_3fa9c1d2 (id) FROM STDIN") == fingerprint(
+        "COPY _staging_ml_crops_0b12ffe4 (id) FROM STDIN"
+    )
+
+
+def test_statistiques_par_etape(monkeypatch):
+    monkeypatch.setattr(sql_metrics, "SQL_METRICS_ENABLED", True)
+    sql_metrics.reset_sql_stats()
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    set_sql_stage("geoloc")
+    with engine.begin() as conn:
+        for i in range(3):
+            conn.execute(text(f"SELECT {i}"))
+
+    stats = [s for s in get_sql_stats() if s["fingerprint"] == "SELECT ?"]
+    assert len(stats) == 1
+    assert stats[0]["stage"] == "geoloc"
+    assert stats[0]["calls"] == 3
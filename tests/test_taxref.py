@@ -0,0 +1,60 @@
+import polars as pl
+
+from biolit import taxref
+
+
+def test_tax_lookup_depuis_la_base_garde_les_noms_du_modele(monkeypatch):
+    requested = {}
+
+    def fake_read(query, engine, params=None):
+        requested.update(params)
+        return pl.DataFrame(
+            {
+                "species_name": ["patella vulgata"],
+                "regne": ["Animalia"],
+                "phylum": ["Mollusca"],
+                "classe": ["Gastropoda"],
+                "ordre": [None],
+                "famille": ["Patellidae"],
+            }
+        )
+
+    monkeypatch.setattr(taxref, "read_database_arrow", fake_read)
+
+    lookup = taxref.load_tax_lookup_from_db(None, ["Patella  vulgata", "Inconnue sp"])
+
+    assert sorted(requested["names"]) == ["inconnue sp", "patella vulgata"]
+    assert lookup == {
+        "Patella  vulgata": {
+            "regne": "Animalia",
+            "phylum": "Mollusca",
+            "classe": "Gastropoda",
+            "ordre": None,
+            "famille": "Patellidae",
+        }
+    }
+
+
+def test_load_taxref_dedoublonne_les_noms_normalises(monkeypatch, tmp_path):
+    """Deux noms identiques après normalisation : le nom retenu (cd_nom == cd_ref) est gardé"""
+    fn = tmp_path / "taxref.parquet"
+    pl.DataFrame(
+        {
+            "species_id": [10, 20, 30],
+            "cd_ref": [20, 20, 30],
+            "species_name": ["patella  vulgata", "Patella vulgata", "carcinus maenas"],
+            **{rank: ["Animalia"] * 3 for rank in taxref.TAXREF_HIERARCHY},
+        }
+    ).write_parquet(fn)
+    loaded = {}
+
+    def fake_copy(df, table, engine, **kwargs):
+        loaded["df"] = df
+        return len(df)
+
+    monkeypatch.setattr(taxref, "copy_into_table", fake_copy)
+
+    taxref.load_taxref_to_db(None, fn)
+
+    rows = loaded["df"].sort("cd_nom").select("cd_nom", "species_name").rows()
+    assert rows == [(20, "patella vulgata"), (30, "carcinus maenas")]
@@ -0,0 +1,205 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from biolit.migrations import run_migrations
+from biolit.work_queue import (
+    complete_observations,
+    fail_observations,
+    lease_observations,
+    settle_observations,
+)
+
+
+class FakeResult:
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+
+
+class FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, statement, params=None):
+        self.engine.calls.append((str(statement), params))
+        return FakeResult(len(params.get("ids", [])))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = []
+
+    def begin(self):
+        return FakeConnection(self)
+
+
+def test_lot_vide_aucun_appel():
+    engine = FakeEngine()
+
+    complete_observations(engine, [])
+    fail_observations(engine, [], "erreur")
+
+    assert engine.calls == []
+
+
+def test_echec_repasse_en_pending_ou_failed():
+    engine = FakeEngine()
+
+    fail_observations(engine, [1, 2], "timeout S3", max_attempts=5, worker_id="a")
+
+    query, params = engine.calls[0]
+    assert "WHEN attempts >= :max_attempts THEN 'failed'" in query
+    assert "AND leased_by = :worker_id" in query
+    assert params == {"ids": [1, 2], "error": "timeout S3", "max_attempts": 5, "worker_id": "a"}
+
+
+def test_lot_cloture_seulement_pour_les_observations_traitees():
+    engine = FakeEngine()
+
+    # 2 : photo non téléchargée, ni crop ni no crop
+    settle_observations(engine, [1, 2, 3], done_ids={"1", 3}, error="photo non téléchargée", worker_id="a")
+
+    (done_query, done_params), (fail_query, fail_params) = engine.calls
+    assert "status = 'done'" in done_query
+    assert done_params["ids"] == [1, 3]
+    assert "'pending'" in fail_query
+    assert fail_params["ids"] == [2]
+
+
+# -------------------------
+# Comportement sur une vraie base (TEST_POSTGRES_URL)
+# -------------------------
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.fixture
+def pg_engine():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL non défini")
+
+    # Schéma isolé par test, supprimé à la fin
+    schema = f"test_wq_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_POSTGRES_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+
+    engine = create_engine(
+        TEST_POSTGRES_URL,
+        connect_args={"options": f"-c search_path={schema}"},
+    )
+    run_migrations(engine)
+    yield engine
+
+    engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    admin.dispose()
+
+
+def _queue(engine, ids, photo_status="pending"):
+    with engine.begin() as conn:
+        for id_observation in ids:
+            conn.execute(text("""
+                INSERT INTO observations (id_observation, validee, latitude, longitude)
+                VALUES (:id, 'false', 48.0, -4.0)
+            """), {"id": id_observation})
+            conn.execute(text("""
+                INSERT INTO observation_photos (id_observation, photo_index, url, status)
+                VALUES (:id, 0, 'https://biolit.fr/' || :id || '.jpg', :status)
+            """), {"id": id_observation, "status": photo_status})
+            conn.execute(
+                text("INSERT INTO ml_work_queue (id_observation) VALUES (:id)"),
+                {"id": id_observation},
+            )
+
+
+def _queue_rows(engine):
+    with engine.begin() as conn:
+        rows = conn.execute(text("""
+            SELECT id_observation, status, attempts, last_error
+            FROM ml_work_queue ORDER BY id_observation
+        """)).all()
+    return {row.id_observation: row for row in rows}
+
+
+def test_pg_lignes_verrouillees_ignorees(pg_engine):
+    _queue(pg_engine, range(1, 7))
+
+    # Un autre worker tient les lignes 1 à 3 dans sa transaction
+    with pg_engine.connect() as other:
+        other.execute(text(
+            "SELECT 1 FROM ml_work_queue WHERE id_observation <= 3 FOR UPDATE"
+        ))
+        df = lease_observations(pg_engine, batch_size=10, worker_id="b")
+        other.rollback()
+
+    assert sorted(df["id_observation"].to_list()) == [4, 5, 6]
+    assert lease_observations(pg_engine, batch_size=10, worker_id="c")["id_observation"].to_list() == [1, 2, 3]
+
+
+def test_pg_bail_expire_repris(pg_engine):
+    _queue(pg_engine, [1])
+
+    assert len(lease_observations(pg_engine, worker_id="a")) == 1
+    assert len(lease_observations(pg_engine, worker_id="b")) == 0
+
+    with pg_engine.begin() as conn:
+        conn.execute(text("UPDATE ml_work_queue SET lease_expires_at = now() - interval '1 second'"))
+
+    assert lease_observations(pg_engine, worker_id="b", max_attempts=3)["id_observation"].to_list() == [1]
+    assert _queue_rows(pg_engine)[1].attempts == 2
+
+
+def test_pg_bail_expire_tentatives_epuisees(pg_engine):
+    _queue(pg_engine, [1])
+
+    assert len(lease_observations(pg_engine, worker_id="a", max_attempts=1)) == 1
+    with pg_engine.begin() as conn:
+        conn.execute(text("UPDATE ml_work_queue SET lease_expires_at = now() - interval '1 second'"))
+
+    assert len(lease_observations(pg_engine, worker_id="b", max_attempts=1)) == 0
+    row = _queue_rows(pg_engine)[1]
+    assert row.status == "failed"
+    assert "tentatives" in row.last_error
+
+
+def test_pg_observation_sans_photo_exploitable(pg_engine):
+    _queue(pg_engine, [1])
+    _queue(pg_engine, [2], photo_status="failed")
+
+    df = lease_observations(pg_engine, batch_size=10, worker_id="a")
+
+    assert df["id_observation"].to_list() == [1]
+    rows = _queue_rows(pg_engine)
+    assert (rows[1].status, rows[2].status) == ("leased", "failed")
+    assert rows[2].last_error == "aucune photo exploitable"
+
+
+def test_pg_bail_repris_non_modifie_par_l_ancien_worker(pg_engine):
+    _queue(pg_engine, [1, 2])
+
+    lease_observations(pg_engine, batch_size=10, worker_id="a")
+    with pg_engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE ml_work_queue SET lease_expires_at = now() - interval '1 second' WHERE id_observation = 1"
+        ))
+    assert lease_observations(pg_engine, worker_id="b")["id_observation"].to_list() == [1]
+
+    # a a perdu 1 : seule 2 est marquée traitée, et a ne peut pas libérer le bail de b
+    complete_observations(pg_engine, [1, 2], worker_id="a")
+    fail_observations(pg_engine, [1], "timeout", worker_id="a")
+
+    rows = _queue_rows(pg_engine)
+    assert (rows[1].status, rows[2].status) == ("leased", "done")
+
+    complete_observations(pg_engine, [1], worker_id="b")
+    fail_observations(pg_engine, [1], "trop tard", worker_id="b")
+    assert _queue_rows(pg_engine)[1].status == "done"